@@ -1,8 +1,21 @@
 import numpy as np
+from scipy.linalg import cho_solve, solve_discrete_are, solve_triangular
+
+
+def _matrix_sqrt(A):
+    # Any B with B B^T = A (from the eigendecomposition, so a singular PSD matrix such as a rank-deficient Q works too)
+    eigenvalues, eigenvectors = np.linalg.eigh(A)
+
+    return eigenvectors * np.sqrt(np.maximum(eigenvalues, 0.0))
+
+
+def _triangularize(B):
+    # Lower-triangular L with L L^T = B B^T, from a QR decomposition of B^T (B B^T = R^T Q^T Q R = R^T R)
+    return np.linalg.qr(B.T, mode='r').T
 
 
 class KalmanFilter:
-    def __init__(self, F, P, Q, H, R):
+    def __init__(self, F, P, Q, H, R, steady_state=None, tol=1e-9, covariance_form='standard'):
         # Given values
         self._F = F
         self._P = P
@@ -17,30 +30,279 @@ class KalmanFilter:
 
         self._K = np.zeros(shape=(self._n_vars, self._n_vars))
 
+        # Lower-triangular square root of the innovation covariance from the last gain calculation
+        self._S_sqrt = None
+
+        # How the corrected covariance is computed: 'standard' is the simple (I - K H) P; 'joseph' is the Joseph form
+        # (I - K H) P (I - K H)^T + K R K^T, which stays symmetric and positive semi-definite under rounding; 'sqrt'
+        # propagates a lower-triangular square root L (P = L L^T) through QR decompositions, so P can never lose
+        # definiteness and the numbers involved have half the condition number
+        if covariance_form not in ['standard', 'joseph', 'sqrt']:
+            raise Exception('covariance_form must be \'standard\', \'joseph\' or \'sqrt\'')
+
+        self._covariance_form = covariance_form
+
+        if covariance_form == 'sqrt':
+            self._L = np.linalg.cholesky(self._P)
+            self._Q_sqrt = _matrix_sqrt(self._Q)
+            self._R_sqrt = _matrix_sqrt(self._R)
+            self._corrected_L = None
+
+        # For time-invariant F, Q, H and R the gain converges to a constant. steady_state='solve' computes it up front
+        # from the discrete algebraic Riccati equation; steady_state='detect' runs the full filter until the gain
+        # changes by less than tol between steps. Either way, once it is known each step only does the state update
+        # x = A x + K z (with A = (I - K H) F), and P stays at its steady-state value
+        if steady_state not in [None, 'solve', 'detect']:
+            raise Exception('steady_state must be None, \'solve\' or \'detect\'')
+
+        self._steady_state = steady_state
+        self._tol = tol
+        self._A = None
+
+        if steady_state == 'solve':
+            self._solve_steady_state_gain()
+
+    @property
+    def converged(self):
+        # Whether the filter is running on a (cached) steady-state gain
+        return self._A is not None
+
+    def _solve_steady_state_gain(self):
+        # The predicted covariance solves the filtering DARE, i.e. the control DARE for (F^T, H^T)
+        P_pred = solve_discrete_are(self._F.T, self._H.T, self._Q, self._R)
+        HP = self._H.dot(P_pred)
+        self._S_sqrt = np.linalg.cholesky(HP.dot(self._H.T) + self._R)
+        self._K = cho_solve((self._S_sqrt, True), HP).T
+        self._P = (np.eye(self._n_vars) - self._K.dot(self._H)).dot(P_pred)
+        self._cache_steady_state()
+
+    def _cache_steady_state(self):
+        self._A = (np.eye(self._n_vars) - self._K.dot(self._H)).dot(self._F)
+
     def _make_prediction(self):
         # Update the state (self._x) and covariance matrix (self._P)
         self._x = self._F.dot(self._x)
-        self._P = self._F.dot(self._P).dot(self._F.T) + self._Q
+
+        if self._covariance_form == 'sqrt':
+            # [F L, Q^1/2] [F L, Q^1/2]^T = F P F^T + Q
+            self._L = _triangularize(np.hstack([self._F.dot(self._L), self._Q_sqrt]))
+            self._P = self._L.dot(self._L.T)
+
+        else:
+            self._P = self._F.dot(self._P).dot(self._F.T) + self._Q
 
     def _calculate_optimal_gain(self):
         # Calculate the Kalman gain
-        # Put the inverse stuff on its own line to make the code a little neater
-        inv_stuff = np.linalg.inv(self._H.dot(self._P).dot(self._H.T) + self._R)
+        if self._covariance_form == 'sqrt':
+            # Triangularizing the pre-array [[R^1/2, H L], [0, L]] gives [[S^1/2, 0], [K S^1/2, L+]], where S is the
+            # innovation covariance and L+ the square root of the corrected covariance
+            n_measured = self._H.shape[0]
+            pre_array = np.block([[self._R_sqrt, self._H.dot(self._L)],
+                                  [np.zeros(shape=(self._n_vars, n_measured)), self._L]])
+            post_array = _triangularize(pre_array)
+            self._S_sqrt = post_array[:n_measured, :n_measured]
+
+            self._K = solve_triangular(self._S_sqrt, post_array[n_measured:, :n_measured].T, lower=True, trans='T').T
+            self._corrected_L = post_array[n_measured:, n_measured:]
 
-        self._K = self._P.dot(self._H.T).dot(inv_stuff)
+        else:
+            # K^T = S^-1 H P (P and the innovation covariance S are symmetric), solved with a Cholesky factor of S
+            # instead of inverting it
+            HP = self._H.dot(self._P)
+            self._S_sqrt = np.linalg.cholesky(HP.dot(self._H.T) + self._R)
+
+            self._K = cho_solve((self._S_sqrt, True), HP).T
 
     def _apply_correction(self, measured_vals):
         # Use the proper equations to update our predictions using the measured values
         self._x = self._x + self._K.dot(measured_vals - self._H.dot(self._x))
-        sub = self._K.dot(self._H)
-        self._P = (np.eye(sub.shape[0]) - sub).dot(self._P)
+
+        if self._covariance_form == 'sqrt':
+            self._L = self._corrected_L
+            self._P = self._L.dot(self._L.T)
+
+        else:
+            sub = np.eye(self._n_vars) - self._K.dot(self._H)
+            self._P = sub.dot(self._P)
+
+            if self._covariance_form == 'joseph':
+                self._P = self._P.dot(sub.T) + self._K.dot(self._R).dot(self._K.T)
 
         # Return the final state vector (can pull the needed predictions from indexing into it)
         return self._x
 
     def make_corrected_prediction(self, measured_vals):
+        if self._A is not None:
+            # Steady state: prediction and correction in two matrix-vector products, no covariance update
+            self._x = self._A.dot(self._x) + self._K.dot(measured_vals)
+
+            return self._x
+
         self._make_prediction()  # Step 1 - make a new prediction
+
+        prev_K = self._K
         self._calculate_optimal_gain()  # Step 2 - Update the optimal gain value
+
+        if self._steady_state == 'detect' and prev_K.shape == self._K.shape and \
+                np.max(np.abs(self._K - prev_K)) < self._tol:
+            self._cache_steady_state()
+
         final_prediction = self._apply_correction(measured_vals)  # Step 3 - Use measured values to make a correction
 
         return final_prediction  # Return the final/corrected prediction
+
+    def _innovation_log_density(self, innovation):
+        # Log-density of an innovation under N(0, S), from the square root of S (S = C C^T, so the quadratic form is
+        # |C^-1 v|^2 and log det S = 2 sum log |diag C|)
+        whitened = solve_triangular(self._S_sqrt, innovation, lower=True)
+
+        return -0.5 * (len(innovation) * np.log(2 * np.pi) + whitened.dot(whitened)) - \
+            np.sum(np.log(np.abs(np.diag(self._S_sqrt))))
+
+    def filter_sequence(self, observations):
+        # Run the filter over a whole (T, m) array of measurements (a row with a NaN means no measurement at that step:
+        # prediction only). Returns the (T, n) corrected states, the (T, n, n) covariances, the (T, m) innovations
+        # (NaN where there was no measurement) and the total log-likelihood of the measurements
+        observations = np.asarray(observations, dtype=float)
+        n_steps, n_measured = observations.shape
+
+        states = np.empty(shape=(n_steps, self._n_vars))
+        covariances = np.empty(shape=(n_steps, self._n_vars, self._n_vars))
+        innovations = np.full(shape=(n_steps, n_measured), fill_value=np.nan)
+        log_likelihood = 0.0
+
+        for t, measured_vals in enumerate(observations):
+            if np.isnan(measured_vals).any():
+                if self.converged:
+                    self._x = self._F.dot(self._x)
+
+                else:
+                    self._make_prediction()
+
+            else:
+                measured_vals = measured_vals.reshape(-1, 1)
+                innovation = (measured_vals - self._H.dot(self._F.dot(self._x)))[:, 0]
+
+                self.make_corrected_prediction(measured_vals)
+
+                innovations[t] = innovation
+                log_likelihood += self._innovation_log_density(innovation)
+
+            states[t] = self._x[:, 0]
+            covariances[t] = self._P
+
+        return states, covariances, innovations, log_likelihood
+
+    def rts_smooth(self, states, covariances):
+        # Rauch-Tung-Striebel smoother over the (T, n) states and (T, n, n) covariances from filter_sequence: a
+        # backward pass that conditions every step on all of the measurements. Returns the smoothed states and
+        # covariances
+        smoothed_states = np.array(states, dtype=float)
+        smoothed_covariances = np.array(covariances, dtype=float)
+
+        for t in range(len(states) - 2, -1, -1):
+            FP = self._F.dot(covariances[t])
+            predicted_covariance = FP.dot(self._F.T) + self._Q
+
+            # Smoother gain C = P F^T P_pred^-1, solved for as C^T = P_pred^-1 F P
+            C = cho_solve((np.linalg.cholesky(predicted_covariance), True), FP).T
+
+            smoothed_states[t] += C.dot(smoothed_states[t + 1] - self._F.dot(states[t]))
+            smoothed_covariances[t] += C.dot(smoothed_covariances[t + 1] - predicted_covariance).dot(C.T)
+
+        return smoothed_states, smoothed_covariances
+
+
+class BatchKalmanFilter:
+    # Many independent tracks filtered together: states are an (N, n, 1) stack and covariances an (N, n, n) stack, so
+    # each step is a few stacked matmul / solve calls instead of one KalmanFilter object per track. F, Q, H and R can
+    # be shared (2-D) or given per track (stacked along a leading N axis); P can be either too
+    def __init__(self, F, P, Q, H, R, n_tracks):
+        # Given values
+        self._F = np.asarray(F, dtype=float)
+        self._Q = np.asarray(Q, dtype=float)
+        self._H = np.asarray(H, dtype=float)
+        self._R = np.asarray(R, dtype=float)
+
+        # Initialize the other values we need
+        self._n_tracks = n_tracks
+        self._n_vars = self._F.shape[-1]
+
+        self._P = np.array(np.broadcast_to(P, (n_tracks, self._n_vars, self._n_vars)), dtype=float)
+
+        self._x = np.zeros(shape=(n_tracks, self._n_vars, 1))
+
+        # Running marginal log-likelihood of each track's measurements (the sum of its innovation log-densities)
+        self.log_likelihood = np.zeros(shape=n_tracks)
+
+    def _select(self, matrix, tracks):
+        # The rows of a per-track parameter stack for the given tracks (shared matrices apply to every track as is)
+        return matrix[tracks] if matrix.ndim == 3 else matrix
+
+    def _make_prediction(self):
+        self._x = self._F @ self._x
+        FP = self._F @ self._P
+
+        if self._F.ndim == 2:
+            # Shared F: (F P) F^T as one 2-D matmul over the stacked rows, much faster than a broadcast stacked matmul
+            self._P = (FP.reshape(-1, self._n_vars) @ self._F.T).reshape(FP.shape) + self._Q
+
+        else:
+            self._P = FP @ np.swapaxes(self._F, -1, -2) + self._Q
+
+    def _apply_correction(self, measured_vals, tracks):
+        # Gain and correction for the tracks that have a measurement; K^T = S^-1 H P is solved for instead of
+        # inverting the innovation covariance S (both S and P are symmetric)
+        H, R = self._select(self._H, tracks), self._select(self._R, tracks)
+        x, P = self._x[tracks], self._P[tracks]
+        HP = H @ P
+        S = HP @ np.swapaxes(H, -1, -2) + R
+        innovation = measured_vals[tracks] - H @ x
+
+        # One solve gives both S^-1 H P (for the gain) and S^-1 v (for the innovation log-density)
+        solved = np.linalg.solve(S, np.concatenate([HP, innovation], axis=-1))
+        K = np.swapaxes(solved[:, :, :self._n_vars], -1, -2)
+
+        self._x[tracks] = x + K @ innovation
+        self._P[tracks] = P - K @ HP
+
+        log_det = np.linalg.slogdet(S)[1]
+        quadratic_form = np.sum(innovation * solved[:, :, self._n_vars:], axis=(1, 2))
+        self.log_likelihood[tracks] -= 0.5 * (innovation.shape[1] * np.log(2 * np.pi) + log_det + quadratic_form)
+
+    def make_corrected_prediction(self, measured_vals, mask=None):
+        # measured_vals is (N, m, 1) or (N, m); mask is an (N,) boolean array that is True for the tracks that have a
+        # measurement this step (by default, every track without a NaN in its measurement). Tracks without one only
+        # get the prediction step
+        measured_vals = np.asarray(measured_vals, dtype=float).reshape(self._n_tracks, -1, 1)
+
+        if mask is None:
+            mask = ~np.isnan(measured_vals).any(axis=(1, 2))
+
+        self._make_prediction()
+
+        tracks = np.flatnonzero(mask)
+
+        if len(tracks) == self._n_tracks:
+            # Every track was measured: work on the whole stacks instead of fancy-indexed copies
+            self._apply_correction(measured_vals, slice(None))
+
+        elif len(tracks) > 0:
+            self._apply_correction(measured_vals, tracks)
+
+        return self._x
+
+
+def evaluate_log_likelihoods(F, P, Q, H, R, observations):
+    # Marginal log-likelihood of one (T, m) measurement sequence under many candidate noise settings at once, e.g. a
+    # grid search over Q and R: Q and/or R are stacked along a leading parameter axis (the other can be shared), and
+    # every setting is filtered as its own track of a BatchKalmanFilter. Rows with a NaN are prediction-only steps.
+    # Returns one log-likelihood per setting
+    Q, R = np.asarray(Q, dtype=float), np.asarray(R, dtype=float)
+    n_settings = max(len(matrix) if matrix.ndim == 3 else 1 for matrix in [Q, R])
+    batch_kf = BatchKalmanFilter(F, P, Q, H, R, n_settings)
+
+    for measured_vals in np.asarray(observations, dtype=float):
+        batch_kf.make_corrected_prediction(np.broadcast_to(measured_vals, (n_settings, len(measured_vals))))
+
+    return batch_kf.log_likelihood
@@ -1,5 +1,6 @@
 import numpy as np
-from kalman_filter import KalmanFilter
+import time
+from kalman_filter import BatchKalmanFilter, evaluate_log_likelihoods, KalmanFilter
 
 F = np.array([(1, 0, 1, 0, 0, 0),
               (0, 1, 0, 1, 0, 0),
@@ -92,3 +93,123 @@ preds_close_to_given_preds = np.allclose(given_predictions, np.array(predictions
 
 print(f'\n----------------------------------------------------------------------\nOur predictions are extremely close '
       f'to the given predictions (should be "True" if our implementation is correct: {preds_close_to_given_preds}')
+
+# Batched version: many tracks at once, some of them with missing measurements (NaN) at some steps
+n_tracks = 1000
+rng = np.random.default_rng(0)
+track_observations = observations[None, :, :] + rng.normal(0, 0.5, size=(n_tracks,) + observations.shape)
+track_observations[0] = observations
+track_observations[rng.random(track_observations.shape[:2]) < 0.2] = np.nan
+
+batch_kf = BatchKalmanFilter(F, P, Q, H, R, n_tracks)
+batch_predictions = np.array([batch_kf.make_corrected_prediction(track_observations[:, t])[:, :2, 0].copy()
+                              for t in range(len(observations))])
+
+# Every track should match a KalmanFilter run on its own, where a missing measurement means prediction only
+tracks_match = True
+
+for track in [0, 1, n_tracks - 1]:
+    single_kf = KalmanFilter(F, P, Q, H, R)
+
+    for t, observation in enumerate(track_observations[track]):
+        if np.isnan(observation).any():
+            single_kf._make_prediction()
+            single_prediction = single_kf._x
+
+        else:
+            single_prediction = single_kf.make_corrected_prediction(observation.reshape(-1, 1))
+
+        tracks_match = tracks_match and np.allclose(single_prediction[:2, 0], batch_predictions[t, track])
+
+print(f'Batched tracks match individual filters (should be "True"): {tracks_match}')
+
+# Steady-state gain: after a long run the full filter, the one that detects convergence online and the one that solves
+# the Riccati equation up front should all give the same estimates, the last two with only state updates per step
+long_observations = np.cumsum(rng.normal(0, 1, size=(2000, 2)), axis=0)
+steady_state_predictions = []
+
+for steady_state in [None, 'detect', 'solve']:
+    steady_state_kf = KalmanFilter(F, P, Q, H, R, steady_state=steady_state)
+    start_time = time.time()
+
+    for observation in long_observations:
+        corrected_prediction = steady_state_kf.make_corrected_prediction(observation.reshape(-1, 1))
+
+    print(f'steady_state = {steady_state}: {time.time() - start_time:.3f}s for {len(long_observations)} steps, '
+          f'converged = {steady_state_kf.converged}')
+    steady_state_predictions.append(corrected_prediction)
+
+steady_state_match = all(np.allclose(steady_state_predictions[0], prediction)
+                         for prediction in steady_state_predictions)
+
+print(f'Steady-state filters match the full filter (should be "True"): {steady_state_match}')
+
+# Covariance forms: all three give the given predictions on the short sequence. On a badly-scaled problem (huge
+# initial uncertainty, nearly exact measurements) the simple (I - K H) P update loses symmetry and definiteness,
+# while the Joseph and square-root forms do not
+forms_match = True
+
+for covariance_form in ['standard', 'joseph', 'sqrt']:
+    form_kf = KalmanFilter(F, P, Q, H, R, covariance_form=covariance_form)
+    form_predictions = [form_kf.make_corrected_prediction(observation.reshape(-1, 1))[:2, 0].copy()
+                        for observation in observations]
+    forms_match = forms_match and np.allclose(given_predictions, np.array(form_predictions))
+
+    form_kf = KalmanFilter(F, P * 1e6, Q * 1e-6, H, R * 1e-8, covariance_form=covariance_form)
+    max_asymmetry, min_eigenvalue = 0.0, np.inf
+
+    for observation in long_observations:
+        form_kf.make_corrected_prediction(observation.reshape(-1, 1))
+        max_asymmetry = max(max_asymmetry, np.max(np.abs(form_kf._P - form_kf._P.T)))
+        min_eigenvalue = min(min_eigenvalue, np.linalg.eigvalsh(form_kf._P).min())
+
+    print(f'covariance_form = {covariance_form}: maximum asymmetry of P = {max_asymmetry:.2e}, minimum eigenvalue of '
+          f'P = {min_eigenvalue:.2e}')
+
+print(f'All covariance forms match the given predictions (should be "True"): {forms_match}')
+
+# Bulk filtering and smoothing: filter_sequence should give the same states as the step-by-step loop, and on a simulated
+# constant-acceleration track the RTS-smoothed positions should be closer to the truth than the filtered ones
+states, covariances, innovations, log_likelihood = KalmanFilter(F, P, Q, H, R).filter_sequence(observations)
+
+print(f'filter_sequence matches the given predictions (should be "True"): '
+      f'{np.allclose(given_predictions, states[:, :2])}, log-likelihood = {log_likelihood:.3f}')
+
+true_states = np.zeros(shape=(500, 6))
+
+for t in range(1, len(true_states)):
+    true_states[t] = F.dot(true_states[t - 1]) + rng.normal(0, 0.1, size=6)
+
+simulated_observations = true_states[:, :2] + rng.normal(0, 2 ** 0.5, size=(len(true_states), 2))
+smoothing_kf = KalmanFilter(F, P, Q * 0.01, H, R)
+states, covariances, innovations, log_likelihood = smoothing_kf.filter_sequence(simulated_observations)
+smoothed_states, smoothed_covariances = smoothing_kf.rts_smooth(states, covariances)
+filtered_error = np.sqrt(np.mean((states[:, :2] - true_states[:, :2]) ** 2))
+smoothed_error = np.sqrt(np.mean((smoothed_states[:, :2] - true_states[:, :2]) ** 2))
+
+print(f'Filtered position RMSE = {filtered_error:.3f}, smoothed position RMSE = {smoothed_error:.3f} (smoothed should '
+      f'be lower: {smoothed_error < filtered_error})')
+
+# Noise tuning: the log-likelihood of the simulated track over a grid of Q and R scales, all evaluated in one batched
+# pass. The values should match single filter_sequence runs (checked on every 10th setting), and the best setting
+# should be near the true one (Q = 0.01 I, R = 2 I)
+
+q_scales, r_scales = np.meshgrid(np.logspace(-4, 0, 21), np.logspace(-1, 1, 21), indexing='ij')
+Q_grid = q_scales.reshape(-1, 1, 1) * np.eye(6)
+R_grid = r_scales.reshape(-1, 1, 1) * np.eye(2)
+
+start_time = time.time()
+log_likelihoods = evaluate_log_likelihoods(F, P, Q_grid, H, R_grid, simulated_observations)
+batched_time = time.time() - start_time
+
+start_time = time.time()
+checked_settings = range(0, len(Q_grid), 10)
+serial_log_likelihoods = [KalmanFilter(F, P, Q_grid[i], H, R_grid[i]).filter_sequence(simulated_observations)[3]
+                          for i in checked_settings]
+serial_time = (time.time() - start_time) / len(checked_settings)
+
+best = np.argmax(log_likelihoods)
+
+print(f'{len(Q_grid)} (Q, R) settings: batched {batched_time:.2f}s, serial {serial_time:.3f}s per setting, results '
+      f'match (should be "True"): {np.allclose(log_likelihoods[checked_settings], serial_log_likelihoods)}')
+print(f'Best setting: Q = {q_scales.flat[best]:.4f} I, R = {r_scales.flat[best]:.3f} I')
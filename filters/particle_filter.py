@@ -0,0 +1,73 @@
+import numpy as np
+from scipy.special import logsumexp
+
+
+class ParticleFilter:
+    # Bootstrap particle filter over an (N, d) array of particles. transition(particles, rng) returns the moved (N, d)
+    # particles, and log_likelihood(particles, observation) the (N,) log-density of an observation under each particle.
+    # Weights are kept as normalized log-weights, so tiny likelihoods (many observations, sharp sensors) never
+    # underflow to an all-zero weight vector
+    def __init__(self, transition, log_likelihood, particles, ess_threshold=1.0, seed=None):
+        self._transition = transition
+        self._log_likelihood = log_likelihood
+        self._rng = np.random.default_rng(seed)
+
+        self.particles = np.array(particles, dtype=float)
+
+        if self.particles.ndim == 1:
+            self.particles = self.particles.reshape(-1, 1)
+
+        self._n_particles = len(self.particles)
+        self.log_weights = np.full(shape=self._n_particles, fill_value=-np.log(self._n_particles))
+
+        # Resample when the effective sample size drops below ess_threshold * N (1.0 resamples after every step, 0.0
+        # never does)
+        self._ess_threshold = ess_threshold
+
+        # Running estimate of the log-likelihood of the observations seen so far
+        self.log_likelihood = 0.0
+
+    def _resample(self, weights):
+        # Systematic resampling: one uniform draw u and N evenly spaced positions (u + k) / N in the cumulative weights.
+        # Particle i is copied once for every position that falls in its slice of the cumulative weights, so the
+        # indices come from the per-particle counts with np.repeat, in O(N) and without a search
+        u = self._rng.random()
+        counts = np.clip(np.floor(np.cumsum(weights) * self._n_particles - u).astype(np.int64) + 1, 0,
+                         self._n_particles)
+        counts[-1] = self._n_particles
+
+        self.particles = self.particles[np.repeat(np.arange(self._n_particles), np.diff(counts, prepend=0))]
+        self.log_weights.fill(-np.log(self._n_particles))
+
+    def step(self, observation):
+        # Move the particles, weight them by the observation, and resample if needed. Returns the weighted mean and
+        # variance of the particles (each a (d,) array) and the effective sample size, all before resampling
+        self.particles = self._transition(self.particles, self._rng)
+
+        log_weights = self.log_weights + self._log_likelihood(self.particles, observation)
+        log_normalizer = logsumexp(log_weights)
+        self.log_likelihood += log_normalizer
+        self.log_weights = log_weights - log_normalizer
+
+        weights = np.exp(self.log_weights)
+        mean = weights.dot(self.particles)
+        variance = weights.dot((self.particles - mean) ** 2)
+        ess = 1 / weights.dot(weights)
+
+        if ess < self._ess_threshold * self._n_particles:
+            self._resample(weights)
+
+        return mean, variance, ess
+
+    def run(self, observations):
+        # step over a whole sequence of observations; returns the (T, d) means and variances and the (T,) effective
+        # sample sizes
+        n_steps, n_dims = len(observations), self.particles.shape[1]
+        means = np.empty(shape=(n_steps, n_dims))
+        variances = np.empty(shape=(n_steps, n_dims))
+        ess = np.empty(shape=n_steps)
+
+        for t, observation in enumerate(observations):
+            means[t], variances[t], ess[t] = self.step(observation)
+
+        return means, variances, ess
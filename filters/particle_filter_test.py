@@ -0,0 +1,79 @@
+import numpy as np
+import time
+from particle_filter import ParticleFilter
+
+# A robot starting near the origin moves about 5 units per step in a direction of about 36 degrees, and measures its
+# distance to two beacons (with unit-variance noise)
+BEACONS = np.array([(-100, 100),
+                    (150, 90)])
+
+
+def transition(particles, rng):
+    theta = rng.uniform(np.pi / 5 - np.pi / 36, np.pi / 5 + np.pi / 36, len(particles))
+    d = rng.normal(5, 1, len(particles))
+
+    return particles + d[:, None] * np.column_stack([np.cos(theta), np.sin(theta)])
+
+
+def log_likelihood(particles, observation):
+    # Distances from every particle to each beacon, scored against the observed distances
+    log_density = np.full(shape=len(particles), fill_value=-np.log(2 * np.pi))
+
+    for beacon, observed_distance in zip(BEACONS, observation):
+        log_density -= 0.5 * np.square(observed_distance - np.hypot(particles[:, 0] - beacon[0],
+                                                                    particles[:, 1] - beacon[1]))
+
+    return log_density
+
+
+observations = np.array([(143.69345025, 166.824055471),
+                         (145.664295064, 164.501752829),
+                         (144.591594567, 157.474359865),
+                         (146.50065381, 152.469730508),
+                         (148.997244853, 145.093420417),
+                         (148.636960211, 142.497183979),
+                         (152.357648068, 135.919999894),
+                         (152.367509975, 133.667699492),
+                         (155.708667162, 126.696182098),
+                         (159.03213926, 122.950895656),
+                         (159.068406295, 116.296800819),
+                         (164.570101706, 111.140841502),
+                         (164.408405506, 107.94706493),
+                         (170.250724817, 101.808614448),
+                         (171.489734721, 96.7475872389),
+                         (173.631500934, 91.6295157657),
+                         (178.451332801, 85.3706909502),
+                         (182.747629193, 80.8448050049),
+                         (183.013423256, 78.7848074168),
+                         (185.554608457, 74.7064611403)])
+
+# A few independent runs with 100 particles; they should roughly agree on the path
+final_means = []
+
+for run in range(4):
+    rng = np.random.default_rng(run)
+    pf = ParticleFilter(transition, log_likelihood, rng.normal(0, 1, size=(100, 2)), seed=run)
+    means, variances, ess = pf.run(observations)
+    final_means.append(means[-1])
+
+    print(f'Run #{run + 1}\nx mean & y mean & x variance & y variance')
+
+    for mean, variance in zip(means, variances):
+        print(f'{mean[0]:.3f} & {mean[1]:.3f} & {variance[0]:.3f} & {variance[1]:.3f}')
+
+    print(f'Log-likelihood = {pf.log_likelihood:.3f}, minimum effective sample size = {ess.min():.1f}\n')
+
+runs_agree = np.max(np.ptp(np.array(final_means), axis=0)) < 5
+
+print(f'Final positions of the runs agree to within 5 units (should be "True"): {runs_agree}')
+
+# Same model at the particle counts needed on live streams
+for n_particles in [10 ** 5, 10 ** 6]:
+    pf = ParticleFilter(transition, log_likelihood, np.random.default_rng(0).normal(0, 1, size=(n_particles, 2)),
+                        seed=0)
+    start_time = time.time()
+    means, variances, ess = pf.run(observations)
+    elapsed = time.time() - start_time
+
+    print(f'{n_particles} particles: {elapsed / len(observations) * 1000:.1f}ms per step, final mean = '
+          f'({means[-1][0]:.3f}, {means[-1][1]:.3f})')
@@ -0,0 +1,108 @@
+from bayes_net import CompiledBayesNet
+import numpy as np
+import pandas as pd
+from typing import Dict, List
+
+
+class CountAccumulator:
+    def __init__(self, compiled_net: CompiledBayesNet, var_names: List[str], n_batches: int = 32) -> None:
+        # One counter per possible value of each tracked variable; updating is O(number of tracked variables)
+        self.compiled_net = compiled_net
+        self.var_names = list(var_names)
+        self.node_idxs = [compiled_net.node_idx[var_name] for var_name in self.var_names]
+        self.counts = [[0] * int(compiled_net.cards[node_idx]) for node_idx in self.node_idxs]
+        self.n_samples = 0
+
+        # Snapshots of the counts at batch boundaries, for batch-means Monte Carlo standard errors; once there are
+        # 2 * n_batches batches every other snapshot is dropped and the batch size doubles, so memory stays bounded
+        self.n_batches = n_batches
+        self.batch_size = 1
+        self.n_updates = 0
+        self.snapshots = [(0, [list(counts) for counts in self.counts])]
+
+    def update(self, state: List[int]) -> None:
+        for node_idx, counts in zip(self.node_idxs, self.counts):
+            counts[state[node_idx]] += 1
+
+        self.n_samples += 1
+        self._end_update()
+
+    def _end_update(self) -> None:
+        self.n_updates += 1
+
+        if self.n_updates % self.batch_size == 0:
+            self.snapshots.append((self.n_samples, [list(counts) for counts in self.counts]))
+
+            if len(self.snapshots) == 2 * self.n_batches + 1:
+                self.snapshots = self.snapshots[::2]
+                self.batch_size *= 2
+
+    def update_chains(self, states: np.ndarray) -> None:
+        for i, node_idx in enumerate(self.node_idxs):
+            chain_counts = np.bincount(states[:, node_idx], minlength=len(self.counts[i]))
+            self.counts[i] = [count + int(new_count) for count, new_count in zip(self.counts[i], chain_counts)]
+
+        self.n_samples += states.shape[0]
+        self._end_update()
+
+    def get_probs(self, var_name: str) -> Dict[object, float]:
+        i = self.var_names.index(var_name)
+        possible_vals = self.compiled_net.possible_vals[self.node_idxs[i]]
+
+        return {possible_val: count / self.n_samples for possible_val, count in zip(possible_vals, self.counts[i])}
+
+    def get_mcse(self, var_name: str) -> np.ndarray:
+        # Batch-means Monte Carlo standard error of each estimated probability (NaN until there are enough batches).
+        # A value that was never drawn, or always drawn, has no observed variance yet: it may just be rare (e.g.
+        # P(B | J = T, M = F) ~ 0.005), so its MCSE is NaN rather than 0 and it never meets a stopping target
+        i = self.var_names.index(var_name)
+
+        if len(self.snapshots) - 1 < self.n_batches:
+            return np.full(len(self.counts[i]), np.nan)
+
+        n_samples = np.array([snapshot[0] for snapshot in self.snapshots], dtype=float)
+        counts = np.array([snapshot[1][i] for snapshot in self.snapshots], dtype=float)
+        batch_probs = np.diff(counts, axis=0) / np.diff(n_samples)[:, None]
+        mcse = np.sqrt(batch_probs.var(axis=0, ddof=1) / len(batch_probs))
+        current_counts = np.array(self.counts[i])
+        mcse[(current_counts == 0) | (current_counts == self.n_samples)] = np.nan
+
+        return mcse
+
+    def get_ess(self, var_name: str) -> np.ndarray:
+        # ESS of each value's indicator: p(1 - p) / MCSE^2, capped at the number of samples (NaN wherever the MCSE is)
+        probs = np.array(list(self.get_probs(var_name).values()))
+        mcse = self.get_mcse(var_name)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ess = probs * (1 - probs) / np.square(mcse)
+
+        ess[mcse == 0] = self.n_samples
+
+        return np.minimum(ess, self.n_samples)
+
+
+class DrawAccumulator:
+    def __init__(self, compiled_net: CompiledBayesNet) -> None:
+        # Keeps every raw draw (integer-coded); only use this when the caller actually wants the sample table
+        self.compiled_net = compiled_net
+        self.dtype = np.int8 if compiled_net.cards.max(initial=0) <= 128 else np.int64
+        self.draws = []
+        self.n_samples = 0
+
+    def update(self, state: List[int]) -> None:
+        self.draws.append(np.array(state, dtype=self.dtype))
+        self.n_samples += 1
+
+    def update_chains(self, states: np.ndarray) -> None:
+        self.draws.extend(states.astype(self.dtype))
+        self.n_samples += states.shape[0]
+
+    def to_frame(self) -> pd.DataFrame:
+        codes = np.array(self.draws).reshape(-1, self.compiled_net.n_nodes)
+        columns = {}
+
+        for node_idx, node_name in enumerate(self.compiled_net.node_names):
+            columns[node_name] = np.array(self.compiled_net.possible_vals[node_idx], dtype=object)[codes[:, node_idx]]
+
+        return pd.DataFrame(columns, columns=self.compiled_net.node_names)
@@ -1,4 +1,6 @@
-from copy import copy
+from bisect import bisect_right
+from itertools import product
+from math import prod
 from typing import List, Dict, Tuple
 import numpy as np
 
@@ -29,7 +31,7 @@ class BayesNetDiscreteNode(BayesNetNode):
         my_val_idx = self.possible_vals.index(my_val)
 
         # Grab any parent values the node depends on
-        parent_names = [node.golfer_name for node in self.parents]
+        parent_names = [node.name for node in self.parents]
         parent_vals_tup = []
 
         for var_name in var_vals.keys():
@@ -50,23 +52,26 @@ class BayesNetDiscreteNode(BayesNetNode):
         return prob
 
     def get_sample(self, var_vals: Dict[str, str]) -> str:
-        # Generate an array of probabilities for each of the node's possible values
+        # Generate an array of probabilities for each of the node's possible values (the candidate value is written
+        # into var_vals in place and the previous value restored afterwards, rather than copying the dict)
         probs_array = []
+        prev_val = var_vals.get(self.name, None)
 
         for val in self.possible_vals:
-            new_var_vals = copy(var_vals)
-            new_var_vals[self.name] = val
+            var_vals[self.name] = val
             prob = 1.0
 
             # Probability given its parents (first part of Markov blanket)
-            prob *= self.get_prob(new_var_vals)
+            prob *= self.get_prob(var_vals)
 
             # Probability for each of its children (second part of Markov blanket)
             for child_node in self.children:
-                prob *= child_node.get_prob(new_var_vals)
+                prob *= child_node.get_prob(var_vals)
 
             probs_array.append(prob)
 
+        var_vals[self.name] = prev_val
+
         # Using the probability array, sample a new value
         probs_array = [prob / sum(probs_array) for prob in probs_array]  # Normalize the array
         new_sample = np.random.choice(self.possible_vals, p=probs_array)
@@ -74,15 +79,224 @@ class BayesNetDiscreteNode(BayesNetNode):
         return new_sample
 
 
+class CompiledBayesNet:
+    # Nodes whose Markov blanket has at most this many joint configurations get their full conditional precomputed
+    max_blanket_table_size = 2 ** 16
+
+    def __init__(self, nodes: Dict[str, BayesNetDiscreteNode]) -> None:
+        # Freeze the network into integer-coded states: every node gets an index (in network order) and every value
+        # gets an index into the node's possible values
+        self.node_names = list(nodes.keys())
+        self.node_idx = {node_name: idx for idx, node_name in enumerate(self.node_names)}
+        self.possible_vals = [list(node.possible_vals) for node in nodes.values()]
+        self.val_idx = [{val: val_idx for val_idx, val in enumerate(vals)} for vals in self.possible_vals]
+        self.cards = np.array([len(vals) for vals in self.possible_vals], dtype=np.int64)
+        self.cards_list = self.cards.tolist()
+        self.n_nodes = len(self.node_names)
+        self._all_columns = np.arange(self.n_nodes)
+
+        # Parents are ordered the same way BayesNetDiscreteNode.get_prob builds its lookup tuple (network order)
+        self.parents, self.strides, self.cpts = [], [], []
+
+        for node in nodes.values():
+            parent_idxs = sorted(self.node_idx[parent.name] for parent in node.parents)
+            strides = self._get_strides(parent_idxs)
+
+            # One CPT row per parent configuration; row index = sum(parent state * stride)
+            cpt = np.zeros((prod(self.cards[parent_idxs].tolist()), len(node.possible_vals)))
+
+            for row, parent_vals_tup in enumerate(product(*[self.possible_vals[idx] for idx in parent_idxs])):
+                probs = node.conditional_probs.get(parent_vals_tup, None)
+
+                if probs is None:
+                    raise Exception(f'Missing conditional probabilities for node {node.name} given {parent_vals_tup}')
+
+                cpt[row] = probs
+
+            self.parents.append(np.array(parent_idxs, dtype=np.int64))
+            self.strides.append(strides)
+            self.cpts.append(cpt)
+
+        # For each node, its children and the stride the node has in each child's CPT, so the child's row for every
+        # candidate value of the node can be computed with one multiply-add
+        self.children = [[] for _ in range(self.n_nodes)]
+        self.child_strides = [[] for _ in range(self.n_nodes)]
+
+        for child_idx in range(self.n_nodes):
+            for parent_idx, stride in zip(self.parents[child_idx], self.strides[child_idx]):
+                self.children[parent_idx].append(child_idx)
+                self.child_strides[parent_idx].append(int(stride))
+
+        self.children = [np.array(children, dtype=np.int64) for children in self.children]
+        self.child_strides = [np.array(strides, dtype=np.int64) for strides in self.child_strides]
+
+        # Topological order (parents before children), used by forward / likelihood-weighting samplers
+        self.topological_order = []
+        n_unvisited_parents = [len(parent_idxs) for parent_idxs in self.parents]
+        ready = [node_idx for node_idx in range(self.n_nodes) if n_unvisited_parents[node_idx] == 0]
+
+        while len(ready) > 0:
+            node_idx = ready.pop(0)
+            self.topological_order.append(node_idx)
+
+            for child_idx in self.children[node_idx]:
+                n_unvisited_parents[child_idx] -= 1
+
+                if n_unvisited_parents[child_idx] == 0:
+                    ready.append(int(child_idx))
+
+        if len(self.topological_order) != self.n_nodes:
+            raise Exception('The network contains a cycle')
+
+        # Markov blanket = parents, children, and the children's other parents
+        self.markov_blankets = []
+
+        for node_idx in range(self.n_nodes):
+            blanket = set(self.parents[node_idx]) | set(self.children[node_idx])
+
+            for child_idx in self.children[node_idx]:
+                blanket |= set(self.parents[child_idx])
+
+            blanket.discard(node_idx)
+            self.markov_blankets.append(np.array(sorted(blanket), dtype=np.int64))
+
+        # Cumulative full conditional of each node for every configuration of its Markov blanket, so a Gibbs step is a
+        # single row lookup. Tables are built the first time a node is sampled (a query only pays for the nodes it
+        # actually sweeps) and are keyed by node index: (blanket strides, (blanket index, stride) pairs, cdf table, flat
+        # memoryview of the same table for fast scalar lookups), or None for a blanket too large to tabulate, whose
+        # conditional is computed on the fly instead
+        self._blanket_tables = {}
+
+    def _get_blanket_table(self, node_idx: int):
+        if node_idx in self._blanket_tables:
+            return self._blanket_tables[node_idx]
+
+        blanket = self.markov_blankets[node_idx]
+        n_configs = prod(self.cards[blanket].tolist())
+        table = None
+
+        if n_configs <= self.max_blanket_table_size:
+            # Only the node's own column and its blanket's columns are materialized, never a full state matrix
+            strides = self._get_strides(blanket)
+            local_idxs = np.concatenate([[node_idx], blanket])
+            columns = np.full(self.n_nodes, -1, dtype=np.int64)
+            columns[local_idxs] = np.arange(len(local_idxs))
+            states = np.zeros((n_configs, len(local_idxs)), dtype=np.int64)
+            states[:, 1:] = (np.arange(n_configs)[:, None] // strides) % self.cards[blanket]
+            cdfs = np.cumsum(self.get_conditionals(node_idx, states, columns), axis=1)
+            table = (strides, list(zip(blanket.tolist(), strides.tolist())), cdfs, memoryview(cdfs.ravel()))
+
+        self._blanket_tables[node_idx] = table
+
+        return table
+
+    def _get_strides(self, node_idxs) -> np.ndarray:
+        cards = self.cards[node_idxs]
+
+        return np.array([int(np.prod(cards[i + 1:])) for i in range(len(cards))], dtype=np.int64)
+
+    def encode(self, var_vals: Dict[str, str]) -> List[int]:
+        state = [0] * self.n_nodes
+
+        for node_name, val in var_vals.items():
+            node_idx = self.node_idx[node_name]
+            state[node_idx] = self.val_idx[node_idx][val]
+
+        return state
+
+    def decode(self, state: List[int]) -> Dict[str, str]:
+        return {node_name: self.possible_vals[idx][state[idx]] for idx, node_name in enumerate(self.node_names)}
+
+    def get_conditionals(self, node_idx: int, states: np.ndarray, columns: np.ndarray = None) -> np.ndarray:
+        # Full conditional of the node for each row of a state matrix: (n_states x n_nodes), or only some of the nodes
+        # with columns mapping each node index to its column of states
+        if columns is None:
+            columns = self._all_columns
+
+        my_vals = states[:, columns[node_idx]]
+
+        # Probability given its parents (first part of Markov blanket)
+        probs = self.cpts[node_idx][states[:, columns[self.parents[node_idx]]].dot(self.strides[node_idx])]
+
+        # Probability for each of its children (second part of Markov blanket); the child's CPT row for each candidate
+        # value of this node is the current row shifted by the node's stride
+        candidate_vals = np.arange(self.cards[node_idx])
+
+        for child_idx, stride in zip(self.children[node_idx], self.child_strides[node_idx]):
+            base_rows = states[:, columns[self.parents[child_idx]]].dot(self.strides[child_idx]) - my_vals * stride
+            rows = base_rows[:, None] + stride * candidate_vals
+            probs = probs * self.cpts[child_idx][rows, states[:, columns[child_idx]][:, None]]
+
+        return probs / probs.sum(axis=1, keepdims=True)
+
+    def get_sample(self, node_idx: int, state: List[int], rand: float) -> int:
+        table = self._blanket_tables.get(node_idx, False)
+
+        if table is False:
+            table = self._get_blanket_table(node_idx)
+
+        if table is None:
+            cdf = np.cumsum(self.get_conditionals(node_idx, np.array([state]))[0]).tolist()
+
+        else:
+            _, blanket_strides, _, flat_cdfs = table
+            card = self.cards_list[node_idx]
+            start = 0
+
+            for blanket_idx, stride in blanket_strides:
+                start += state[blanket_idx] * stride
+
+            # The row's cdf is flat_cdfs[start * card:(start + 1) * card]; bisect within it without slicing
+            start *= card
+
+            return min(bisect_right(flat_cdfs, rand, start, start + card) - start, card - 1)
+
+        return min(bisect_right(cdf, rand), len(cdf) - 1)
+
+    def run_simulation(self, state: List[int], latent_idxs: List[int]) -> List[int]:
+        # Same sweep as BayesNet.run_simulation, but updates the integer state in place and never visits observed nodes
+        rands = np.random.random(len(latent_idxs)).tolist()
+
+        for node_idx, rand in zip(latent_idxs, rands):
+            state[node_idx] = self.get_sample(node_idx, state, rand)
+
+        return state
+
+    def get_samples(self, node_idx: int, states: np.ndarray, rands: np.ndarray) -> np.ndarray:
+        # Vectorized version of get_sample: one categorical draw per row of a (n_chains x n_nodes) state matrix
+        table = self._get_blanket_table(node_idx)
+
+        if table is None:
+            cdfs = np.cumsum(self.get_conditionals(node_idx, states), axis=1)
+
+        else:
+            strides, _, cdfs, _ = table
+            cdfs = cdfs[states[:, self.markov_blankets[node_idx]].dot(strides)]
+
+        return np.minimum((cdfs <= rands[:, None]).sum(axis=1), self.cards[node_idx] - 1)
+
+    def run_simulation_chains(self, states: np.ndarray, latent_idxs: List[int]) -> np.ndarray:
+        # Advance every chain (row of the state matrix) by one sweep, in lockstep and in place
+        rands = np.random.random((len(latent_idxs), states.shape[0]))
+
+        for node_idx, node_rands in zip(latent_idxs, rands):
+            states[:, node_idx] = self.get_samples(node_idx, states, node_rands)
+
+        return states
+
+
 class BayesNet:
     def __init__(self) -> None:
         self.nodes = {}
+        self.version = 0
+        self._compiled = None
 
     def add_node(self, new_node: BayesNetNode) -> None:
         if new_node.name in self.nodes:
             raise Exception('Cannot add existing node to the network')
 
         self.nodes[new_node.name] = new_node
+        self.version += 1
 
     def add_edge(self, parent_node_name: str, child_node_name: str) -> None:
         if parent_node_name not in self.nodes or child_node_name not in self.nodes:
@@ -90,21 +304,32 @@ class BayesNet:
 
         self.nodes[parent_node_name].children.append(self.nodes[child_node_name])
         self.nodes[child_node_name].parents.append(self.nodes[parent_node_name])
+        self.version += 1
 
     def get_node_names(self):
         return list(self.nodes.keys())
 
-    def run_simulation(self, var_vals: Dict[str, object], observed_vals: Dict[str, object]) -> Dict[str, object]:
-        # Iterate through the network and use markov blanket combined with the previously-sampled values and any
-        # observed values to generate new samples
-        sampled_vals = copy(var_vals)
+    def compile(self) -> CompiledBayesNet:
+        # The compiled network is cached until the structure changes
+        if self._compiled is None or self._compiled[0] != self.version:
+            self._compiled = (self.version, CompiledBayesNet(self.nodes))
+
+        return self._compiled[1]
 
-        for node_name, node in self.nodes.items():
-            if node_name in observed_vals:
-                sampled_vals[node_name] = observed_vals[node_name]
+    def make_schedule(self, observed_vals: Dict[str, object]) -> List[BayesNetNode]:
+        # The nodes that actually need sampling, in network order; observed nodes are never visited during a sweep
+        return [node for node_name, node in self.nodes.items() if node_name not in observed_vals]
 
-            else:
-                sampled_vals[node_name] = node.get_sample(sampled_vals)
+    def run_simulation(self, var_vals: Dict[str, object], observed_vals: Dict[str, object],
+                       schedule: List[BayesNetNode] = None) -> Dict[str, object]:
+        # Iterate through the latent nodes and use markov blanket combined with the previously-sampled values and any
+        # observed values to generate new samples; var_vals is updated in place. Callers running many sweeps should
+        # build the schedule once with make_schedule (and put the observed values in var_vals themselves)
+        if schedule is None:
+            var_vals.update(observed_vals)
+            schedule = self.make_schedule(observed_vals)
 
-        return sampled_vals
+        for node in schedule:
+            var_vals[node.name] = node.get_sample(var_vals)
 
+        return var_vals
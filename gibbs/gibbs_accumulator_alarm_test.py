@@ -0,0 +1,56 @@
+from bayes_net import BayesNetDiscreteNode, BayesNet
+from gibbs_sampler import GibbsSampler
+import numpy as np
+from variable_elimination import VariableElimination
+
+N_SAMPLES = 50000
+
+burglary_node = BayesNetDiscreteNode('B', ['True', 'False'], {(): [0.001, 1 - 0.001]})
+earthquake_node = BayesNetDiscreteNode('E', ['True', 'False'], {(): [0.002, 1 - 0.002]})
+alarm_node = BayesNetDiscreteNode('A', ['True', 'False'], {('True', 'True'): [0.95, 1 - 0.95],
+                                                           ('True', 'False'): [0.94, 1 - 0.94],
+                                                           ('False', 'True'): [0.29, 1 - 0.29],
+                                                           ('False', 'False'): [0.001, 1 - 0.001]})
+john_node = BayesNetDiscreteNode('J', ['True', 'False'], {('True',): [0.90, 1 - 0.90], ('False',): [0.05, 1 - 0.05]})
+mary_node = BayesNetDiscreteNode('M', ['True', 'False'], {('True',): [0.70, 1 - 0.70], ('False',): [0.01, 1 - 0.01]})
+
+bayes_net = BayesNet()
+bayes_net.add_node(burglary_node)
+bayes_net.add_node(earthquake_node)
+bayes_net.add_node(alarm_node)
+bayes_net.add_node(john_node)
+bayes_net.add_node(mary_node)
+bayes_net.add_edge(burglary_node.name, alarm_node.name)
+bayes_net.add_edge(earthquake_node.name, alarm_node.name)
+bayes_net.add_edge(alarm_node.name, john_node.name)
+bayes_net.add_edge(alarm_node.name, mary_node.name)
+
+# make_estimate only keeps running counts of the query variables; with the same seed it has to give exactly the
+# frequencies of the full table of draws from sample_draws, and both should be close to the exact answer
+exact = VariableElimination(bayes_net)
+observed_vals = {john_node.name: 'True', mary_node.name: 'True'}
+vars_in_question = [burglary_node.name, earthquake_node.name, alarm_node.name]
+all_match, all_close = True, True
+
+for n_chains in [1, 100]:
+    gibbs = GibbsSampler(bayes_net, N_SAMPLES, n_chains=n_chains)
+
+    np.random.seed(0)
+    estimate = gibbs.make_estimate(vars_in_question, observed_vals)
+    np.random.seed(0)
+    simulation_table = gibbs.sample_draws(observed_vals)
+
+    for var_in_question in vars_in_question:
+        counted_probs = np.array([float(prob.split(': ')[1]) for prob in estimate
+                                  if prob.startswith(f'{var_in_question} = ')])
+        table_probs = np.array([np.mean(simulation_table[var_in_question] == val)
+                                for val in bayes_net.nodes[var_in_question].possible_vals])
+        exact_probs = exact.get_distribution(var_in_question, observed_vals)
+        all_match = all_match and np.allclose(counted_probs, table_probs, rtol=0, atol=1e-12)
+        all_close = all_close and np.allclose(counted_probs, exact_probs, atol=0.02)
+
+        print(f'{n_chains} chain(s), P({var_in_question} | {observed_vals}): counts = {np.round(counted_probs, 4)}, '
+              f'table = {np.round(table_probs, 4)}, exact = {np.round(exact_probs, 4)}')
+
+print(f'\nStreamed counts match the full table of draws (should be "True"): {all_match}')
+print(f'Streamed counts agree with variable elimination (should be "True"): {all_close}')
@@ -0,0 +1,56 @@
+from bayes_net import BayesNetDiscreteNode, BayesNet
+from gibbs_sampler import GibbsSampler
+import numpy as np
+
+N_SAMPLES = 10000
+
+burglary_node = BayesNetDiscreteNode('B', ['True', 'False'], {(): [0.001, 1 - 0.001]})
+earthquake_node = BayesNetDiscreteNode('E', ['True', 'False'], {(): [0.002, 1 - 0.002]})
+alarm_node = BayesNetDiscreteNode('A', ['True', 'False'], {('True', 'True'): [0.95, 1 - 0.95],
+                                                           ('True', 'False'): [0.94, 1 - 0.94],
+                                                           ('False', 'True'): [0.29, 1 - 0.29],
+                                                           ('False', 'False'): [0.001, 1 - 0.001]})
+john_node = BayesNetDiscreteNode('J', ['True', 'False'], {('True',): [0.90, 1 - 0.90], ('False',): [0.05, 1 - 0.05]})
+mary_node = BayesNetDiscreteNode('M', ['True', 'False'], {('True',): [0.70, 1 - 0.70], ('False',): [0.01, 1 - 0.01]})
+
+bayes_net = BayesNet()
+bayes_net.add_node(burglary_node)
+bayes_net.add_node(earthquake_node)
+bayes_net.add_node(alarm_node)
+bayes_net.add_node(john_node)
+bayes_net.add_node(mary_node)
+bayes_net.add_edge(burglary_node.name, alarm_node.name)
+bayes_net.add_edge(earthquake_node.name, alarm_node.name)
+bayes_net.add_edge(alarm_node.name, john_node.name)
+bayes_net.add_edge(alarm_node.name, mary_node.name)
+
+np.random.seed(0)
+gibbs = GibbsSampler(bayes_net, N_SAMPLES, cache_size=2)
+evidence = [{john_node.name: 'True', mary_node.name: 'True'},
+            {john_node.name: 'False'},
+            {mary_node.name: 'True'}]
+
+# Repeating a query (with the evidence in a different order) is a hit and gives exactly the same answer, and a query
+# for another variable with the same evidence is answered from the same run
+first = gibbs.make_estimate([burglary_node.name], evidence[0])
+repeated = gibbs.make_estimate([burglary_node.name], dict(reversed(list(evidence[0].items()))))
+gibbs.make_estimate([alarm_node.name], evidence[0])
+hits_ok = first == repeated and gibbs.cache_info()['hits'] == 2 and gibbs.cache_info()['misses'] == 1
+
+print(f'Repeated queries are answered from the cache with the same result (should be "True"): {hits_ok}')
+
+# Two more evidence sets overflow the cache of size 2: the least recently used entry (evidence[0]) is evicted, so asking
+# for it again is a miss, while the most recent one is still a hit
+gibbs.make_estimate([burglary_node.name], evidence[1])
+gibbs.make_estimate([burglary_node.name], evidence[2])
+gibbs.make_estimate([burglary_node.name], evidence[2])
+evicted = gibbs.make_estimate([burglary_node.name], evidence[0])
+eviction_ok = gibbs.cache_info() == {'hits': 3, 'misses': 4, 'size': 2, 'max_size': 2} and evicted != first
+
+print(f'The least recently used entry is evicted once the cache is full (should be "True"): {eviction_ok}')
+
+# Changing the network drops every entry, since none of them can be valid for the new structure
+bayes_net.add_node(BayesNetDiscreteNode('X', ['True', 'False'], {(): [0.5, 0.5]}))
+gibbs.make_estimate([burglary_node.name], evidence[2])
+
+print(f'Changing the network invalidates the cache (should be "True"): {gibbs.cache_info()["size"] == 1}')
@@ -0,0 +1,55 @@
+from bayes_net import BayesNetDiscreteNode, BayesNet
+from gibbs_sampler import GibbsSampler
+import numpy as np
+from variable_elimination import VariableElimination
+
+N_SAMPLES = 100000
+N_CHAINS = 1000
+
+burglary_node = BayesNetDiscreteNode('B', ['True', 'False'], {(): [0.001, 1 - 0.001]})
+earthquake_node = BayesNetDiscreteNode('E', ['True', 'False'], {(): [0.002, 1 - 0.002]})
+alarm_node = BayesNetDiscreteNode('A', ['True', 'False'], {('True', 'True'): [0.95, 1 - 0.95],
+                                                           ('True', 'False'): [0.94, 1 - 0.94],
+                                                           ('False', 'True'): [0.29, 1 - 0.29],
+                                                           ('False', 'False'): [0.001, 1 - 0.001]})
+john_node = BayesNetDiscreteNode('J', ['True', 'False'], {('True',): [0.90, 1 - 0.90], ('False',): [0.05, 1 - 0.05]})
+mary_node = BayesNetDiscreteNode('M', ['True', 'False'], {('True',): [0.70, 1 - 0.70], ('False',): [0.01, 1 - 0.01]})
+
+bayes_net = BayesNet()
+bayes_net.add_node(burglary_node)
+bayes_net.add_node(earthquake_node)
+bayes_net.add_node(alarm_node)
+bayes_net.add_node(john_node)
+bayes_net.add_node(mary_node)
+bayes_net.add_edge(burglary_node.name, alarm_node.name)
+bayes_net.add_edge(earthquake_node.name, alarm_node.name)
+bayes_net.add_edge(alarm_node.name, john_node.name)
+bayes_net.add_edge(alarm_node.name, mary_node.name)
+
+# Many short chains: each one runs only N_SAMPLES / N_CHAINS sweeps, so the estimates are only right if the chains do
+# not start far from the posterior (the rare-evidence queries, such as P(B | J=false, M=false) = 9e-05, show it most)
+np.random.seed(0)
+exact = VariableElimination(bayes_net)
+gibbs = GibbsSampler(bayes_net, N_SAMPLES, n_chains=N_CHAINS)
+
+queries = [(burglary_node.name, {john_node.name: 'True', mary_node.name: 'True'}),
+           (alarm_node.name, {john_node.name: 'True', mary_node.name: 'True'}),
+           (earthquake_node.name, {john_node.name: 'True', mary_node.name: 'True'}),
+           (burglary_node.name, {john_node.name: 'False', mary_node.name: 'False'}),
+           (burglary_node.name, {john_node.name: 'True', mary_node.name: 'False'}),
+           (burglary_node.name, {john_node.name: 'True'}),
+           (burglary_node.name, {mary_node.name: 'True'})]
+all_close = True
+
+for var_in_question, observed_vals in queries:
+    exact_prob = exact.get_distribution(var_in_question, observed_vals)[0]
+    estimated_prob = float(gibbs.make_estimate([var_in_question], observed_vals)[0].split(': ')[1])
+
+    # Within a few Monte Carlo standard errors (relative to the exact value, plus a floor for the tiny ones)
+    is_close = abs(estimated_prob - exact_prob) < 0.1 * exact_prob + 5e-4
+    all_close = all_close and is_close
+
+    print(f'P({var_in_question} = True | {observed_vals}): exact = {exact_prob:.6f}, {N_CHAINS} chains = '
+          f'{estimated_prob:.6f}, close = {is_close}')
+
+print(f'\nMulti-chain estimates agree with variable elimination (should be "True"): {all_close}')
@@ -0,0 +1,111 @@
+from accumulator import CountAccumulator
+from bayes_net import BayesNetDiscreteNode, BayesNet, CompiledBayesNet
+from itertools import product
+import numpy as np
+
+N_SAMPLES = 20000
+
+burglary_node = BayesNetDiscreteNode('B', ['True', 'False'], {(): [0.001, 1 - 0.001]})
+earthquake_node = BayesNetDiscreteNode('E', ['True', 'False'], {(): [0.002, 1 - 0.002]})
+alarm_node = BayesNetDiscreteNode('A', ['True', 'False'], {('True', 'True'): [0.95, 1 - 0.95],
+                                                           ('True', 'False'): [0.94, 1 - 0.94],
+                                                           ('False', 'True'): [0.29, 1 - 0.29],
+                                                           ('False', 'False'): [0.001, 1 - 0.001]})
+john_node = BayesNetDiscreteNode('J', ['True', 'False'], {('True',): [0.90, 1 - 0.90], ('False',): [0.05, 1 - 0.05]})
+mary_node = BayesNetDiscreteNode('M', ['True', 'False'], {('True',): [0.70, 1 - 0.70], ('False',): [0.01, 1 - 0.01]})
+
+bayes_net = BayesNet()
+bayes_net.add_node(burglary_node)
+bayes_net.add_node(earthquake_node)
+bayes_net.add_node(alarm_node)
+bayes_net.add_node(john_node)
+bayes_net.add_node(mary_node)
+bayes_net.add_edge(burglary_node.name, alarm_node.name)
+bayes_net.add_edge(earthquake_node.name, alarm_node.name)
+bayes_net.add_edge(alarm_node.name, john_node.name)
+bayes_net.add_edge(alarm_node.name, mary_node.name)
+
+compiled_net = bayes_net.compile()
+
+# Untabulated nodes (blankets above max_blanket_table_size) compute their conditional on the fly instead
+untabulated_net = CompiledBayesNet(bayes_net.nodes)
+untabulated_net.max_blanket_table_size = 0
+
+# For every node and every joint state, the compiled full conditional should equal the one the dict-based
+# BayesNetDiscreteNode.get_sample builds from get_prob, and the tabulated and untabulated samplers should draw the same
+# value from the same uniform
+conditionals_match, samples_match = True, True
+rands = np.linspace(0, 1, 21).tolist()
+
+for vals in product(*[node.possible_vals for node in bayes_net.nodes.values()]):
+    var_vals = dict(zip(bayes_net.get_node_names(), vals))
+    state = compiled_net.encode(var_vals)
+
+    for node_idx, node in enumerate(bayes_net.nodes.values()):
+        probs = []
+
+        for val in node.possible_vals:
+            candidate_vals = dict(var_vals, **{node.name: val})
+            probs.append(node.get_prob(candidate_vals) * np.prod([child.get_prob(candidate_vals)
+                                                                  for child in node.children]))
+
+        compiled_probs = compiled_net.get_conditionals(node_idx, np.array([state]))[0]
+        conditionals_match = conditionals_match and np.allclose(compiled_probs, np.array(probs) / sum(probs))
+        samples_match = samples_match and all(compiled_net.get_sample(node_idx, state, rand) ==
+                                              untabulated_net.get_sample(node_idx, state, rand) for rand in rands)
+
+print(f'Compiled conditionals match the dict-based ones (should be "True"): {conditionals_match}')
+print(f'Tabulated and untabulated draws are identical (should be "True"): {samples_match}')
+
+# Compiling builds no blanket tables; each one is built the first time its node is sampled
+fresh_net = CompiledBayesNet(bayes_net.nodes)
+no_tables_up_front = len(fresh_net._blanket_tables) == 0
+fresh_net.run_simulation(fresh_net.encode({node_name: 'True' for node_name in bayes_net.get_node_names()}),
+                         [fresh_net.node_idx[burglary_node.name]])
+
+print(f'Blanket tables are only built for sampled nodes (should be "True"): '
+      f'{no_tables_up_front and list(fresh_net._blanket_tables) == [fresh_net.node_idx[burglary_node.name]]}\n')
+
+
+def run_dict_path(observed_vals: dict) -> CountAccumulator:
+    # The original sampler: BayesNet.run_simulation over dicts of string values
+    accumulator = CountAccumulator(compiled_net, bayes_net.get_node_names())
+    schedule = bayes_net.make_schedule(observed_vals)
+    var_vals = {node_name: observed_vals.get(node_name, node.possible_vals[0])
+                for node_name, node in bayes_net.nodes.items()}
+
+    for _ in range(N_SAMPLES):
+        accumulator.update(compiled_net.encode(bayes_net.run_simulation(var_vals, observed_vals, schedule)))
+
+    return accumulator
+
+
+def run_compiled_path(observed_vals: dict) -> CountAccumulator:
+    accumulator = CountAccumulator(compiled_net, bayes_net.get_node_names())
+    latent_idxs = [compiled_net.node_idx[node.name] for node in bayes_net.make_schedule(observed_vals)]
+    state = compiled_net.encode({node_name: observed_vals.get(node_name, node.possible_vals[0])
+                                 for node_name, node in bayes_net.nodes.items()})
+
+    for _ in range(N_SAMPLES):
+        accumulator.update(compiled_net.run_simulation(state, latent_idxs))
+
+    return accumulator
+
+
+# Both samplers target the same posterior, so their estimates should agree to within a few Monte Carlo standard errors
+np.random.seed(0)
+estimates_agree = True
+
+for observed_vals in [{john_node.name: 'True', mary_node.name: 'True'}, {john_node.name: 'True'}]:
+    dict_counts, compiled_counts = run_dict_path(observed_vals), run_compiled_path(observed_vals)
+
+    for var_name in [burglary_node.name, alarm_node.name]:
+        dict_probs = np.array(list(dict_counts.get_probs(var_name).values()))
+        compiled_probs = np.array(list(compiled_counts.get_probs(var_name).values()))
+        tolerance = 4 * np.sqrt(dict_counts.get_mcse(var_name) ** 2 + compiled_counts.get_mcse(var_name) ** 2)
+        estimates_agree = estimates_agree and np.all(np.abs(dict_probs - compiled_probs) < tolerance)
+
+        print(f'P({var_name} = True | {observed_vals}): dict path = {dict_probs[0]:.4f}, compiled path = '
+              f'{compiled_probs[0]:.4f} (tolerance {tolerance[0]:.4f})')
+
+print(f'Compiled estimates agree with the dict-based sampler (should be "True"): {estimates_agree}')
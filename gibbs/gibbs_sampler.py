@@ -1,13 +1,38 @@
-from bayes_net import BayesNet
+from accumulator import CountAccumulator, DrawAccumulator
+from bayes_net import BayesNet, CompiledBayesNet
+from likelihood_weighting import LikelihoodWeightingSampler
+from lru_cache import LRUCache
+from sample_store import SampleStore
 import numpy as np
 import pandas as pd
 from typing import Dict, List
 
 
 class GibbsSampler:
-    def __init__(self, bayes_net: BayesNet, n_samples: int) -> None:
+    # Default burn-in (in sweeps) in multi-chain mode, where every chain is short and its start-up transient would
+    # otherwise make up a large part of the estimate
+    chain_burn_in_period = 100
+
+    def __init__(self, bayes_net: BayesNet, n_samples: int, n_chains: int = 1, burn_in_period: int = None,
+                 cache_size: int = None, target_ess: float = None, target_mcse: float = None,
+                 check_every: int = 1000) -> None:
         self.bayes_net = bayes_net
         self.n_samples = n_samples
+        self.n_chains = n_chains
+        self.burn_in_period = burn_in_period if burn_in_period is not None else \
+            (self.chain_burn_in_period if n_chains > 1 else 0)
+
+        # Optional stopping rule: with a target ESS and/or MCSE, n_samples becomes an upper bound and the run stops at
+        # the first check (every check_every samples) where every query value meets the targets
+        self.target_ess = target_ess
+        self.target_mcse = target_mcse
+        self.check_every = check_every
+        self.n_samples_used = None
+        self.accumulator = None
+
+        # Optional memoization of finished runs, keyed by the evidence (see _get_cache_key)
+        self.cache = LRUCache(cache_size) if cache_size is not None else None
+        self._cache_version = None
 
     def make_estimate(self, vars_in_question: List[str], observed_vals: Dict[str, object]) -> List[str]:
         node_names = self.bayes_net.get_node_names()
@@ -20,7 +45,126 @@ class GibbsSampler:
             if observed_var not in node_names:
                 raise Exception(f'Observed variable {observed_var} is not in the network')
 
-        table = []
+        # Freeze the network into integer-coded states so that each sweep is pure array indexing
+        compiled_net = self.bayes_net.compile()
+        latent_idxs = [compiled_net.node_idx[node.name] for node in self.bayes_net.make_schedule(observed_vals)]
+
+        if self.cache is None:
+            # Only the counts of the query variables are kept, so memory does not grow with n_samples. An observed query
+            # variable never changes, so it is left out of the stopping rule
+            accumulator = CountAccumulator(compiled_net, vars_in_question)
+            stopping_vars = [var_name for var_name in vars_in_question if var_name not in observed_vals]
+            self._run(compiled_net, latent_idxs, observed_vals, accumulator, stopping_vars)
+
+        else:
+            # When caching, count every node so a later query with the same evidence can reuse this chain for any
+            # query variable without resampling
+            cache_key = self._get_cache_key(observed_vals)
+
+            # Entries for an older version of the network can never be hit again, so drop them right away
+            if self._cache_version != self.bayes_net.version:
+                self._cache_version = self.bayes_net.version
+                self.cache.clear()
+
+            accumulator = self.cache.get(cache_key)
+
+            if accumulator is None:
+                # The stopping rule is applied to every latent node (not just this query's variables), since a later
+                # query may ask for any of them
+                latent_names = [compiled_net.node_names[node_idx] for node_idx in latent_idxs]
+                accumulator = CountAccumulator(compiled_net, node_names)
+                self._run(compiled_net, latent_idxs, observed_vals, accumulator, latent_names)
+                self.cache.put(cache_key, accumulator)
+
+        # The counts behind the estimate (fresh or cached), e.g. for their ESS and MCSE
+        self.accumulator = accumulator
+        self.n_samples_used = accumulator.n_samples
+
+        estimated_probs = []
+
+        for var_in_question in vars_in_question:
+            for possible_val, prob in accumulator.get_probs(var_in_question).items():
+                estimated_probs.append(f'{var_in_question} = {possible_val}: {prob}')
+
+        return estimated_probs
+
+    def cache_info(self) -> Dict[str, int]:
+        if self.cache is None:
+            return {'hits': 0, 'misses': 0, 'size': 0, 'max_size': 0}
+
+        return {'hits': self.cache.hits, 'misses': self.cache.misses, 'size': len(self.cache),
+                'max_size': self.cache.max_size}
+
+    def _get_cache_key(self, observed_vals: Dict[str, object]) -> tuple:
+        # Evidence is canonicalized (order-independent); the network version invalidates entries whenever add_node or
+        # add_edge changes the network, and the run settings are included so changing them never returns stale results
+        evidence = tuple(sorted((node_name, str(val)) for node_name, val in observed_vals.items()))
+
+        return (self.bayes_net.version, evidence, self.n_samples, self.n_chains, self.burn_in_period, self.target_ess,
+                self.target_mcse, self.check_every)
+
+    def sample_draws(self, observed_vals: Dict[str, object]) -> pd.DataFrame:
+        # Materializes the full table of raw draws (one row per sample, one column per node)
+        node_names = self.bayes_net.get_node_names()
+
+        for observed_var in observed_vals.keys():
+            if observed_var not in node_names:
+                raise Exception(f'Observed variable {observed_var} is not in the network')
+
+        compiled_net = self.bayes_net.compile()
+        latent_idxs = [compiled_net.node_idx[node.name] for node in self.bayes_net.make_schedule(observed_vals)]
+        accumulator = DrawAccumulator(compiled_net)
+        self._run(compiled_net, latent_idxs, observed_vals, accumulator, [])
+        self.n_samples_used = accumulator.n_samples
+
+        return accumulator.to_frame()
+
+    def store_draws(self, observed_vals: Dict[str, object], path: str, chunk_size: int = 4096) -> SampleStore:
+        # Same run as sample_draws, but the integer-coded draws are written to memory-mapped files under path as they
+        # are made, so the table never has to fit in memory; returns a lazy reader over them
+        node_names = self.bayes_net.get_node_names()
+
+        for observed_var in observed_vals.keys():
+            if observed_var not in node_names:
+                raise Exception(f'Observed variable {observed_var} is not in the network')
+
+        compiled_net = self.bayes_net.compile()
+        latent_idxs = [compiled_net.node_idx[node.name] for node in self.bayes_net.make_schedule(observed_vals)]
+
+        # With several chains every sweep adds one draw per chain, so the last sweep can overshoot n_samples
+        capacity = -(-self.n_samples // self.n_chains) * self.n_chains
+        store = SampleStore.create(path, compiled_net, capacity)
+        writer = store.get_writer(chunk_size)
+        self._run(compiled_net, latent_idxs, observed_vals, writer, [])
+        writer.flush()
+        store.set_n_samples(writer.n_samples)
+        self.n_samples_used = writer.n_samples
+
+        return store
+
+    def _run(self, compiled_net: CompiledBayesNet, latent_idxs: List[int], observed_vals: Dict[str, object],
+             accumulator, stopping_vars: List[str]) -> None:
+        if self.n_chains > 1:
+            self._run_chains(compiled_net, latent_idxs, observed_vals, accumulator, stopping_vars)
+
+        else:
+            self._run_chain(compiled_net, latent_idxs, observed_vals, accumulator, stopping_vars)
+
+    def _is_converged(self, accumulator, stopping_vars: List[str]) -> bool:
+        if (self.target_ess is None and self.target_mcse is None) or len(stopping_vars) == 0:
+            return False
+
+        for var_name in stopping_vars:
+            if self.target_ess is not None and not np.all(accumulator.get_ess(var_name) >= self.target_ess):
+                return False
+
+            if self.target_mcse is not None and not np.all(accumulator.get_mcse(var_name) <= self.target_mcse):
+                return False
+
+        return True
+
+    def _run_chain(self, compiled_net: CompiledBayesNet, latent_idxs: List[int], observed_vals: Dict[str, object],
+                   accumulator, stopping_vars: List[str]) -> None:
         var_vals = {}
 
         for node_name, node in self.bayes_net.nodes.items():
@@ -30,25 +174,51 @@ class GibbsSampler:
             else:
                 var_vals[node_name] = np.random.choice(node.possible_vals)
 
+        state = compiled_net.encode(var_vals)
+
+        for _ in range(self.burn_in_period):
+            compiled_net.run_simulation(state, latent_idxs)
+
+        # The stopping rule is only checked every check_every samples, so its cost is negligible
+        next_check = self.check_every
+
         for _ in range(self.n_samples):
-            sampled_vals = self.bayes_net.run_simulation(var_vals, observed_vals)
-            new_row = [sampled_vals[node_name] for node_name in node_names]
-            table.append(new_row)
-            var_vals = sampled_vals
+            accumulator.update(compiled_net.run_simulation(state, latent_idxs))
 
-        table = pd.DataFrame(table, columns=node_names)
-        assert table.shape == (self.n_samples, len(node_names))
+            if accumulator.n_samples >= next_check:
+                next_check += self.check_every
 
-        estimated_probs = []
+                if self._is_converged(accumulator, stopping_vars):
+                    break
 
-        for var_in_question in vars_in_question:
-            possible_var_vals = self.bayes_net.nodes[var_in_question].possible_vals
+    def _run_chains(self, compiled_net: CompiledBayesNet, latent_idxs: List[int], observed_vals: Dict[str, object],
+                    accumulator, stopping_vars: List[str]) -> None:
+        # Advance n_chains independent chains in lockstep as a (n_chains x n_nodes) state matrix; n_samples is split
+        # across the chains, so each chain only runs ceil(n_samples / n_chains) sweeps (after the burn-in)
+        n_sweeps = -(-self.n_samples // self.n_chains)
+        states = self._get_chain_starts(compiled_net, observed_vals)
 
-            for possible_val in possible_var_vals:
-                n_samples = len(table[table[var_in_question] == possible_val])
-                prob = n_samples / self.n_samples
-                estimated_probs.append(f'{var_in_question} = {possible_val}: {prob}')
+        for _ in range(self.burn_in_period):
+            compiled_net.run_simulation_chains(states, latent_idxs)
 
-        return estimated_probs
+        next_check = self.check_every
+
+        for _ in range(n_sweeps):
+            accumulator.update_chains(compiled_net.run_simulation_chains(states, latent_idxs))
+
+            if accumulator.n_samples >= next_check:
+                next_check = (accumulator.n_samples // self.check_every + 1) * self.check_every
+
+                if self._is_converged(accumulator, stopping_vars):
+                    break
+
+    def _get_chain_starts(self, compiled_net: CompiledBayesNet, observed_vals: Dict[str, object]) -> np.ndarray:
+        # Each chain starts from a forward sample with the evidence clamped, resampled by its likelihood weight, so the
+        # starting states are already roughly distributed like the posterior instead of uniformly (which puts half of
+        # the chains on a value such as Burglary = True that the posterior almost rules out)
+        states, weights = LikelihoodWeightingSampler.sample(compiled_net, observed_vals, self.n_chains)
 
+        if weights.sum() > 0:
+            states = states[np.random.choice(self.n_chains, size=self.n_chains, p=weights / weights.sum())]
 
+        return states
@@ -0,0 +1,65 @@
+from bayes_net import BayesNetDiscreteNode, BayesNet
+from gibbs_sampler import GibbsSampler
+import numpy as np
+
+N_SAMPLES = 2000
+
+burglary_node = BayesNetDiscreteNode('B', ['True', 'False'], {(): [0.001, 1 - 0.001]})
+earthquake_node = BayesNetDiscreteNode('E', ['True', 'False'], {(): [0.002, 1 - 0.002]})
+alarm_node = BayesNetDiscreteNode('A', ['True', 'False'], {('True', 'True'): [0.95, 1 - 0.95],
+                                                           ('True', 'False'): [0.94, 1 - 0.94],
+                                                           ('False', 'True'): [0.29, 1 - 0.29],
+                                                           ('False', 'False'): [0.001, 1 - 0.001]})
+john_node = BayesNetDiscreteNode('J', ['True', 'False'], {('True',): [0.90, 1 - 0.90], ('False',): [0.05, 1 - 0.05]})
+mary_node = BayesNetDiscreteNode('M', ['True', 'False'], {('True',): [0.70, 1 - 0.70], ('False',): [0.01, 1 - 0.01]})
+
+bayes_net = BayesNet()
+bayes_net.add_node(burglary_node)
+bayes_net.add_node(earthquake_node)
+bayes_net.add_node(alarm_node)
+bayes_net.add_node(john_node)
+bayes_net.add_node(mary_node)
+bayes_net.add_edge(burglary_node.name, alarm_node.name)
+bayes_net.add_edge(earthquake_node.name, alarm_node.name)
+bayes_net.add_edge(alarm_node.name, john_node.name)
+bayes_net.add_edge(alarm_node.name, mary_node.name)
+
+np.random.seed(0)
+observed_vals = {john_node.name: 'True', mary_node.name: 'False'}
+
+# The schedule is exactly the latent nodes, in network order
+schedule = bayes_net.make_schedule(observed_vals)
+
+print(f'Schedule = {[node.name for node in schedule]}')
+print(f'The schedule holds exactly the latent nodes (should be "True"): '
+      f'{[node.name for node in schedule] == [burglary_node.name, earthquake_node.name, alarm_node.name]}')
+
+
+# Observed nodes must never be sampled: make their get_sample fail, then sweep with the dict-based sampler
+def never_called(var_vals):
+    raise Exception('An observed node was sampled')
+
+
+for node_name in observed_vals:
+    bayes_net.nodes[node_name].get_sample = never_called
+
+var_vals = {node_name: 'True' for node_name in bayes_net.get_node_names()}
+observed_untouched = True
+
+for _ in range(N_SAMPLES):
+    bayes_net.run_simulation(var_vals, observed_vals)
+    observed_untouched = observed_untouched and all(var_vals[name] == val for name, val in observed_vals.items())
+
+for node_name in observed_vals:
+    del bayes_net.nodes[node_name].get_sample
+
+print(f'Sweeps never sample or change the observed nodes (should be "True"): {observed_untouched}')
+
+# Same for the compiled sweeps, single- and multi-chain: every draw keeps the observed values
+observed_constant = True
+
+for n_chains in [1, 100]:
+    draws = GibbsSampler(bayes_net, N_SAMPLES, n_chains=n_chains).sample_draws(observed_vals)
+    observed_constant = observed_constant and all((draws[name] == val).all() for name, val in observed_vals.items())
+
+print(f'Every compiled draw keeps the observed values (should be "True"): {observed_constant}')
@@ -0,0 +1,82 @@
+from bayes_net import BayesNetDiscreteNode, BayesNet
+from gibbs_sampler import GibbsSampler
+import numpy as np
+from variable_elimination import VariableElimination
+
+MAX_SAMPLES = 200000
+TARGET_ESS = 2000
+TARGET_MCSE = 0.005
+
+burglary_node = BayesNetDiscreteNode('B', ['True', 'False'], {(): [0.001, 1 - 0.001]})
+earthquake_node = BayesNetDiscreteNode('E', ['True', 'False'], {(): [0.002, 1 - 0.002]})
+alarm_node = BayesNetDiscreteNode('A', ['True', 'False'], {('True', 'True'): [0.95, 1 - 0.95],
+                                                           ('True', 'False'): [0.94, 1 - 0.94],
+                                                           ('False', 'True'): [0.29, 1 - 0.29],
+                                                           ('False', 'False'): [0.001, 1 - 0.001]})
+john_node = BayesNetDiscreteNode('J', ['True', 'False'], {('True',): [0.90, 1 - 0.90], ('False',): [0.05, 1 - 0.05]})
+mary_node = BayesNetDiscreteNode('M', ['True', 'False'], {('True',): [0.70, 1 - 0.70], ('False',): [0.01, 1 - 0.01]})
+
+bayes_net = BayesNet()
+bayes_net.add_node(burglary_node)
+bayes_net.add_node(earthquake_node)
+bayes_net.add_node(alarm_node)
+bayes_net.add_node(john_node)
+bayes_net.add_node(mary_node)
+bayes_net.add_edge(burglary_node.name, alarm_node.name)
+bayes_net.add_edge(earthquake_node.name, alarm_node.name)
+bayes_net.add_edge(alarm_node.name, john_node.name)
+bayes_net.add_edge(alarm_node.name, mary_node.name)
+
+np.random.seed(0)
+exact = VariableElimination(bayes_net)
+observed_vals = {mary_node.name: 'True'}
+
+
+def check_run(gibbs: GibbsSampler, var_in_question: str, target_mcse: float = TARGET_MCSE) -> bool:
+    # The run that answered the query (fresh or cached) must meet both targets for the query variable, and its
+    # estimate must be within a few standard errors of the exact answer
+    estimate = gibbs.make_estimate([var_in_question], observed_vals)
+    accumulator = gibbs.accumulator
+    estimated_probs = np.array([float(prob.split(': ')[1]) for prob in estimate])
+    exact_probs = exact.get_distribution(var_in_question, observed_vals)
+    ess, mcse = accumulator.get_ess(var_in_question), accumulator.get_mcse(var_in_question)
+    meets_targets = bool(np.all(ess >= TARGET_ESS) and (target_mcse is None or np.all(mcse <= target_mcse)))
+    agrees = bool(np.all(np.abs(estimated_probs - exact_probs) < 4 * mcse + 1e-3))
+
+    print(f'P({var_in_question} | {observed_vals}): exact = {np.round(exact_probs, 4)}, estimate = '
+          f'{np.round(estimated_probs, 4)}, samples = {gibbs.n_samples_used}, ESS = {np.round(ess)}, MCSE = '
+          f'{np.round(mcse, 4)}, meets targets = {meets_targets}, agrees = {agrees}')
+
+    return meets_targets and agrees
+
+
+all_ok = True
+
+# Without the cache, every query is its own run, stopped on its own variable
+for var_in_question in [john_node.name, burglary_node.name, alarm_node.name]:
+    all_ok = check_run(GibbsSampler(bayes_net, MAX_SAMPLES, target_ess=TARGET_ESS, target_mcse=TARGET_MCSE),
+                       var_in_question) and all_ok
+
+# With the cache, the first query's run is reused for the later ones with the same evidence, so it has to meet the
+# targets for every variable, not just the one it was first asked about (with an ESS target alone, J is done well
+# before B is)
+gibbs = GibbsSampler(bayes_net, MAX_SAMPLES, cache_size=8, target_ess=TARGET_ESS)
+
+for var_in_question in [john_node.name, burglary_node.name, alarm_node.name, earthquake_node.name]:
+    all_ok = check_run(gibbs, var_in_question, None) and all_ok
+
+print(f'\nCache info: {gibbs.cache_info()}')
+print(f'Every stopped run meets its targets and agrees with variable elimination (should be "True"): {all_ok}')
+
+# B = True is rare given J = True, M = False (P ~ 0.005), so early batches often contain no draw of it. A value that
+# has never been drawn has no variance estimate yet and must not count as converged, so a loose target checked often
+# should never stop with an estimate of exactly 0
+rare_evidence = {john_node.name: 'True', mary_node.name: 'False'}
+rare_estimates = []
+
+for seed in range(20):
+    np.random.seed(seed)
+    gibbs = GibbsSampler(bayes_net, MAX_SAMPLES, target_ess=200, check_every=100)
+    rare_estimates.append(float(gibbs.make_estimate([burglary_node.name], rare_evidence)[0].split(': ')[1]))
+
+print(f'Stopped runs never miss the rare value B = True (should be "True"): {min(rare_estimates) > 0}')
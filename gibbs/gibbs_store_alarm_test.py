@@ -0,0 +1,60 @@
+from bayes_net import BayesNetDiscreteNode, BayesNet
+from gibbs_sampler import GibbsSampler
+import numpy as np
+import os
+from sample_store import SampleStore
+import tempfile
+from variable_elimination import VariableElimination
+
+N_SAMPLES = 50000
+
+burglary_node = BayesNetDiscreteNode('B', ['True', 'False'], {(): [0.001, 1 - 0.001]})
+earthquake_node = BayesNetDiscreteNode('E', ['True', 'False'], {(): [0.002, 1 - 0.002]})
+alarm_node = BayesNetDiscreteNode('A', ['True', 'False'], {('True', 'True'): [0.95, 1 - 0.95],
+                                                           ('True', 'False'): [0.94, 1 - 0.94],
+                                                           ('False', 'True'): [0.29, 1 - 0.29],
+                                                           ('False', 'False'): [0.001, 1 - 0.001]})
+john_node = BayesNetDiscreteNode('J', ['True', 'False'], {('True',): [0.90, 1 - 0.90], ('False',): [0.05, 1 - 0.05]})
+mary_node = BayesNetDiscreteNode('M', ['True', 'False'], {('True',): [0.70, 1 - 0.70], ('False',): [0.01, 1 - 0.01]})
+
+bayes_net = BayesNet()
+bayes_net.add_node(burglary_node)
+bayes_net.add_node(earthquake_node)
+bayes_net.add_node(alarm_node)
+bayes_net.add_node(john_node)
+bayes_net.add_node(mary_node)
+bayes_net.add_edge(burglary_node.name, alarm_node.name)
+bayes_net.add_edge(earthquake_node.name, alarm_node.name)
+bayes_net.add_edge(alarm_node.name, john_node.name)
+bayes_net.add_edge(alarm_node.name, mary_node.name)
+
+# store_draws writes the same draws as sample_draws (for the same seed) to memory-mapped files; a store reopened from
+# its path has to give back exactly the in-memory table, and its frequencies should agree with the exact answer
+exact = VariableElimination(bayes_net)
+observed_vals = {john_node.name: 'True', mary_node.name: 'True'}
+all_identical, all_close = True, True
+
+with tempfile.TemporaryDirectory() as directory:
+    for n_chains, chunk_size in [(1, 4096), (1, 1000), (100, 4096)]:
+        gibbs = GibbsSampler(bayes_net, N_SAMPLES, n_chains=n_chains)
+
+        np.random.seed(0)
+        simulation_table = gibbs.sample_draws(observed_vals)
+        np.random.seed(0)
+        path = os.path.join(directory, f'store_{n_chains}_{chunk_size}')
+        gibbs.store_draws(observed_vals, path, chunk_size)
+
+        store = SampleStore(path)
+        is_identical = store.n_samples == len(simulation_table) and store.to_frame().equals(simulation_table)
+        all_identical = all_identical and is_identical
+
+        for var_in_question in [burglary_node.name, alarm_node.name]:
+            store_probs = np.bincount(store.get_codes(var_in_question), minlength=2) / store.n_samples
+            all_close = all_close and np.allclose(store_probs, exact.get_distribution(var_in_question, observed_vals),
+                                                  atol=0.02)
+
+        print(f'{n_chains} chain(s), chunk size {chunk_size}: {store.n_samples} draws stored as {store.dtype}, '
+              f'identical to the in-memory table = {is_identical}')
+
+print(f'\nStored draws are identical to the in-memory draws (should be "True"): {all_identical}')
+print(f'Stored draws agree with variable elimination (should be "True"): {all_close}')
@@ -0,0 +1,79 @@
+from bayes_net import BayesNet, CompiledBayesNet
+import numpy as np
+from typing import Dict, List, Tuple
+
+
+class LikelihoodWeightingSampler:
+    def __init__(self, bayes_net: BayesNet, n_samples: int, batch_size: int = 100000) -> None:
+        self.bayes_net = bayes_net
+        self.n_samples = n_samples
+        self.batch_size = batch_size
+        self.effective_sample_size = None
+
+    def make_estimate(self, vars_in_question: List[str], observed_vals: Dict[str, object]) -> List[str]:
+        node_names = self.bayes_net.get_node_names()
+
+        for var_in_question in vars_in_question:
+            if var_in_question not in node_names:
+                raise Exception(f'Query variable {var_in_question} is not in the network')
+
+        for observed_var in observed_vals.keys():
+            if observed_var not in node_names:
+                raise Exception(f'Observed variable {observed_var} is not in the network')
+
+        compiled_net = self.bayes_net.compile()
+        query_idxs = [compiled_net.node_idx[var_in_question] for var_in_question in vars_in_question]
+        weighted_counts = [np.zeros(compiled_net.cards[node_idx]) for node_idx in query_idxs]
+        total_weight, total_squared_weight = 0.0, 0.0
+
+        # Samples are drawn in batches so memory is bounded by batch_size, not n_samples
+        for batch_start in range(0, self.n_samples, self.batch_size):
+            n_batch = min(self.batch_size, self.n_samples - batch_start)
+            states, weights = self.sample(compiled_net, observed_vals, n_batch)
+
+            for i, node_idx in enumerate(query_idxs):
+                weighted_counts[i] += np.bincount(states[:, node_idx], weights=weights,
+                                                  minlength=compiled_net.cards[node_idx])
+
+            total_weight += weights.sum()
+            total_squared_weight += np.square(weights).sum()
+
+        if total_weight == 0:
+            raise Exception('Every sample has zero weight; the evidence has zero probability under the network')
+
+        # Kish's effective sample size of the weights; a small value means the evidence is unlikely under the prior
+        self.effective_sample_size = total_weight ** 2 / total_squared_weight
+
+        estimated_probs = []
+
+        for var_in_question, node_idx, counts in zip(vars_in_question, query_idxs, weighted_counts):
+            for possible_val, weight in zip(compiled_net.possible_vals[node_idx], counts):
+                estimated_probs.append(f'{var_in_question} = {possible_val}: {weight / total_weight}')
+
+        return estimated_probs
+
+    @staticmethod
+    def sample(compiled_net: CompiledBayesNet, observed_vals: Dict[str, object],
+               n_samples: int) -> Tuple[np.ndarray, np.ndarray]:
+        # Draw n_samples whole-network samples at once, visiting the nodes in topological order; observed nodes are
+        # clamped to their values and multiply the weights by their likelihood instead of being sampled. With no
+        # evidence this is plain forward sampling (every weight is 1)
+        evidence = {compiled_net.node_idx[node_name]: compiled_net.val_idx[compiled_net.node_idx[node_name]][val]
+                    for node_name, val in observed_vals.items()}
+        states = np.zeros((n_samples, compiled_net.n_nodes), dtype=np.int64)
+        weights = np.ones(n_samples)
+
+        for node_idx in compiled_net.topological_order:
+            rows = states[:, compiled_net.parents[node_idx]].dot(compiled_net.strides[node_idx])
+            cpt = compiled_net.cpts[node_idx]
+
+            if node_idx in evidence:
+                states[:, node_idx] = evidence[node_idx]
+                weights *= cpt[rows, evidence[node_idx]]
+
+            else:
+                cdfs = np.cumsum(cpt[rows], axis=1)
+                rands = np.random.random(n_samples) * cdfs[:, -1]
+                states[:, node_idx] = np.minimum((cdfs <= rands[:, None]).sum(axis=1), compiled_net.cards[node_idx] - 1)
+
+        return states, weights
@@ -0,0 +1,67 @@
+from bayes_net import BayesNetDiscreteNode, BayesNet
+from likelihood_weighting import LikelihoodWeightingSampler
+import numpy as np
+from variable_elimination import VariableElimination
+
+N_SAMPLES = 1000000
+
+burglary_node = BayesNetDiscreteNode('B', ['True', 'False'], {(): [0.001, 1 - 0.001]})
+earthquake_node = BayesNetDiscreteNode('E', ['True', 'False'], {(): [0.002, 1 - 0.002]})
+alarm_node = BayesNetDiscreteNode('A', ['True', 'False'], {('True', 'True'): [0.95, 1 - 0.95],
+                                                           ('True', 'False'): [0.94, 1 - 0.94],
+                                                           ('False', 'True'): [0.29, 1 - 0.29],
+                                                           ('False', 'False'): [0.001, 1 - 0.001]})
+john_node = BayesNetDiscreteNode('J', ['True', 'False'], {('True',): [0.90, 1 - 0.90], ('False',): [0.05, 1 - 0.05]})
+mary_node = BayesNetDiscreteNode('M', ['True', 'False'], {('True',): [0.70, 1 - 0.70], ('False',): [0.01, 1 - 0.01]})
+
+bayes_net = BayesNet()
+bayes_net.add_node(burglary_node)
+bayes_net.add_node(earthquake_node)
+bayes_net.add_node(alarm_node)
+bayes_net.add_node(john_node)
+bayes_net.add_node(mary_node)
+bayes_net.add_edge(burglary_node.name, alarm_node.name)
+bayes_net.add_edge(earthquake_node.name, alarm_node.name)
+bayes_net.add_edge(alarm_node.name, john_node.name)
+bayes_net.add_edge(alarm_node.name, mary_node.name)
+
+np.random.seed(0)
+exact = VariableElimination(bayes_net)
+likelihood_weighting = LikelihoodWeightingSampler(bayes_net, N_SAMPLES)
+
+# No evidence is plain forward sampling (every weight is 1), then the usual queries with evidence
+queries = [(alarm_node.name, {}),
+           (john_node.name, {}),
+           (burglary_node.name, {john_node.name: 'True', mary_node.name: 'True'}),
+           (alarm_node.name, {john_node.name: 'True', mary_node.name: 'True'}),
+           (earthquake_node.name, {john_node.name: 'True', mary_node.name: 'True'}),
+           (burglary_node.name, {john_node.name: 'True', mary_node.name: 'False'}),
+           (burglary_node.name, {john_node.name: 'True'}),
+           (burglary_node.name, {mary_node.name: 'True'})]
+all_close = True
+
+for var_in_question, observed_vals in queries:
+    estimate = likelihood_weighting.make_estimate([var_in_question], observed_vals)
+    estimated_probs = np.array([float(prob.split(': ')[1]) for prob in estimate])
+    exact_probs = exact.get_distribution(var_in_question, observed_vals)
+
+    # Within about four standard errors, where the error shrinks with the effective (not the raw) sample size
+    ess = likelihood_weighting.effective_sample_size
+    tolerance = 4 * np.sqrt(exact_probs * (1 - exact_probs) / ess) + 1e-6
+    is_close = bool(np.all(np.abs(estimated_probs - exact_probs) < tolerance))
+    all_close = all_close and is_close
+
+    print(f'P({var_in_question} | {observed_vals}): exact = {np.round(exact_probs, 5)}, likelihood weighting = '
+          f'{np.round(estimated_probs, 5)}, effective sample size = {ess:.0f}, close = {is_close}')
+
+print(f'\nLikelihood weighting agrees with variable elimination (should be "True"): {all_close}')
+
+# Forward samples of the whole network: the joint frequency of every (B, E) pair should match the prior
+compiled_net = bayes_net.compile()
+states, weights = LikelihoodWeightingSampler.sample(compiled_net, {}, N_SAMPLES)
+burglary_idx, earthquake_idx = compiled_net.node_idx[burglary_node.name], compiled_net.node_idx[earthquake_node.name]
+joint_counts = np.bincount(states[:, burglary_idx] * 2 + states[:, earthquake_idx], minlength=4) / N_SAMPLES
+prior_joint = np.outer([0.001, 0.999], [0.002, 0.998]).ravel()
+
+print(f'Forward samples match the prior of (B, E) (should be "True"): '
+      f'{np.all(weights == 1) and np.allclose(joint_counts, prior_joint, atol=4 * np.sqrt(0.25 / N_SAMPLES))}')
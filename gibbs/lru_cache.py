@@ -0,0 +1,37 @@
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, max_size: int) -> None:
+        # Least-recently-used eviction once more than max_size entries are stored
+        if max_size < 1:
+            raise Exception(f'Cache size must be at least 1; got {max_size}')
+
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        if key not in self.entries:
+            self.misses += 1
+
+            return default
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+
+        return self.entries[key]
+
+    def put(self, key, value) -> None:
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -0,0 +1,139 @@
+from bayes_net import CompiledBayesNet
+import json
+import numpy as np
+from numpy.lib.format import open_memmap
+import os
+import pandas as pd
+from typing import List
+
+
+class SampleStore:
+    # Integer-coded draws of a run kept on disk instead of in memory: one .npy file of codes per node, plus a small
+    # JSON file with the node names, their possible values and the number of draws. Opening a store is lazy; columns
+    # are memory-mapped on first access and returned as zero-copy (read-only) views, so they can be analyzed from
+    # another process without loading or re-serializing the whole table
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+        with open(os.path.join(path, 'metadata.json')) as file:
+            metadata = json.load(file)
+
+        self.var_names = metadata['var_names']
+        self.possible_vals = metadata['possible_vals']
+        self.capacity = metadata['capacity']
+        self.dtype = np.dtype(metadata['dtype'])
+        self.n_samples = metadata['n_samples']
+        self._codes = {}
+
+    @staticmethod
+    def create(path: str, compiled_net: CompiledBayesNet, capacity: int) -> 'SampleStore':
+        # Preallocate every column file (sparse on most filesystems, so unused capacity costs no disk space)
+        os.makedirs(path, exist_ok=True)
+        dtype = np.int8 if compiled_net.cards.max(initial=0) <= 128 else np.int64
+
+        for node_idx in range(compiled_net.n_nodes):
+            column = open_memmap(SampleStore._get_column_path(path, node_idx), mode='w+', dtype=dtype,
+                                 shape=(capacity,))
+            del column
+
+        SampleStore._write_metadata(path, {
+            'var_names': list(compiled_net.node_names),
+            'possible_vals': [list(possible_vals) for possible_vals in compiled_net.possible_vals],
+            'capacity': capacity, 'dtype': np.dtype(dtype).str, 'n_samples': 0})
+
+        return SampleStore(path)
+
+    @staticmethod
+    def _get_column_path(path: str, node_idx: int) -> str:
+        # Files are named by position, so any node name is safe to use
+        return os.path.join(path, f'column_{node_idx}.npy')
+
+    @staticmethod
+    def _write_metadata(path: str, metadata: dict) -> None:
+        tmp_path = os.path.join(path, 'metadata.json.tmp')
+
+        with open(tmp_path, 'w') as file:
+            json.dump(metadata, file)
+
+        os.replace(tmp_path, os.path.join(path, 'metadata.json'))
+
+    def set_n_samples(self, n_samples: int) -> None:
+        # Record how many draws were written (called once the writer is done)
+        self.n_samples = int(n_samples)
+        self._write_metadata(self.path, {'var_names': self.var_names, 'possible_vals': self.possible_vals,
+                                         'capacity': self.capacity, 'dtype': self.dtype.str,
+                                         'n_samples': self.n_samples})
+
+    def get_writer(self, chunk_size: int = 4096) -> 'SampleWriter':
+        return SampleWriter(self.path, len(self.var_names), self.capacity, self.dtype, chunk_size)
+
+    def get_codes(self, var_name: str) -> np.ndarray:
+        # Value index of every draw (positions in possible_vals), as a view on the memory-mapped file
+        if var_name not in self._codes:
+            node_idx = self.var_names.index(var_name)
+            self._codes[var_name] = np.load(self._get_column_path(self.path, node_idx), mmap_mode='r')
+
+        return self._codes[var_name][:self.n_samples]
+
+    def __getitem__(self, var_name: str) -> np.ndarray:
+        # The draws as values (this one is a copy, since values are not stored on disk)
+        possible_vals = np.array(self.possible_vals[self.var_names.index(var_name)], dtype=object)
+
+        return possible_vals[self.get_codes(var_name)]
+
+    def to_frame(self) -> pd.DataFrame:
+        # Materializes the table (same layout as GibbsSampler.sample_draws); only for stores that fit in memory
+        return pd.DataFrame({var_name: self[var_name] for var_name in self.var_names}, columns=self.var_names)
+
+
+class SampleWriter:
+    # Accumulator (same update/update_chains/n_samples interface as the ones in accumulator.py) writing the draws of
+    # a SampleStore: states are gathered in a small buffer and copied into the memory-mapped columns a chunk at a time
+    def __init__(self, path: str, n_nodes: int, capacity: int, dtype: np.dtype, chunk_size: int = 4096) -> None:
+        self.path = path
+        self.capacity = capacity
+        self.chunk_size = chunk_size
+        self.buffer = np.empty((chunk_size, n_nodes), dtype=dtype)
+        self.n_buffered = 0
+        self.n_samples = 0
+        self.columns = [open_memmap(SampleStore._get_column_path(path, node_idx), mode='r+')
+                        for node_idx in range(n_nodes)]
+
+    def update(self, state: List[int]) -> None:
+        if self.n_samples == self.capacity:
+            raise Exception(f'Sample store {self.path} is full')
+
+        self.buffer[self.n_buffered] = state
+        self.n_buffered += 1
+        self.n_samples += 1
+
+        if self.n_buffered == self.chunk_size:
+            self.flush()
+
+    def update_chains(self, states: np.ndarray) -> None:
+        # One row per chain; blocks bigger than the buffer go straight to the columns
+        if self.n_samples + states.shape[0] > self.capacity:
+            raise Exception(f'Sample store {self.path} is full')
+
+        if self.n_buffered + states.shape[0] > self.chunk_size:
+            self.flush()
+
+        if states.shape[0] > self.chunk_size:
+            self._write(states)
+
+        else:
+            self.buffer[self.n_buffered:self.n_buffered + states.shape[0]] = states
+            self.n_buffered += states.shape[0]
+
+        self.n_samples += states.shape[0]
+
+    def _write(self, rows: np.ndarray) -> None:
+        start = self.n_samples - self.n_buffered
+
+        for node_idx, column in enumerate(self.columns):
+            column[start:start + rows.shape[0]] = rows[:, node_idx]
+
+    def flush(self) -> None:
+        if self.n_buffered > 0:
+            self._write(self.buffer[:self.n_buffered])
+            self.n_buffered = 0
@@ -0,0 +1,201 @@
+from bayes_net import BayesNet, CompiledBayesNet
+from lru_cache import LRUCache
+import numpy as np
+from typing import Dict, List, Tuple
+
+
+class Factor:
+    def __init__(self, var_idxs: Tuple[int, ...], table: np.ndarray) -> None:
+        # One axis of the table per variable, in the order of var_idxs
+        self.var_idxs = tuple(var_idxs)
+        self.table = table
+
+    def multiply(self, other: 'Factor') -> 'Factor':
+        var_idxs = self.var_idxs + tuple(var_idx for var_idx in other.var_idxs if var_idx not in self.var_idxs)
+
+        return Factor(var_idxs, self._expand(var_idxs) * other._expand(var_idxs))
+
+    def _expand(self, var_idxs: Tuple[int, ...]) -> np.ndarray:
+        # Reorder the table's axes to follow var_idxs and add singleton axes for missing variables, so two factors
+        # can be multiplied with plain broadcasting
+        present = [var_idx for var_idx in var_idxs if var_idx in self.var_idxs]
+        table = np.transpose(self.table, [self.var_idxs.index(var_idx) for var_idx in present])
+        shape = [table.shape[present.index(var_idx)] if var_idx in present else 1 for var_idx in var_idxs]
+
+        return table.reshape(shape)
+
+    def sum_out(self, var_idx: int) -> 'Factor':
+        axis = self.var_idxs.index(var_idx)
+
+        return Factor(self.var_idxs[:axis] + self.var_idxs[axis + 1:], self.table.sum(axis=axis))
+
+    def reduce(self, evidence: Dict[int, int]) -> 'Factor':
+        # Fix the observed variables to their observed values (dropping those axes)
+        index = tuple(evidence[var_idx] if var_idx in evidence else slice(None) for var_idx in self.var_idxs)
+        var_idxs = tuple(var_idx for var_idx in self.var_idxs if var_idx not in evidence)
+
+        return Factor(var_idxs, self.table[index])
+
+
+class VariableElimination:
+    def __init__(self, bayes_net: BayesNet, cache_size: int = 128) -> None:
+        self.bayes_net = bayes_net
+        self._cache_version = None
+
+        # Each cache keeps at most cache_size entries (one per evidence set, observed-variable set or query), so a long
+        # stream of distinct queries cannot grow memory without bound
+        self._reduced_factors = LRUCache(cache_size)
+        self._elimination_orders = LRUCache(cache_size)
+        self._results = LRUCache(cache_size)
+
+    def make_estimate(self, vars_in_question: List[str], observed_vals: Dict[str, object]) -> List[str]:
+        node_names = self.bayes_net.get_node_names()
+
+        for var_in_question in vars_in_question:
+            if var_in_question not in node_names:
+                raise Exception(f'Query variable {var_in_question} is not in the network')
+
+        for observed_var in observed_vals.keys():
+            if observed_var not in node_names:
+                raise Exception(f'Observed variable {observed_var} is not in the network')
+
+        compiled_net = self.bayes_net.compile()
+        estimated_probs = []
+
+        for var_in_question in vars_in_question:
+            probs = self.get_distribution(var_in_question, observed_vals)
+            node_idx = compiled_net.node_idx[var_in_question]
+
+            for possible_val, prob in zip(compiled_net.possible_vals[node_idx], probs):
+                estimated_probs.append(f'{var_in_question} = {possible_val}: {prob}')
+
+        return estimated_probs
+
+    def get_distribution(self, var_in_question: str, observed_vals: Dict[str, object]) -> np.ndarray:
+        compiled_net = self.bayes_net.compile()
+
+        # Everything cached is only valid for the network structure it was computed with
+        if self._cache_version != self.bayes_net.version:
+            self._cache_version = self.bayes_net.version
+            self._reduced_factors.clear()
+            self._elimination_orders.clear()
+            self._results.clear()
+
+        evidence = {compiled_net.node_idx[node_name]: compiled_net.val_idx[compiled_net.node_idx[node_name]][val]
+                    for node_name, val in observed_vals.items()}
+        evidence_key = tuple(sorted(evidence.items()))
+        query_idx = compiled_net.node_idx[var_in_question]
+        result_key = (query_idx, evidence_key)
+
+        cached_probs = self._results.get(result_key)
+
+        if cached_probs is not None:
+            return cached_probs
+
+        if query_idx in evidence:
+            probs = np.zeros(compiled_net.cards[query_idx])
+            probs[evidence[query_idx]] = 1.0
+
+        else:
+            probs = self._eliminate(compiled_net, query_idx, evidence, evidence_key)
+
+        probs.setflags(write=False)
+        self._results.put(result_key, probs)
+
+        return probs
+
+    def _eliminate(self, compiled_net: CompiledBayesNet, query_idx: int, evidence: Dict[int, int],
+                   evidence_key: Tuple) -> np.ndarray:
+        # Nodes that are not ancestors of the query or the evidence sum to one and can be dropped entirely
+        relevant = self._get_ancestors(compiled_net, {query_idx} | set(evidence.keys()))
+
+        # CPT factors with the evidence already plugged in are shared by every query with the same evidence
+        reduced_factors = self._reduced_factors.get(evidence_key)
+
+        if reduced_factors is None:
+            reduced_factors = {}
+
+            for node_idx in range(compiled_net.n_nodes):
+                parent_idxs = tuple(compiled_net.parents[node_idx].tolist())
+                shape = tuple(compiled_net.cards[list(parent_idxs)].tolist()) + (int(compiled_net.cards[node_idx]),)
+                factor = Factor(parent_idxs + (node_idx,), compiled_net.cpts[node_idx].reshape(shape))
+                reduced_factors[node_idx] = factor.reduce(evidence)
+
+            self._reduced_factors.put(evidence_key, reduced_factors)
+
+        factors = [factor for node_idx, factor in reduced_factors.items() if node_idx in relevant]
+        hidden = sorted(relevant - {query_idx} - set(evidence.keys()))
+        order_key = (query_idx, tuple(sorted(evidence.keys())))
+
+        # The elimination order only depends on which variables are observed, not on their values
+        elimination_order = self._elimination_orders.get(order_key)
+
+        if elimination_order is None:
+            elimination_order = self._get_min_fill_order(factors, hidden)
+            self._elimination_orders.put(order_key, elimination_order)
+
+        for var_idx in elimination_order:
+            involved = [factor for factor in factors if var_idx in factor.var_idxs]
+            factors = [factor for factor in factors if var_idx not in factor.var_idxs]
+            product = involved[0]
+
+            for factor in involved[1:]:
+                product = product.multiply(factor)
+
+            factors.append(product.sum_out(var_idx))
+
+        result = Factor((), np.ones(()))
+
+        for factor in factors:
+            result = result.multiply(factor)
+
+        probs = result.table
+
+        return probs / probs.sum()
+
+    @staticmethod
+    def _get_ancestors(compiled_net: CompiledBayesNet, node_idxs: set) -> set:
+        ancestors, frontier = set(node_idxs), list(node_idxs)
+
+        while len(frontier) > 0:
+            for parent_idx in compiled_net.parents[frontier.pop()].tolist():
+                if parent_idx not in ancestors:
+                    ancestors.add(parent_idx)
+                    frontier.append(parent_idx)
+
+        return ancestors
+
+    @staticmethod
+    def _get_min_fill_order(factors: List[Factor], hidden: List[int]) -> List[int]:
+        # Greedy min-fill: repeatedly eliminate the variable whose removal adds the fewest new edges to the
+        # interaction graph (ties broken by fewest neighbors)
+        neighbors = {}
+
+        for factor in factors:
+            for var_idx in factor.var_idxs:
+                neighbors.setdefault(var_idx, set()).update(factor.var_idxs)
+
+        for var_idx in neighbors:
+            neighbors[var_idx].discard(var_idx)
+
+        order, remaining = [], set(hidden)
+
+        while len(remaining) > 0:
+            def fill_in(var_idx):
+                var_neighbors = list(neighbors.get(var_idx, ()))
+                n_fill = sum(1 for i, a in enumerate(var_neighbors) for b in var_neighbors[i + 1:]
+                             if b not in neighbors[a])
+
+                return n_fill, len(var_neighbors)
+
+            var_idx = min(sorted(remaining), key=fill_in)
+            var_neighbors = neighbors.pop(var_idx, set())
+
+            for a in var_neighbors:
+                neighbors[a].discard(var_idx)
+                neighbors[a].update(var_neighbors - {a})
+
+            order.append(var_idx)
+            remaining.remove(var_idx)
+
+        return order
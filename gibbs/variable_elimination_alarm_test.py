@@ -0,0 +1,63 @@
+from bayes_net import BayesNetDiscreteNode, BayesNet
+from gibbs_sampler import GibbsSampler
+import numpy as np
+import time
+from variable_elimination import VariableElimination
+
+N_SAMPLES = 10000
+
+burglary_node = BayesNetDiscreteNode('B', ['True', 'False'], {(): [0.001, 1 - 0.001]})
+earthquake_node = BayesNetDiscreteNode('E', ['True', 'False'], {(): [0.002, 1 - 0.002]})
+alarm_node = BayesNetDiscreteNode('A', ['True', 'False'], {('True', 'True'): [0.95, 1 - 0.95],
+                                                           ('True', 'False'): [0.94, 1 - 0.94],
+                                                           ('False', 'True'): [0.29, 1 - 0.29],
+                                                           ('False', 'False'): [0.001, 1 - 0.001]})
+john_node = BayesNetDiscreteNode('J', ['True', 'False'], {('True',): [0.90, 1 - 0.90], ('False',): [0.05, 1 - 0.05]})
+mary_node = BayesNetDiscreteNode('M', ['True', 'False'], {('True',): [0.70, 1 - 0.70], ('False',): [0.01, 1 - 0.01]})
+
+bayes_net = BayesNet()
+bayes_net.add_node(burglary_node)
+bayes_net.add_node(earthquake_node)
+bayes_net.add_node(alarm_node)
+bayes_net.add_node(john_node)
+bayes_net.add_node(mary_node)
+bayes_net.add_edge(burglary_node.name, alarm_node.name)
+bayes_net.add_edge(earthquake_node.name, alarm_node.name)
+bayes_net.add_edge(alarm_node.name, john_node.name)
+bayes_net.add_edge(alarm_node.name, mary_node.name)
+
+exact = VariableElimination(bayes_net)
+gibbs = GibbsSampler(bayes_net, N_SAMPLES)
+
+queries = [(burglary_node.name, {john_node.name: 'True', mary_node.name: 'True'}),
+           (alarm_node.name, {john_node.name: 'True', mary_node.name: 'True'}),
+           (earthquake_node.name, {john_node.name: 'True', mary_node.name: 'True'}),
+           (burglary_node.name, {john_node.name: 'False', mary_node.name: 'False'}),
+           (burglary_node.name, {john_node.name: 'True', mary_node.name: 'False'}),
+           (burglary_node.name, {john_node.name: 'True'}),
+           (burglary_node.name, {mary_node.name: 'True'})]
+
+for var_in_question, observed_vals in queries:
+    print(f'P({var_in_question} | {observed_vals}): exact = {exact.make_estimate([var_in_question], observed_vals)}, '
+          f'gibbs = {gibbs.make_estimate([var_in_question], observed_vals)}')
+
+# Textbook answer for P(Burglary = true | JohnCalls = true, MaryCalls = true)
+print(f'\nExact answer matches the textbook value (should be "True"): '
+      f'{np.isclose(exact.get_distribution(burglary_node.name, queries[0][1])[0], 0.284172, atol=1e-6)}')
+
+# Repeated queries with the same evidence are answered from the cache
+start_time = time.time()
+
+for _ in range(10000):
+    exact.get_distribution(burglary_node.name, queries[0][1])
+
+print(f'Average cached query time: {(time.time() - start_time) / 10000 * 1e6:.2f} microseconds')
+
+# A small cache stays within its size over many distinct queries, and evicted queries are recomputed to the same answer
+small_cache = VariableElimination(bayes_net, cache_size=2)
+small_cache_matches = all(np.allclose(small_cache.get_distribution(var_in_question, observed_vals),
+                                      exact.get_distribution(var_in_question, observed_vals))
+                          for _ in range(2) for var_in_question, observed_vals in queries)
+
+print(f'Small cache stays bounded and matches the default-size cache (should be "True"): '
+      f'{small_cache_matches and len(small_cache._results) <= 2 and len(small_cache._reduced_factors) <= 2}')
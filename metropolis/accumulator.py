@@ -0,0 +1,180 @@
+from bisect import bisect_right
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Tuple
+
+
+class P2Quantile:
+    # Streaming quantile estimate using the P-square algorithm (Jain & Chlamtac, 1985): five markers, O(1) memory
+    def __init__(self, p: float) -> None:
+        self.p = p
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired_positions = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def update(self, x: float) -> None:
+        heights, positions = self.heights, self.positions
+
+        # Until we have five observations, just keep them (sorted)
+        if len(heights) < 5:
+            heights.append(x)
+            heights.sort()
+
+            return
+
+        # Find the cell the new observation falls in, extending the extreme markers if needed
+        if x < heights[0]:
+            heights[0] = x
+            k = 0
+
+        elif x >= heights[4]:
+            heights[4] = x
+            k = 3
+
+        else:
+            k = bisect_right(heights, x) - 1
+
+        for i in range(k + 1, 5):
+            positions[i] += 1
+
+        for i in range(5):
+            self.desired_positions[i] += self.increments[i]
+
+        # Move the middle markers toward their desired positions
+        for i in (1, 2, 3):
+            d = self.desired_positions[i] - positions[i]
+
+            if (d >= 1 and positions[i + 1] - positions[i] > 1) or (d <= -1 and positions[i - 1] - positions[i] < -1):
+                d = 1 if d > 0 else -1
+                new_height = self._parabolic(i, d)
+
+                if not heights[i - 1] < new_height < heights[i + 1]:
+                    new_height = heights[i] + d * (heights[i + d] - heights[i]) / (positions[i + d] - positions[i])
+
+                heights[i] = new_height
+                positions[i] += d
+
+    def _parabolic(self, i: int, d: int) -> float:
+        heights, positions = self.heights, self.positions
+
+        right_slope = (heights[i + 1] - heights[i]) / (positions[i + 1] - positions[i])
+        left_slope = (heights[i] - heights[i - 1]) / (positions[i] - positions[i - 1])
+
+        return heights[i] + d / (positions[i + 1] - positions[i - 1]) * (
+            (positions[i] - positions[i - 1] + d) * right_slope + (positions[i + 1] - positions[i] - d) * left_slope)
+
+    def get_value(self) -> float:
+        if len(self.heights) < 5:
+            return float(np.quantile(self.heights, self.p)) if len(self.heights) > 0 else np.nan
+
+        return self.heights[2]
+
+    def get_state(self) -> Dict[str, list]:
+        return {'heights': list(self.heights), 'positions': list(self.positions),
+                'desired_positions': list(self.desired_positions)}
+
+    def set_state(self, state: Dict[str, list]) -> None:
+        self.heights = list(state['heights'])
+        self.positions = list(state['positions'])
+        self.desired_positions = list(state['desired_positions'])
+
+
+class RunningStats:
+    def __init__(self, quantiles: Tuple[float, ...] = ()) -> None:
+        # Welford's algorithm for the running mean/variance, plus one P-square sketch per requested quantile
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.quantiles = [P2Quantile(p) for p in quantiles]
+
+    def update(self, x: float) -> None:
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+        for quantile in self.quantiles:
+            quantile.update(x)
+
+    def get_variance(self) -> float:
+        return self.m2 / (self.n - 1) if self.n > 1 else np.nan
+
+    def get_summary(self) -> Dict[str, float]:
+        summary = {'n': self.n, 'mean': self.mean, 'var': self.get_variance(), 'min': self.min, 'max': self.max}
+
+        for quantile in self.quantiles:
+            summary[f'q{quantile.p:g}'] = quantile.get_value()
+
+        return summary
+
+    def get_state(self) -> dict:
+        return {'n': self.n, 'mean': self.mean, 'm2': self.m2, 'min': self.min, 'max': self.max,
+                'quantiles': [quantile.get_state() for quantile in self.quantiles]}
+
+    def set_state(self, state: dict) -> None:
+        self.n, self.mean, self.m2 = state['n'], state['mean'], state['m2']
+        self.min, self.max = state['min'], state['max']
+
+        for quantile, quantile_state in zip(self.quantiles, state['quantiles']):
+            quantile.set_state(quantile_state)
+
+
+class SummaryAccumulator:
+    def __init__(self, var_names: List[str], quantiles: Tuple[float, ...] = (0.025, 0.5, 0.975)) -> None:
+        # Constant-memory summaries of each tracked variable; updating is O(1) per variable per sample
+        self.var_names = list(var_names)
+        self.quantiles = tuple(quantiles)
+        self.stats = {var_name: RunningStats(quantiles) for var_name in self.var_names}
+        self.n_samples = 0
+
+    def update(self, var_vals: Dict[str, float]) -> None:
+        for var_name, stats in self.stats.items():
+            stats.update(var_vals[var_name])
+
+        self.n_samples += 1
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame([self.stats[var_name].get_summary() for var_name in self.var_names], index=self.var_names)
+
+    def get_state(self) -> dict:
+        # Everything needed to continue accumulating after a restart (see checkpoint.py)
+        return {'n_samples': self.n_samples,
+                'stats': {var_name: stats.get_state() for var_name, stats in self.stats.items()}}
+
+    def set_state(self, state: dict) -> None:
+        self.n_samples = state['n_samples']
+
+        for var_name, stats in self.stats.items():
+            stats.set_state(state['stats'][var_name])
+
+
+class TableAccumulator:
+    def __init__(self, var_names: List[str]) -> None:
+        # Keeps every raw draw; only use this when the caller actually wants the sample table
+        self.var_names = list(var_names)
+        self.table = []
+        self.n_samples = 0
+
+    def update(self, var_vals: Dict[str, float]) -> None:
+        self.table.append([var_vals[var_name] for var_name in self.var_names])
+        self.n_samples += 1
+
+    def to_frame(self) -> pd.DataFrame:
+        table = pd.DataFrame(self.table, columns=self.var_names)
+        assert table.shape == (self.n_samples, len(self.var_names))
+
+        return table
+
+    def get_state(self) -> dict:
+        # One array per column, so the draws so far are stored in binary form rather than as JSON
+        return {'n_samples': self.n_samples,
+                'columns': [np.array([row[i] for row in self.table]) for i in range(len(self.var_names))]}
+
+    def set_state(self, state: dict) -> None:
+        self.table = [list(row) for row in zip(*[column.tolist() for column in state['columns']])]
+        self.n_samples = state['n_samples']
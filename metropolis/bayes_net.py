@@ -1,20 +1,35 @@
-from copy import copy
+from conjugate import find_conjugate_update
 from distribution import Distribution
 import numpy as np
-from typing import Dict
+from operator import itemgetter
+from state_view import StateView
+from typing import Callable, Dict, List
 
 
 class BayesNetNode(object):
+    # Plate nodes hold fixed observations and are never sampled or stored in var_vals
+    is_plate = False
+
     def __init__(self, name: str, candidate_var: float) -> None:
         self.name = name
         self.candidate_var = candidate_var
         self.parents = []
         self.children = []
+        self.slot = None
+
+    def bind(self, slots: Dict[str, int], add_constant: Callable[[object], int]) -> None:
+        # Called by BayesNet.compile: the node's own position in the flat state, and its distribution's parameters
+        self.slot = slots.get(self.name, None)
+        self.distribution.bind(slots, add_constant)
 
     def get_prob(self, var_vals: Dict[str, object]) -> float:
         pass
 
-    def get_sample(self, var_vals: Dict[str, object]) -> object:
+    def get_state_prob(self, state: List[object]) -> float:
+        # Same as get_prob, on the flat state of a compiled network
+        pass
+
+    def get_sample(self, state: List[object], rng: np.random.Generator = None) -> object:
         pass
 
 
@@ -23,32 +38,113 @@ class BayesNetContinuousNode(BayesNetNode):
         BayesNetNode.__init__(self, name, candidate_var)
         self.distribution = distribution
 
+        # Exact draw from the node's closed-form conditional, set by make_schedule when conjugate updates are enabled
+        # and the node's prior is conjugate to all of its children (see conjugate.py); None means Metropolis
+        self.conjugate_update = None
+        self.reset_cache()
+        self.reset_acceptance()
+
+    def reset_acceptance(self) -> None:
+        # Metropolis acceptance bookkeeping (used by the sampler for proposal tuning and reporting)
+        self.n_proposals = 0
+        self.n_accepted = 0
+        self.last_accepted = False
+
+    def reset_cache(self, fixed_names=()) -> None:
+        # Log-likelihood of the node plus its children at the current value, and the Markov blanket values it was
+        # computed with; it stays valid until one of those values changes. Nodes in fixed_names (observed for the
+        # current run) cannot change, so they are left out of the blanket values that get compared
+        self._fixed_names = set(fixed_names)
+        self._blanket_names = None
+        self._blanket_getter = None
+        self._cached_blanket_vals = None
+        self._cached_log_likelihood = None
+
+    def bind(self, slots: Dict[str, int], add_constant: Callable[[object], int]) -> None:
+        BayesNetNode.bind(self, slots, add_constant)
+
+        # The blanket values are read straight from their slots, with one itemgetter call
+        blanket_slots = [slots[blanket_name] for blanket_name in self._get_blanket_names()]
+        self._blanket_getter = itemgetter(*blanket_slots) if len(blanket_slots) > 1 else None
+
+    def _get_blanket_names(self) -> List[str]:
+        # The node itself first, then its parents, children, and the children's other parents
+        if self._blanket_names is None:
+            blanket_names = [self.name] + [parent_node.name for parent_node in self.parents]
+
+            for child_node in self.children:
+                if not child_node.is_plate:
+                    blanket_names.append(child_node.name)
+
+                blanket_names.extend(parent_node.name for parent_node in child_node.parents)
+
+            self._blanket_names = [blanket_name for blanket_name in dict.fromkeys(blanket_names)
+                                   if blanket_name not in self._fixed_names]
+
+        return self._blanket_names
+
     def get_prob(self, var_vals: Dict[str, float]) -> float:
         return self.distribution.get_likelihood(self.name, var_vals)
 
-    def get_sample(self, var_vals: Dict[str, float]) -> float:
-        prev_sample = var_vals.get(self.name, None)
+    def get_state_prob(self, state: List[float]) -> float:
+        distribution = self.distribution
 
-        if prev_sample is None:
-            raise Exception(f'No previously found sample for node {self.name}')
+        return distribution.log_density(state[self.slot], distribution.get_state_params(state))
 
-        log_likelihood_prev_sample = self.get_prob(var_vals)
+    def get_sample(self, state: List[float], rng: np.random.Generator = None) -> float:
+        if self.conjugate_update is not None:
+            return self.conjugate_update.draw(state, rng)
 
-        for child_node in self.children:
-            log_likelihood_prev_sample += child_node.get_prob(var_vals)
+        prev_sample = state[self.slot]
+
+        # Reuse the log-likelihood of the current value if nothing in the Markov blanket changed since the last step
+        blanket_vals = self._blanket_getter(state) if self._blanket_getter is not None else (prev_sample,)
 
-        candidate_sample = self.distribution.get_candidate_sample(prev_sample, self.candidate_var)
-        new_var_vals = copy(var_vals)
-        new_var_vals[self.name] = candidate_sample
+        if blanket_vals == self._cached_blanket_vals:
+            log_likelihood_prev_sample = self._cached_log_likelihood
 
-        log_likelihood_candidate = self.get_prob(new_var_vals)
+        else:
+            log_likelihood_prev_sample = self.get_state_prob(state)
+
+            for child_node in self.children:
+                log_likelihood_prev_sample += child_node.get_state_prob(state)
+
+        candidate_sample = self.distribution.get_candidate_sample(prev_sample, self.candidate_var, rng)
+
+        if candidate_sample is None:
+            # Proposed outside the support: zero density, so a rejection (counted as one for the proposal tuning)
+            self.n_proposals += 1
+            self.last_accepted = False
+            self._cached_blanket_vals = blanket_vals
+            self._cached_log_likelihood = log_likelihood_prev_sample
+
+            return prev_sample
+
+        # Evaluate the candidate in place (restoring the previous value afterwards) instead of copying the state
+        state[self.slot] = candidate_sample
+
+        log_likelihood_candidate = self.get_state_prob(state)
 
         for child_node in self.children:
-            log_likelihood_candidate += child_node.get_prob(new_var_vals)
+            log_likelihood_candidate += child_node.get_state_prob(state)
+
+        state[self.slot] = prev_sample
 
         r = log_likelihood_candidate - log_likelihood_prev_sample
 
-        use_candidate = np.log(np.random.random()) < r
+        # Without an explicit generator, fall back to the global numpy random state
+        use_candidate = np.log((rng if rng is not None else np.random).random()) < r
+        self.n_proposals += 1
+        self.n_accepted += int(use_candidate)
+        self.last_accepted = use_candidate
+
+        if use_candidate:
+            self._cached_blanket_vals = (candidate_sample,) + blanket_vals[1:]
+            self._cached_log_likelihood = log_likelihood_candidate
+
+        else:
+            self._cached_blanket_vals = blanket_vals
+            self._cached_log_likelihood = log_likelihood_prev_sample
 
         return candidate_sample if use_candidate else prev_sample
 
@@ -62,29 +158,62 @@ class BayesNetBinaryNode(BayesNetNode):
     def get_prob(self, var_vals: Dict[str, float]) -> float:
         return self.distribution.get_likelihood(self.name, var_vals)
 
-    def get_sample(self, var_vals: Dict[str, float]) -> float:
+    def get_state_prob(self, state: List[float]) -> float:
+        distribution = self.distribution
+
+        return distribution.log_density(state[self.slot], distribution.get_state_params(state))
+
+    def get_sample(self, state: List[float], rng: np.random.Generator = None) -> float:
         probs_array = []
+        prev_val = state[self.slot]
 
         for val in self.possible_vals:
-            new_var_vals = copy(var_vals)
-            new_var_vals[self.name] = val
-            prob = self.get_prob(new_var_vals)
+            state[self.slot] = val
+            prob = self.get_state_prob(state)
 
             for child_node in self.children:
-                prob += child_node.get_prob(new_var_vals)
+                prob += child_node.get_state_prob(state)
 
             probs_array.append(np.exp(prob))
 
+        state[self.slot] = prev_val
+
         probs_array = [prob / sum(probs_array) for prob in probs_array]
-        new_sample = np.random.choice(self.possible_vals, p=probs_array)
+        new_sample = (rng if rng is not None else np.random).choice(self.possible_vals, p=probs_array)
 
         return new_sample
 
 
+class BayesNetPlateNode(BayesNetNode):
+    is_plate = True
+
+    def __init__(self, name: str, distribution: Distribution, observations) -> None:
+        # A whole array of i.i.d. observed values sharing one distribution (e.g. every plate appearance of a batter);
+        # replaces one observed node per value with a single vectorized log-likelihood
+        BayesNetNode.__init__(self, name, 0.0)
+        self.distribution = distribution
+        self.observations = np.asarray(observations, dtype=float)
+
+    def get_prob(self, var_vals: Dict[str, float]) -> float:
+        return self.distribution.get_likelihood_sum(self.observations, var_vals)
+
+    def get_state_prob(self, state: List[float]) -> float:
+        distribution = self.distribution
+
+        return np.sum(distribution.log_density(self.observations, distribution.get_state_params(state)))
+
+    def get_sample(self, state: List[float], rng: np.random.Generator = None) -> np.ndarray:
+        return self.observations
+
+
 class BayesNet:
     def __init__(self) -> None:
         self.nodes = {}
 
+        # Flat state layout from the last compile: a slot per sampled node, followed by the constant parameters
+        self.slots = {}
+        self.constants = []
+
     def add_node(self, new_node: BayesNetNode) -> None:
         if new_node.name in self.nodes:
             raise Exception('Cannot add existing node to the network')
@@ -98,20 +227,75 @@ class BayesNet:
         self.nodes[parent_node_name].children.append(self.nodes[child_node_name])
         self.nodes[child_node_name].parents.append(self.nodes[parent_node_name])
 
+        # Markov blankets changed, so any cached log-likelihoods are stale
+        for node in self.nodes.values():
+            if isinstance(node, BayesNetContinuousNode):
+                node.reset_cache()
+
     def get_node_names(self):
         return list(self.nodes.keys())
 
-    def run_simulation(self, var_vals: Dict[str, object], observed_vals: Dict[str, object]) -> Dict[str, object]:
-        # Iterate through the network and use markov blanket combined with the previously-sampled values and any
-        # observed values to generate new samples
-        sampled_vals = copy(var_vals)
+    def get_sampled_node_names(self) -> List[str]:
+        # Every node that has a value in var_vals (i.e. everything except plate nodes)
+        return [node_name for node_name, node in self.nodes.items() if not node.is_plate]
+
+    def make_schedule(self, observed_vals: Dict[str, object], conjugate_updates: bool = False) -> List[BayesNetNode]:
+        # The nodes that actually need sampling, in network order; observed and plate nodes are never visited during a
+        # sweep. The latent nodes' cached log-likelihoods are reset here, keyed only on blanket values that can change,
+        # and the network is (re)compiled for the flat state the sweeps work on. With conjugate_updates, latent nodes
+        # whose prior is conjugate to all of their children get exact Gibbs draws instead of Metropolis steps
+        schedule = [node for node_name, node in self.nodes.items()
+                    if not node.is_plate and node_name not in observed_vals]
+
+        for node in schedule:
+            if isinstance(node, BayesNetContinuousNode):
+                node.reset_cache(observed_vals.keys())
+
+        self.compile()
+
+        for node in schedule:
+            if isinstance(node, BayesNetContinuousNode):
+                node.conjugate_update = find_conjugate_update(node) if conjugate_updates else None
+
+        return schedule
+
+    def compile(self) -> None:
+        # Resolve every parameter reference to an integer slot in a flat state list (sampled nodes first, in network
+        # order, then the constant parameters), so a likelihood evaluation is a few list reads instead of type checks
+        # and string-keyed dict lookups
+        self.slots = {node_name: i for i, node_name in enumerate(self.get_sampled_node_names())}
+        self.constants = []
+
+        def add_constant(val: object) -> int:
+            self.constants.append(val)
+
+            return len(self.slots) + len(self.constants) - 1
+
+        for node in self.nodes.values():
+            node.bind(self.slots, add_constant)
+
+    def make_state(self, var_vals: Dict[str, object]) -> List[object]:
+        return [var_vals[node_name] for node_name in self.slots] + self.constants
+
+    def run_sweep(self, state: List[object], schedule: List[BayesNetNode],
+                  rng: np.random.Generator = None) -> List[object]:
+        # One pass over the latent nodes of a compiled network (see make_schedule and make_state); state is updated in
+        # place
+        for node in schedule:
+            state[node.slot] = node.get_sample(state, rng)
 
-        for node_name, node in self.nodes.items():
-            if node_name in observed_vals:
-                sampled_vals[node_name] = observed_vals[node_name]
+        return state
 
-            else:
-                sampled_vals[node_name] = node.get_sample(sampled_vals)
+    def run_simulation(self, var_vals: Dict[str, object], observed_vals: Dict[str, object],
+                       rng: np.random.Generator = None, schedule: List[BayesNetNode] = None) -> Dict[str, object]:
+        # Iterate through the latent nodes and use markov blanket combined with the previously-sampled values and any
+        # observed values to generate new samples; var_vals is updated in place. Callers running many sweeps should
+        # use make_schedule, make_state and run_sweep instead, which skip the conversion to and from the flat state
+        if schedule is None:
+            var_vals.update(observed_vals)
+            schedule = self.make_schedule(observed_vals)
 
-        return sampled_vals
+        state = self.run_sweep(self.make_state(var_vals), schedule, rng)
+        var_vals.update(StateView(self.slots, state))
 
+        return var_vals
@@ -0,0 +1,60 @@
+import json
+import numpy as np
+import os
+from typing import Dict
+
+
+def _split_arrays(obj, arrays: Dict[str, np.ndarray]):
+    # Replace every numpy array in a nested dict/list by a reference, so the arrays can be stored in binary form and
+    # everything else as JSON
+    if isinstance(obj, np.ndarray):
+        key = f'array_{len(arrays)}'
+        arrays[key] = obj
+
+        return {'__array__': key}
+
+    if isinstance(obj, dict):
+        return {key: _split_arrays(val, arrays) for key, val in obj.items()}
+
+    if isinstance(obj, (list, tuple)):
+        return [_split_arrays(val, arrays) for val in obj]
+
+    if isinstance(obj, np.generic):
+        return obj.item()
+
+    return obj
+
+
+def _join_arrays(obj, arrays: Dict[str, np.ndarray]):
+    if isinstance(obj, dict):
+        if '__array__' in obj:
+            return arrays[obj['__array__']]
+
+        return {key: _join_arrays(val, arrays) for key, val in obj.items()}
+
+    if isinstance(obj, list):
+        return [_join_arrays(val, arrays) for val in obj]
+
+    return obj
+
+
+def save_checkpoint(path: str, state: dict) -> None:
+    # One .npz file: the arrays (e.g. the samples so far) in binary form plus a JSON document with everything else.
+    # Python floats survive the JSON round trip exactly, so a resumed run continues bit-identically. The file is
+    # written next to the target and then renamed, so a crash mid-write never leaves a corrupt checkpoint behind
+    arrays = {}
+    metadata = json.dumps(_split_arrays(state, arrays))
+    tmp_path = f'{path}.tmp'
+
+    with open(tmp_path, 'wb') as file:
+        np.savez(file, metadata=np.array(metadata), **arrays)
+
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path: str) -> dict:
+    with np.load(path) as data:
+        metadata = json.loads(str(data['metadata']))
+        arrays = {key: data[key] for key in data.files if key != 'metadata'}
+
+    return _join_arrays(metadata, arrays)
@@ -0,0 +1,191 @@
+from distribution import (BernoulliDistribution, BetaDistribution, BinomialDistribution, Distribution,
+                          GammaDistribution, InverseGammaDistribution, NormalDistribution, PoissonDistribution)
+import numpy as np
+from operator import itemgetter
+from typing import List, Tuple
+
+
+class ChildGroup:
+    # Children of a conjugate node that read the same parameter slots (e.g. every observation of a Normal(M, V)), so
+    # their parameters are looked up once per draw; plate observations are concatenated up front
+    def __init__(self, distribution: Distribution, slots: List[int], plates: List[np.ndarray]) -> None:
+        self.get_params = distribution.get_state_params
+        self.slots = slots
+        self._getter = itemgetter(*slots) if len(slots) > 1 else None
+        self.observations = np.concatenate(plates) if len(plates) > 0 else None
+        self.n = len(slots) + (len(self.observations) if self.observations is not None else 0)
+        self.observations_sum = float(np.sum(self.observations)) if self.observations is not None else 0.0
+
+    def get_vals(self, state: List[float]) -> Tuple[float, ...]:
+        # Current values of the non-plate children (observed or latent)
+        return self._getter(state) if self._getter is not None else tuple(state[slot] for slot in self.slots)
+
+    def get_sum(self, state: List[float]) -> float:
+        return sum(self.get_vals(state)) + self.observations_sum
+
+    def get_squared_error(self, state: List[float], mean: float) -> float:
+        squared_error = sum((val - mean) ** 2 for val in self.get_vals(state))
+
+        if self.observations is not None:
+            squared_error += float(np.sum((self.observations - mean) ** 2))
+
+        return squared_error
+
+
+class ConjugateUpdate:
+    # Exact Gibbs draw of a node from its closed-form full conditional, used instead of a Metropolis step when the
+    # node's prior is conjugate to every one of its children (see find_conjugate_update). Subclasses name the prior and
+    # child distributions and the child parameter the node has to be
+    prior_type = None
+    child_type = None
+    param_name = None
+
+    def __init__(self, node) -> None:
+        self.get_prior_params = node.distribution.get_state_params
+        groups = {}
+
+        for child_node in node.children:
+            distribution = child_node.distribution
+            slots, plates = groups.setdefault(distribution.param_slots, (distribution, [], []))[1:]
+
+            if child_node.is_plate:
+                plates.append(child_node.observations)
+
+            else:
+                slots.append(child_node.slot)
+
+        self.groups = [ChildGroup(distribution, slots, plates) for distribution, slots, plates in groups.values()]
+
+    @classmethod
+    def matches(cls, node) -> bool:
+        if type(node.distribution) is not cls.prior_type or len(node.children) == 0:
+            return False
+
+        for child_node in node.children:
+            distribution = child_node.distribution
+
+            if type(distribution) is not cls.child_type or distribution.param_slots is None:
+                return False
+
+            for param_name in distribution.param_names:
+                ref = getattr(distribution, param_name)
+                is_node = isinstance(ref, str) and ref == node.name
+
+                # The node has to be the conjugate parameter, and only that one
+                if is_node != (param_name == cls.param_name):
+                    return False
+
+        return True
+
+    def draw(self, state: List[float], rng: np.random.Generator = None) -> float:
+        pass
+
+
+class BetaBernoulliUpdate(ConjugateUpdate):
+    # Beta(alpha, beta) prior on the success probability: alpha + successes, beta + failures
+    prior_type = BetaDistribution
+    child_type = BernoulliDistribution
+    param_name = 'p'
+
+    def draw(self, state: List[float], rng: np.random.Generator = None) -> float:
+        alpha, bta = self.get_prior_params(state)
+
+        for group in self.groups:
+            successes = group.get_sum(state)
+            alpha += successes
+            bta += group.n - successes
+
+        return _draw_beta(alpha, bta, rng)
+
+
+class BetaBinomialUpdate(BetaBernoulliUpdate):
+    child_type = BinomialDistribution
+
+    def draw(self, state: List[float], rng: np.random.Generator = None) -> float:
+        alpha, bta = self.get_prior_params(state)
+
+        for group in self.groups:
+            n_trials = group.get_params(state)[0]
+            successes = group.get_sum(state)
+            alpha += successes
+            bta += n_trials * group.n - successes
+
+        return _draw_beta(alpha, bta, rng)
+
+
+class GammaPoissonUpdate(ConjugateUpdate):
+    # Gamma(alpha, beta) prior (shape / rate) on the rate: alpha + sum of the counts, beta + number of counts
+    prior_type = GammaDistribution
+    child_type = PoissonDistribution
+    param_name = 'lmbda'
+
+    def draw(self, state: List[float], rng: np.random.Generator = None) -> float:
+        alpha, bta = self.get_prior_params(state)
+
+        for group in self.groups:
+            alpha += group.get_sum(state)
+            bta += group.n
+
+        return (rng if rng is not None else np.random).standard_gamma(alpha) / bta
+
+
+class NormalMeanUpdate(ConjugateUpdate):
+    # Normal prior on the mean of Normal children (known variances): precisions add up, and the posterior mean is the
+    # precision-weighted average of the prior mean and the children
+    prior_type = NormalDistribution
+    child_type = NormalDistribution
+    param_name = 'mean'
+
+    def draw(self, state: List[float], rng: np.random.Generator = None) -> float:
+        prior_mean, prior_var = self.get_prior_params(state)
+        precision, weighted_sum = 1 / prior_var, prior_mean / prior_var
+
+        for group in self.groups:
+            var = group.get_params(state)[1]
+            precision += group.n / var
+            weighted_sum += group.get_sum(state) / var
+
+        z = (rng if rng is not None else np.random).standard_normal()
+
+        return weighted_sum / precision + (1 / precision) ** 0.5 * z
+
+
+class InverseGammaVarianceUpdate(ConjugateUpdate):
+    # InverseGamma(alpha, beta) prior (shape / scale) on the variance of Normal children (known means): alpha + n / 2,
+    # beta + half the squared error
+    prior_type = InverseGammaDistribution
+    child_type = NormalDistribution
+    param_name = 'var'
+
+    def draw(self, state: List[float], rng: np.random.Generator = None) -> float:
+        alpha, bta = self.get_prior_params(state)
+
+        for group in self.groups:
+            mean = group.get_params(state)[0]
+            alpha += group.n / 2
+            bta += group.get_squared_error(state, mean) / 2
+
+        return bta / (rng if rng is not None else np.random).standard_gamma(alpha)
+
+
+CONJUGATE_UPDATES = [BetaBernoulliUpdate, BetaBinomialUpdate, GammaPoissonUpdate, NormalMeanUpdate,
+                     InverseGammaVarianceUpdate]
+
+
+def find_conjugate_update(node) -> ConjugateUpdate:
+    # The exact update for a (bound) latent node, or None if its prior is not conjugate to all of its children, in
+    # which case it keeps its Metropolis step. Children whose other parameters are callables are never matched, since
+    # the callable could depend on the node itself
+    for update_type in CONJUGATE_UPDATES:
+        if update_type.matches(node):
+            return update_type(node)
+
+    return None
+
+
+def _draw_beta(alpha: float, bta: float, rng: np.random.Generator = None) -> float:
+    # Beta draw from two gamma draws (the only draws the random buffer needs to support)
+    x = (rng if rng is not None else np.random).standard_gamma(alpha)
+    y = (rng if rng is not None else np.random).standard_gamma(bta)
+
+    return x / (x + y)
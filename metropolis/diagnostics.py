@@ -0,0 +1,226 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, List
+
+
+def autocovariance(x: np.ndarray) -> np.ndarray:
+    # Autocovariance at every lag via FFT (zero-padded to avoid circular wrap-around)
+    x = np.asarray(x, dtype=float)
+    n = len(x)
+    n_fft = 1 << (2 * n - 1).bit_length()
+    centered = x - x.mean()
+    spectrum = np.fft.rfft(centered, n=n_fft)
+
+    return np.fft.irfft(spectrum * np.conjugate(spectrum), n=n_fft)[:n] / n
+
+
+def autocorrelation(x: np.ndarray) -> np.ndarray:
+    acov = autocovariance(x)
+
+    return acov / acov[0] if acov[0] > 0 else np.full(len(acov), np.nan)
+
+
+def _as_chains(draws: np.ndarray) -> np.ndarray:
+    draws = np.asarray(draws, dtype=float)
+
+    return draws.reshape(1, -1) if draws.ndim == 1 else draws
+
+
+def _split_chains(chains: np.ndarray) -> np.ndarray:
+    # Split every chain in half, so within-chain drift shows up as disagreement between the halves
+    half = chains.shape[1] // 2
+
+    return np.vstack([chains[:, :half], chains[:, chains.shape[1] - half:]])
+
+
+def effective_sample_size(draws: np.ndarray) -> float:
+    # Multi-chain ESS (as in Stan): combine the chains' autocorrelations with the between-chain variance, then truncate
+    # the sum with Geyer's initial monotone sequence. draws is (n_chains x n_draws) or a single chain
+    chains = _as_chains(draws)
+    n_chains, n_draws = chains.shape
+
+    if n_draws < 4:
+        return np.nan
+
+    acovs = np.array([autocovariance(chain) for chain in chains])
+    within_var = acovs[:, 0].mean() * n_draws / (n_draws - 1)
+    var_plus = within_var * (n_draws - 1) / n_draws
+
+    if n_chains > 1:
+        var_plus += chains.mean(axis=1).var(ddof=1)
+
+    if var_plus <= 0:
+        return np.nan
+
+    rho = 1 - (within_var - acovs.mean(axis=0)) / var_plus
+    rho[0] = 1.0
+
+    # Sum consecutive pairs of autocorrelations while they stay positive, forcing them to be non-increasing
+    tau = -1.0
+    prev_pair = np.inf
+
+    for t in range(0, n_draws - 1, 2):
+        pair = rho[t] + rho[t + 1]
+
+        if pair <= 0:
+            break
+
+        pair = min(pair, prev_pair)
+        tau += 2 * pair
+        prev_pair = pair
+
+    return n_chains * n_draws / max(tau, 1 / np.log10(n_chains * n_draws))
+
+
+def split_r_hat(draws: np.ndarray) -> float:
+    # Potential scale reduction factor over split chains; values near 1 mean the chains agree
+    chains = _split_chains(_as_chains(draws))
+    n_draws = chains.shape[1]
+
+    if n_draws < 2:
+        return np.nan
+
+    within_var = chains.var(axis=1, ddof=1).mean()
+    between_var = n_draws * chains.mean(axis=1).var(ddof=1)
+
+    if within_var <= 0:
+        return np.nan
+
+    var_plus = (n_draws - 1) / n_draws * within_var + between_var / n_draws
+
+    return float(np.sqrt(var_plus / within_var))
+
+
+def _get_chains(table, column: str) -> np.ndarray:
+    # Sample tables from make_estimate are either one chain or indexed by (chain, draw); a SampleStore from make_store
+    # hands out its (memory-mapped) chains directly
+    if not isinstance(table, pd.DataFrame):
+        return table.get_chains(column)
+
+    if isinstance(table.index, pd.MultiIndex) and 'chain' in table.index.names:
+        chains = [group[column].to_numpy(dtype=float) for _, group in table.groupby(level='chain')]
+        n_draws = min(len(chain) for chain in chains)
+
+        return np.array([chain[:n_draws] for chain in chains])
+
+    return table[column].to_numpy(dtype=float).reshape(1, -1)
+
+
+def summarize(table, columns: List[str] = None) -> pd.DataFrame:
+    # Convergence summary (mean, sd, ESS, Monte Carlo standard error, split R-hat) per column of a sample table (or
+    # per variable of a SampleStore)
+    if columns is None:
+        columns = list(table.columns) if isinstance(table, pd.DataFrame) else list(table.var_names)
+
+    rows = []
+
+    for column in columns:
+        chains = _get_chains(table, column)
+        ess = effective_sample_size(chains)
+        sd = chains.std(ddof=1)
+        rows.append({'mean': chains.mean(), 'sd': sd, 'ess': ess, 'mcse': sd / np.sqrt(ess),
+                     'r_hat': split_r_hat(chains)})
+
+    return pd.DataFrame(rows, index=columns)
+
+
+class BatchMeansESS:
+    # Streaming ESS / MCSE estimate using batch means: keeps at most 2 * n_batches batch sums, doubling the batch size
+    # (by merging neighbouring batches) whenever they fill up, so memory stays constant as samples arrive
+    def __init__(self, n_batches: int = 32) -> None:
+        self.n_batches = n_batches
+        self.batch_size = 1
+        self.batch_sums = []
+        self.current_sum = 0.0
+        self.current_count = 0
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, x: float) -> None:
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+        self.current_sum += x
+        self.current_count += 1
+
+        if self.current_count == self.batch_size:
+            self.batch_sums.append(self.current_sum)
+            self.current_sum, self.current_count = 0.0, 0
+
+            if len(self.batch_sums) == 2 * self.n_batches:
+                self.batch_sums = [self.batch_sums[i] + self.batch_sums[i + 1]
+                                   for i in range(0, len(self.batch_sums), 2)]
+                self.batch_size *= 2
+
+    def get_variance(self) -> float:
+        return self.m2 / (self.n - 1) if self.n > 1 else np.nan
+
+    def get_ess(self) -> float:
+        # Too few batches give a meaningless batch variance
+        if len(self.batch_sums) < self.n_batches:
+            return np.nan
+
+        batch_means = np.array(self.batch_sums) / self.batch_size
+        batch_var = batch_means.var(ddof=1)
+        variance = self.get_variance()
+
+        # A variable that has never moved (zero variance) tells us nothing about mixing: a stuck chain must not look
+        # perfectly efficient, so its ESS (and MCSE) is undefined rather than n
+        if batch_var <= 0 or not variance > 0:
+            return np.nan
+
+        # Var(batch mean) ~ sigma^2 * tau / batch_size, and ESS = n / tau
+        return min(self.n * variance / (self.batch_size * batch_var), float(self.n))
+
+    def get_mcse(self) -> float:
+        ess = self.get_ess()
+
+        return np.sqrt(self.get_variance() / ess) if ess > 0 else np.nan
+
+    def get_state(self) -> dict:
+        return {'batch_size': self.batch_size, 'batch_sums': list(self.batch_sums), 'current_sum': self.current_sum,
+                'current_count': self.current_count, 'n': self.n, 'mean': self.mean, 'm2': self.m2}
+
+    def set_state(self, state: dict) -> None:
+        self.batch_size, self.batch_sums = state['batch_size'], list(state['batch_sums'])
+        self.current_sum, self.current_count = state['current_sum'], state['current_count']
+        self.n, self.mean, self.m2 = state['n'], state['mean'], state['m2']
+
+
+class StreamingDiagnostics:
+    # Accumulator (same update/to_frame interface as the ones in accumulator.py) tracking a running ESS and MCSE for
+    # each variable, so a caller can decide to stop as soon as a target is reached
+    def __init__(self, var_names: List[str], n_batches: int = 32) -> None:
+        self.var_names = list(var_names)
+        self.estimators = {var_name: BatchMeansESS(n_batches) for var_name in self.var_names}
+        self.n_samples = 0
+
+    def update(self, var_vals: Dict[str, float]) -> None:
+        for var_name, estimator in self.estimators.items():
+            estimator.update(var_vals[var_name])
+
+        self.n_samples += 1
+
+    def get_ess(self) -> Dict[str, float]:
+        return {var_name: estimator.get_ess() for var_name, estimator in self.estimators.items()}
+
+    def get_mcse(self) -> Dict[str, float]:
+        return {var_name: estimator.get_mcse() for var_name, estimator in self.estimators.items()}
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame([{'n': estimator.n, 'mean': estimator.mean, 'ess': estimator.get_ess(),
+                              'mcse': estimator.get_mcse()} for estimator in self.estimators.values()],
+                            index=self.var_names)
+
+    def get_state(self) -> dict:
+        return {'n_samples': self.n_samples,
+                'estimators': {var_name: estimator.get_state() for var_name, estimator in self.estimators.items()}}
+
+    def set_state(self, state: dict) -> None:
+        self.n_samples = state['n_samples']
+
+        for var_name, estimator in self.estimators.items():
+            estimator.set_state(state['estimators'][var_name])
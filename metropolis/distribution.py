@@ -1,13 +1,115 @@
-from scipy.stats import bernoulli, norm
-from typing import Dict
+import math
+from operator import itemgetter
+from scipy.special import digamma, gammaln
+from state_view import StateView
+from typing import Callable, Dict, List
 import numpy as np
 
+LOG_2PI = math.log(2 * math.pi)
+
+
+# Scalar-or-array versions of the special functions: the math module is several times faster than a numpy ufunc call
+# on a single float, which is what a Metropolis step evaluates
+def _log(x):
+    if isinstance(x, np.ndarray):
+        return np.log(x)
+
+    return math.log(x) if x > 0 else (-np.inf if x == 0 else np.nan)
+
+
+def _log1p(x):
+    if isinstance(x, np.ndarray):
+        return np.log1p(x)
+
+    return math.log1p(x) if x > -1 else (-np.inf if x == -1 else np.nan)
+
+
+def _gammaln(x):
+    if isinstance(x, np.ndarray):
+        return gammaln(x)
+
+    return math.lgamma(x) if x > 0 else gammaln(x)
+
+
+class StateParams:
+    # Parameter lookup for distributions with a callable parameter: the callable gets a name-keyed view of the state,
+    # the other parameters are read from their slots (a class rather than a closure so bound networks can be pickled)
+    def __init__(self, refs: List[object], slots: Dict[str, int]) -> None:
+        self.refs = refs
+        self.slots = slots
+
+    def __call__(self, state: List[object]):
+        view = StateView(self.slots, state)
+        params = tuple(ref(view) if callable(ref) else state[ref] for ref in self.refs)
+
+        return params if len(params) > 1 else params[0]
+
 
 class Distribution:
+    # Attributes holding the parameters, in the order get_params returns them
+    param_names = ()
+
+    # Support of a continuous distribution, which picks the unconstrained transform gradient-based samplers use:
+    # 'real', 'positive' (log) or 'unit' (logit); None for discrete distributions
+    support = None
+
     def __init__(self):
-        pass
+        self.get_state_params = None
+        self.param_slots = None
+
+    def bind(self, slots: Dict[str, int], add_constant: Callable[[object], int]) -> None:
+        # Resolve the parameter references once (see BayesNet.compile): node names become their slot in the flat
+        # state and constants get a slot of their own, so get_state_params reads every parameter in a single
+        # itemgetter call instead of redoing the type checks and dict lookups of get_params
+        refs = []
+
+        for param_name in self.param_names:
+            ref = getattr(self, param_name)
+
+            if isinstance(ref, str):
+                if ref not in slots:
+                    raise Exception(f'Parameter {ref} of {type(self).__name__} is not a node in the network')
+
+                refs.append(slots[ref])
+
+            else:
+                refs.append(ref if callable(ref) else add_constant(ref))
+
+        if any(callable(ref) for ref in refs):
+            self.get_state_params = StateParams(refs, slots)
+            self.param_slots = None
+
+        else:
+            # The slots themselves identify distributions that read the same parameters (see conjugate.py)
+            self.get_state_params = itemgetter(*refs)
+            self.param_slots = tuple(refs)
 
     def get_likelihood(self, name: str, var_vals: Dict[str, float]) -> float:
+        our_val = var_vals.get(name, None)
+
+        if our_val is None:
+            raise Exception(f'Could not find sampled value for {name}')
+
+        return float(self.logpdf(our_val, var_vals))
+
+    def get_likelihood_sum(self, our_vals: np.ndarray, var_vals: Dict[str, float]) -> float:
+        # Summed log-likelihood of an array of i.i.d. values, in one vectorized call
+        return float(np.sum(self.logpdf(our_vals, var_vals)))
+
+    def logpdf(self, x, var_vals: Dict[str, float]):
+        # Normalized log-density (log-pmf for discrete distributions) of x, which can be a scalar or an array of any
+        # shape (array in, array out), with the parameters taken from var_vals
+        pass
+
+    def log_density(self, x, params):
+        # Same as logpdf with the parameters already looked up (as returned by get_params / get_state_params). Every
+        # normalizing term that depends on a parameter is kept, so the result is also correct when the parameters are
+        # themselves sampled
+        pass
+
+    def grad_log_density(self, x, params):
+        # Analytic derivatives of log_density: (d/dx, (d/dparam for each parameter)), elementwise for an array x. The
+        # derivative in x is None for discrete distributions
         pass
 
     def in_support(self, sampled_val: float) -> bool:
@@ -16,32 +118,43 @@ class Distribution:
     def get_params(self, var_vals: Dict[str, float]):
         pass
 
-    def get_candidate_sample(self, prev_sample: float, var: float) -> float:
-        candidate_sample = norm.rvs(loc=prev_sample, scale=var ** 0.5)
+    def get_candidate_sample(self, prev_sample: float, var: float, rng: np.random.Generator = None) -> float:
+        # Random walk proposal; rng can also be a RandomBuffer, and without one the global numpy random state is used. A
+        # candidate outside the support has zero density, so None is returned and the caller counts it as a rejection.
+        # var is the proposal variance for every distribution (the discrete ones round the candidate afterwards), so
+        # proposal tuning, which scales candidate_var, moves every proposal's standard deviation at the same rate
+        candidate_sample = prev_sample + var ** 0.5 * (rng if rng is not None else np.random).standard_normal()
 
-        return candidate_sample if self.in_support(candidate_sample) else prev_sample
+        return candidate_sample if self.in_support(candidate_sample) else None
 
 
 class NormalDistribution(Distribution):
+    param_names = ('mean', 'var')
+    support = 'real'
+
     def __init__(self, mean: object, var: object):
         Distribution.__init__(self)
         self.mean = mean
         self.var = var
 
-    def get_likelihood(self, name: str, var_vals: Dict[str, float]) -> float:
-        our_val = var_vals.get(name, None)
-
+    def logpdf(self, x, var_vals: Dict[str, float]):
         mean, var = self.get_params(var_vals)
 
-        if our_val is None:
-            raise Exception(f'Could not find sampled value for {name}')
-
         if mean is None or var is None:
             raise Exception(f'Could not find values for mean and/or variance; mean = {mean}, var = {var}')
 
-        likelihood = -np.log(var ** 0.5) - (0.5 * np.log(2 * np.pi)) - (((our_val - mean) ** 2) / (2 * var))
+        return self.log_density(x, (mean, var))
+
+    def log_density(self, x, params):
+        mean, var = params
+
+        return -0.5 * (LOG_2PI + _log(var)) - (x - mean) ** 2 / (2 * var)
+
+    def grad_log_density(self, x, params):
+        mean, var = params
+        z = (x - mean) / var
 
-        return likelihood
+        return -z, (z, 0.5 * (z ** 2 - 1 / var))
 
     def get_params(self, var_vals: Dict[str, float]):
         if callable(self.mean):
@@ -60,24 +173,32 @@ class NormalDistribution(Distribution):
 
 
 class GammaDistribution(Distribution):
+    param_names = ('alpha', 'beta')
+    support = 'positive'
+
     def __init__(self, alpha: object, bta: object):
         Distribution.__init__(self)
         self.alpha = alpha
         self.beta = bta
 
-    def get_likelihood(self, name: str, var_vals: Dict[str, float]) -> float:
-        our_val = var_vals.get(name, None)
+    def logpdf(self, x, var_vals: Dict[str, float]):
         alpha, bta = self.get_params(var_vals)
 
-        if our_val is None:
-            raise Exception(f'Could not find sampled value for {name}')
-
         if alpha is None or bta is None:
             raise Exception(f'Could not find values for alpha and/or beta; alpha = {alpha}, beta = {bta}')
 
-        likelihood = (alpha - 1) * np.log(our_val) - (bta * our_val)
+        return self.log_density(x, (alpha, bta))
 
-        return likelihood
+    def log_density(self, x, params):
+        # Shape / rate parameterization
+        alpha, bta = params
+
+        return alpha * _log(bta) - _gammaln(alpha) + (alpha - 1) * _log(x) - bta * x
+
+    def grad_log_density(self, x, params):
+        alpha, bta = params
+
+        return (alpha - 1) / x - bta, (_log(bta) - digamma(alpha) + _log(x), alpha / bta - x)
 
     def get_params(self, var_vals: Dict[str, float]):
         if callable(self.alpha):
@@ -95,24 +216,32 @@ class GammaDistribution(Distribution):
 
 
 class InverseGammaDistribution(Distribution):
+    param_names = ('alpha', 'beta')
+    support = 'positive'
+
     def __init__(self, alpha: object, bta: object):
         Distribution.__init__(self)
         self.alpha = alpha
         self.beta = bta
 
-    def get_likelihood(self, name: str, var_vals: Dict[str, float]) -> float:
-        our_val = var_vals.get(name, None)
+    def logpdf(self, x, var_vals: Dict[str, float]):
         alpha, bta = self.get_params(var_vals)
 
-        if our_val is None:
-            raise Exception(f'Could not find sampled value for {name}')
-
         if alpha is None or bta is None:
             raise Exception(f'Could not find values for alpha and/or beta; alpha = {alpha}, beta = {bta}')
 
-        likelihood = -(alpha + 1) * np.log(our_val) - (bta / our_val)
+        return self.log_density(x, (alpha, bta))
+
+    def log_density(self, x, params):
+        # Shape / scale parameterization
+        alpha, bta = params
 
-        return likelihood
+        return alpha * _log(bta) - _gammaln(alpha) - (alpha + 1) * _log(x) - bta / x
+
+    def grad_log_density(self, x, params):
+        alpha, bta = params
+
+        return (bta / x - alpha - 1) / x, (_log(bta) - digamma(alpha) - _log(x), alpha / bta - 1 / x)
 
     def get_params(self, var_vals: Dict[str, float]):
         alpha = self.alpha if not isinstance(self.alpha, str) else var_vals.get(self.alpha, None)
@@ -125,59 +254,75 @@ class InverseGammaDistribution(Distribution):
 
 
 class PoissonDistribution(Distribution):
+    param_names = ('lmbda',)
+
     def __init__(self, lmbda: object):
         Distribution.__init__(self)
         self.lmbda = lmbda
 
-    def get_likelihood(self, name: str, var_vals: Dict[str, float]) -> float:
-        our_val = var_vals.get(name, None)
+    def logpdf(self, x, var_vals: Dict[str, float]):
         lmbda = self.get_params(var_vals)
 
-        if our_val is None:
-            raise Exception(f'Could not find sampled value for {name}')
-
         if lmbda is None:
             raise Exception(f'Could not find value for lambda; lambda = {lmbda}')
 
-        likelihood = -lmbda + np.log(lmbda ** our_val) - np.log(np.math.factorial(our_val))
-        # likelihood = poisson.pmf(our_val, mu=lmbda)
+        return self.log_density(x, lmbda)
+
+    def log_density(self, x, params):
+        # gammaln(x + 1) = log(x!) without ever forming the factorial (or lambda ** x)
+        lmbda = params
+
+        return x * _log(lmbda) - lmbda - _gammaln(x + 1)
 
-        return likelihood
+    def grad_log_density(self, x, params):
+        lmbda = params
+
+        return None, (x / lmbda - 1,)
 
     def get_params(self, var_vals: Dict[str, float]):
         lmbda = self.lmbda if not isinstance(self.lmbda, str) else var_vals.get(self.lmbda, None)
 
         return lmbda
 
-    def get_candidate_sample(self, prev_sample: float, var: float) -> float:
-        candidate_sample = float(round(norm.rvs(loc=prev_sample, scale=var)))
+    def get_candidate_sample(self, prev_sample: float, var: float, rng: np.random.Generator = None) -> float:
+        step = var ** 0.5 * (rng if rng is not None else np.random).standard_normal()
+        candidate_sample = float(round(prev_sample + step))
 
-        return candidate_sample if self.in_support(candidate_sample) else prev_sample
+        return candidate_sample if self.in_support(candidate_sample) else None
 
     def in_support(self, sampled_val: float) -> bool:
         return sampled_val > 0 and sampled_val.is_integer()
 
 
 class BetaDistribution(Distribution):
+    param_names = ('alpha', 'beta')
+    support = 'unit'
+
     def __init__(self, alpha: object, bta: object):
         Distribution.__init__(self)
         self.alpha = alpha
         self.beta = bta
 
-    def get_likelihood(self, name: str, var_vals: Dict[str, float]) -> float:
-        our_val = var_vals.get(name, None)
+    def logpdf(self, x, var_vals: Dict[str, float]):
         alpha, bta = self.get_params(var_vals)
 
-        if our_val is None:
-            raise Exception(f'Could not find sampled value for {name}')
-
         if alpha is None or bta is None:
             raise Exception(f'Could not find values for alpha and/or beta; alpha = {alpha}, beta = {bta}')
 
-        likelihood = (alpha - 1) * np.log(our_val) + (bta - 1) * np.log(1 - our_val)
-        # likelihood = beta.pdf(our_val, a=alpha, b=bta)
+        return self.log_density(x, (alpha, bta))
+
+    def log_density(self, x, params):
+        alpha, bta = params
+
+        return (_gammaln(alpha + bta) - _gammaln(alpha) - _gammaln(bta) + (alpha - 1) * _log(x) +
+                (bta - 1) * _log1p(-x))
+
+    def grad_log_density(self, x, params):
+        alpha, bta = params
+        digamma_sum = digamma(alpha + bta)
 
-        return likelihood
+        return ((alpha - 1) / x - (bta - 1) / (1 - x),
+                (digamma_sum - digamma(alpha) + _log(x), digamma_sum - digamma(bta) + _log1p(-x)))
 
     def get_params(self, var_vals: Dict[str, float]):
         alpha = self.alpha if not isinstance(self.alpha, str) else var_vals.get(self.alpha, None)
@@ -190,63 +335,89 @@ class BetaDistribution(Distribution):
 
 
 class BernoulliDistribution(Distribution):
+    param_names = ('p',)
+
     def __init__(self, p: object):
         Distribution.__init__(self)
         self.p = p
 
-    def get_likelihood(self, name: str, var_vals: Dict[str, float]) -> float:
-        our_val = var_vals.get(name, None)
+    def logpdf(self, x, var_vals: Dict[str, float]):
         p = self.get_params(var_vals)
 
-        if our_val is None:
-            raise Exception(f'Could not find sampled value for {name}')
-
         if p is None:
             raise Exception(f'Could not find value for p; p = {p}')
 
-        elif p == 0:
-            p = 0.00001
+        return self.log_density(x, p)
+
+    @staticmethod
+    def _clamp(p):
+        # A p of exactly 0 or 1 is moved just inside the interval (p can also be an array of per-value parameters)
+        if isinstance(p, np.ndarray):
+            return np.where(p == 0, 0.00001, np.where(p == 1, 0.99999, p))
+
+        if p == 0:
+            return 0.00001
 
         elif p == 1:
-            p = 0.99999
+            return 0.99999
+
+        return p
+
+    def log_density(self, x, params):
+        p = self._clamp(params)
+
+        if isinstance(x, np.ndarray):
+            return np.where(x == 1, _log(p), _log1p(-p))
+
+        return _log(p) if x == 1 else _log1p(-p)
 
-        likelihood = np.log(p) if our_val == 1 else np.log(1 - p)
+    def grad_log_density(self, x, params):
+        # The derivative is that of the clamped p
+        p = self._clamp(params)
 
-        return likelihood
+        return None, (x / p - (1 - x) / (1 - p),)
 
     def get_params(self, var_vals: Dict[str, float]):
         p = self.p if not isinstance(self.p, str) else var_vals.get(self.p, None)
 
         return p
 
-    def get_candidate_sample(self, prev_sample: float, var: float) -> float:
-        candidate_sample = round(norm.rvs(loc=prev_sample, scale=var))
+    def get_candidate_sample(self, prev_sample: float, var: float, rng: np.random.Generator = None) -> float:
+        candidate_sample = round(prev_sample + var ** 0.5 * (rng if rng is not None else np.random).standard_normal())
 
-        return candidate_sample if self.in_support(candidate_sample) else prev_sample
+        return candidate_sample if self.in_support(candidate_sample) else None
 
     def in_support(self, sampled_val: float) -> bool:
         return sampled_val == 0 or sampled_val == 1
 
 
 class BinomialDistribution(Distribution):
+    param_names = ('n', 'p')
+
     def __init__(self, n: object, p: object):
         Distribution.__init__(self)
         self.n = n
         self.p = p
 
-    def get_likelihood(self, name: str, var_vals: Dict[str, float]) -> float:
-        our_val = var_vals.get(name, None)
+    def logpdf(self, x, var_vals: Dict[str, float]):
         n, p = self.get_params(var_vals)
 
-        if our_val is None:
-            raise Exception(f'Could not find sampled value for {name}')
-
         if n is None or p is None:
             raise Exception(f'Could not find values for n and/or p; n = {n}, p = {p}')
 
-        likelihood = bernoulli.pmf(our_val, n=n, p=p)
+        return self.log_density(x, (n, p))
+
+    def log_density(self, x, params):
+        n, p = params
+
+        return (_gammaln(n + 1) - _gammaln(x + 1) - _gammaln(n - x + 1) + x * _log(p) +
+                (n - x) * _log1p(-p))
+
+    def grad_log_density(self, x, params):
+        # The derivative in n is that of the gamma-function extension of the binomial coefficient
+        n, p = params
 
-        return likelihood
+        return None, (digamma(n + 1) - digamma(n - x + 1) + _log1p(-p), x / p - (n - x) / (1 - p))
 
     def get_params(self, var_vals: Dict[str, float]):
         n = self.n if not isinstance(self.n, str) else var_vals.get(self.n, None)
@@ -254,10 +425,11 @@ class BinomialDistribution(Distribution):
 
         return n, p
 
-    def get_candidate_sample(self, prev_sample: float, var: float) -> float:
-        candidate_sample = round(norm.rvs(loc=prev_sample, scale=var))
+    def get_candidate_sample(self, prev_sample: float, var: float, rng: np.random.Generator = None) -> float:
+        step = var ** 0.5 * (rng if rng is not None else np.random).standard_normal()
+        candidate_sample = float(round(prev_sample + step))
 
-        return candidate_sample if self.in_support(candidate_sample) else prev_sample
+        return candidate_sample if self.in_support(candidate_sample) else None
 
     def in_support(self, sampled_val: float) -> bool:
         return sampled_val >= 0 and sampled_val.is_integer()
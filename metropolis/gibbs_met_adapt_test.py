@@ -0,0 +1,73 @@
+from bayes_net import BayesNet, BayesNetContinuousNode
+from diagnostics import summarize
+from distribution import *
+from gibbs_met_sampler import GibbsSampler
+import numpy as np
+
+N_SAMPLES = 5000
+BURN_IN_PERIOD = 500
+
+# Faculty evaluation model with plain Metropolis steps (no conjugate updates), so the proposal scale of the positive
+# variance V is tuned during burn-in. Proposals below zero are rejections: they must not count as acceptances, or the
+# tuning keeps growing the scale while the chain barely moves
+data = [6.39, 6.32, 6.25, 6.24, 6.21, 6.18, 6.17, 6.13, 6.00, 6.00, 5.97, 5.82, 5.81, 5.71, 5.55, 5.50, 5.39, 5.37,
+        5.35, 5.30, 5.27, 4.94, 4.50]
+
+mean_node = BayesNetContinuousNode('M', NormalDistribution(5.0, 1 / 9), 0.2 ** 2)
+var_node = BayesNetContinuousNode('V', InverseGammaDistribution(11.0, 2.5), 0.15 ** 2)
+
+bayes_net = BayesNet()
+bayes_net.add_node(mean_node)
+bayes_net.add_node(var_node)
+
+observed_vals = {}
+
+for i in range(len(data)):
+    name = f'Observation{i + 1}'
+    observed_vals[name] = data[i]
+    bayes_net.add_node(BayesNetContinuousNode(name, NormalDistribution(mean_node.name, var_node.name), 0.15 ** 2))
+    bayes_net.add_edge(mean_node.name, name)
+    bayes_net.add_edge(var_node.name, name)
+
+starting_vals = {mean_node.name: 5.0, var_node.name: 0.3}
+all_consistent = True
+
+for seed in [0, 1]:
+    for adapt in [False, True]:
+        mean_node.candidate_var, var_node.candidate_var = 0.2 ** 2, 0.15 ** 2
+        gibbs = GibbsSampler(bayes_net, N_SAMPLES, BURN_IN_PERIOD, seed=seed, adapt=adapt)
+        simulation_table = gibbs.make_estimate(observed_vals, starting_vals)
+
+        # The reported acceptance rate should be the rate at which the chain actually moves
+        var_samples = simulation_table[var_node.name].to_numpy()
+        move_rate = np.mean(var_samples[1:] != var_samples[:-1])
+        acceptance_rate, candidate_var = gibbs.adaptation_report.loc[(0, var_node.name),
+                                                                     ['acceptance_rate', 'candidate_var']]
+        ess = summarize(simulation_table, [var_node.name]).loc[var_node.name, 'ess']
+        is_consistent = abs(acceptance_rate - move_rate) < 0.05 and candidate_var < 1.0
+
+        all_consistent = all_consistent and is_consistent
+
+        print(f'seed = {seed}, adapt = {adapt}: candidate_var = {candidate_var:.4f}, reported acceptance = '
+              f'{acceptance_rate:.3f}, actual move rate = {move_rate:.3f}, ESS of V = {ess:.0f}')
+
+print(f'\nAcceptance rates match the chain and the tuned scales stay sensible (should be "True"): {all_consistent}')
+
+# candidate_var is a variance for every distribution, discrete ones included (they round the candidate afterwards), so
+# tuning scales every proposal the same way: with candidate_var = 4 the proposal steps should have a standard deviation
+# of about 2 (plus the rounding's 1 / 12 of variance for the discrete ones). Bernoulli only has two values, so its
+# steps say nothing about the scale and it is left out
+rng = np.random.default_rng(0)
+proposal_cases = [('Normal', NormalDistribution(0.0, 1.0), 50.0, 0.0),
+                  ('Gamma', GammaDistribution(2.0, 1.0), 50.0, 0.0),
+                  ('Poisson', PoissonDistribution(50.0), 50.0, 1 / 12),
+                  ('Binomial', BinomialDistribution(100, 0.5), 50.0, 1 / 12)]
+proposals_consistent = True
+
+for name, distribution, prev_sample, rounding_var in proposal_cases:
+    steps = np.array([distribution.get_candidate_sample(prev_sample, 4.0, rng) for _ in range(20000)]) - prev_sample
+    proposals_consistent = proposals_consistent and abs(steps.std() - (4.0 + rounding_var) ** 0.5) < 0.05
+
+    print(f'{name}: proposal step sd with candidate_var = 4 is {steps.std():.3f}')
+
+print(f'Every distribution treats candidate_var as a variance (should be "True"): {proposals_consistent}')
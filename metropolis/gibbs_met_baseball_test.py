@@ -45,7 +45,9 @@ for i in range(n_plate_appearances):
 
 assert len(bayes_net.nodes) == (n_plate_appearances * 2) + 2
 
-gibbs = GibbsSampler(bayes_net, N_SAMPLES, BURN_IN_PERIOD)
+# The Beta prior on B is conjugate to the Bernoulli observations (exact draws); HR has a Poisson prior, so it keeps its
+# Metropolis step
+gibbs = GibbsSampler(bayes_net, N_SAMPLES, BURN_IN_PERIOD, conjugate_updates=True)
 simulation_table = gibbs.make_estimate(observations, {base_node.name: 0.5, home_run_node.name: 0.0})
 
 base_node_samples = simulation_table[base_node.name]
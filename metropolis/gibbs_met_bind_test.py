@@ -0,0 +1,46 @@
+from bayes_net import BayesNet, BayesNetBinaryNode, BayesNetContinuousNode, BayesNetPlateNode
+from distribution import *
+import numpy as np
+
+# A network that uses every kind of parameter reference: constants, node names, and callables (which get a name-keyed
+# view of the state), plus a plate node and a binary node
+hyper_node = BayesNetContinuousNode('H', GammaDistribution(2.0, 1.0), 0.2 ** 2)
+mean_node = BayesNetContinuousNode('M', NormalDistribution(5.0, 'H'), 0.2 ** 2)
+var_node = BayesNetContinuousNode('V', InverseGammaDistribution(11.0, 2.5), 0.15 ** 2)
+rate_node = BayesNetContinuousNode('R', GammaDistribution(lambda var_vals: 1 + var_vals['H'], 'H'), 0.2 ** 2)
+prob_node = BayesNetContinuousNode('P', BetaDistribution(2.0, 3.0), 0.1 ** 2)
+count_node = BayesNetContinuousNode('C', PoissonDistribution('R'), 1.0)
+success_node = BayesNetBinaryNode('S', BernoulliDistribution('P'), 0.2 ** 2)
+trials_node = BayesNetContinuousNode('T', BinomialDistribution(10, 'P'), 1.0)
+observation_node = BayesNetContinuousNode('O', NormalDistribution(lambda var_vals: var_vals['M'] + var_vals['R'], 'V'),
+                                          0.2 ** 2)
+plate_node = BayesNetPlateNode('Plate', NormalDistribution('M', 'V'), [4.5, 5.0, 5.5, 6.0])
+
+bayes_net = BayesNet()
+
+for node in [hyper_node, mean_node, var_node, rate_node, prob_node, count_node, success_node, trials_node,
+             observation_node, plate_node]:
+    bayes_net.add_node(node)
+
+for parent_name, child_name in [('H', 'M'), ('H', 'R'), ('R', 'C'), ('P', 'S'), ('P', 'T'), ('M', 'O'), ('R', 'O'),
+                                ('V', 'O'), ('M', 'Plate'), ('V', 'Plate')]:
+    bayes_net.add_edge(parent_name, child_name)
+
+observed_vals = {'C': 3.0, 'S': 1, 'T': 4.0, 'O': 7.0}
+bayes_net.make_schedule(observed_vals)
+
+# At many random points, every node's flat-state density (bound slots and itemgetters) should equal the dict-based
+# get_prob (the original string-keyed parameter lookups)
+rng = np.random.default_rng(0)
+densities_match = True
+
+for _ in range(200):
+    var_vals = dict(observed_vals, H=rng.gamma(2.0), M=rng.normal(5.0, 1.0), V=1 / rng.gamma(11.0, 1 / 2.5),
+                    R=rng.gamma(3.0), P=rng.beta(2.0, 3.0))
+    state = bayes_net.make_state(var_vals)
+
+    for node in bayes_net.nodes.values():
+        densities_match = densities_match and np.isclose(node.get_state_prob(state), node.get_prob(var_vals))
+
+print(f'Flat-state densities match the dict lookups for every node (should be "True"): {densities_match}')
+
@@ -0,0 +1,75 @@
+from bayes_net import BayesNet, BayesNetContinuousNode
+from distribution import *
+import numpy as np
+
+N_SWEEPS = 2000
+
+# Faculty evaluation model with plain Metropolis steps: M and V are in each other's Markov blanket (through the
+# observations), so every step of one invalidates the other's cached log-likelihood. V's proposals are wide enough to
+# often fall below zero
+data = [6.39, 6.32, 6.25, 6.24, 6.21, 6.18, 6.17, 6.13, 6.00, 6.00, 5.97, 5.82, 5.81, 5.71, 5.55, 5.50, 5.39, 5.37,
+        5.35, 5.30, 5.27, 4.94, 4.50]
+
+mean_node = BayesNetContinuousNode('M', NormalDistribution(5.0, 1 / 9), 0.2 ** 2)
+var_node = BayesNetContinuousNode('V', InverseGammaDistribution(11.0, 2.5), 0.3 ** 2)
+
+bayes_net = BayesNet()
+bayes_net.add_node(mean_node)
+bayes_net.add_node(var_node)
+
+observed_vals = {}
+
+for i in range(len(data)):
+    name = f'Observation{i + 1}'
+    observed_vals[name] = data[i]
+    bayes_net.add_node(BayesNetContinuousNode(name, NormalDistribution(mean_node.name, var_node.name), 0.15 ** 2))
+    bayes_net.add_edge(mean_node.name, name)
+    bayes_net.add_edge(var_node.name, name)
+
+rng = np.random.default_rng(0)
+schedule = bayes_net.make_schedule(observed_vals)
+state = bayes_net.make_state(dict(observed_vals, **{mean_node.name: 5.0, var_node.name: 0.3}))
+
+
+def fresh_log_likelihood(node: BayesNetContinuousNode) -> float:
+    return node.get_state_prob(state) + sum(child_node.get_state_prob(state) for child_node in node.children)
+
+
+# Record whether each proposal fell outside the support (V < 0), so all three kinds of step are known to be covered
+proposals = []
+
+
+def make_recording_proposal(get_candidate_sample):
+    def recording_proposal(prev_sample, var, rng=None):
+        candidate_sample = get_candidate_sample(prev_sample, var, rng)
+        proposals.append(candidate_sample)
+
+        return candidate_sample
+
+    return recording_proposal
+
+
+for node in schedule:
+    node.distribution.get_candidate_sample = make_recording_proposal(node.distribution.get_candidate_sample)
+
+# After every step (accepted, rejected, or proposed outside the support), the cached log-likelihood should equal a
+# fresh computation at the current state, and the cached blanket values should be the current ones
+cache_matches = True
+n_outcomes = {'accepted': 0, 'rejected': 0, 'out of support': 0}
+
+for _ in range(N_SWEEPS):
+    for node in schedule:
+        n_accepted = node.n_accepted
+        state[node.slot] = node.get_sample(state, rng)
+        cache_matches = cache_matches and np.isclose(node._cached_log_likelihood, fresh_log_likelihood(node)) and \
+            node._cached_blanket_vals == node._blanket_getter(state)
+
+        if node.n_accepted > n_accepted:
+            n_outcomes['accepted'] += 1
+
+        else:
+            n_outcomes['rejected' if proposals[-1] is not None else 'out of support'] += 1
+
+print(f'Step outcomes: {n_outcomes}')
+print(f'Cached log-likelihoods match fresh ones after every kind of step (should be "True"): '
+      f'{cache_matches and min(n_outcomes.values()) > 0}')
@@ -0,0 +1,95 @@
+from bayes_net import BayesNet, BayesNetContinuousNode
+from distribution import *
+from gibbs_met_sampler import GibbsSampler
+import numpy as np
+import os
+import tempfile
+
+N_SAMPLES = 3000
+BURN_IN_PERIOD = 700
+CHECKPOINT_EVERY = 250
+
+# Faculty evaluation model on a few observations; every run is interrupted part way (once during burn in and once
+# while sampling), resumed by a fresh sampler from its checkpoints, and compared with the same run left uninterrupted
+data = [6.39, 6.32, 6.25, 6.24, 6.21, 6.18, 6.17, 6.13, 6.00, 6.00, 5.97, 5.82]
+
+mean_node = BayesNetContinuousNode('M', NormalDistribution(5.0, 1 / 9), 0.2 ** 2)
+var_node = BayesNetContinuousNode('V', InverseGammaDistribution(11.0, 2.5), 0.15 ** 2)
+
+bayes_net = BayesNet()
+bayes_net.add_node(mean_node)
+bayes_net.add_node(var_node)
+
+observed_vals = {}
+
+for i in range(len(data)):
+    name = f'Observation{i + 1}'
+    observed_vals[name] = data[i]
+    bayes_net.add_node(BayesNetContinuousNode(name, NormalDistribution(mean_node.name, var_node.name), 0.15 ** 2))
+    bayes_net.add_edge(mean_node.name, name)
+    bayes_net.add_edge(var_node.name, name)
+
+starting_vals = {mean_node.name: 5.0, var_node.name: 0.3}
+
+
+class Preempted(Exception):
+    pass
+
+
+def interrupt_after(n_sweeps: int) -> None:
+    # Stand-in for the process being killed: the network raises once it has run n_sweeps sweeps
+    run_sweep = BayesNet.run_sweep
+    n_done = [0]
+
+    def interrupted_run_sweep(*args, **kwargs):
+        n_done[0] += 1
+
+        if n_done[0] > n_sweeps:
+            raise Preempted()
+
+        return run_sweep(bayes_net, *args, **kwargs)
+
+    bayes_net.run_sweep = interrupted_run_sweep
+
+
+def run(settings: dict, method: str, checkpoint_path: str, interrupt_at: int = None):
+    # Returns the result and the sampler that produced it (the original one, or the one that resumed)
+    if interrupt_at is not None:
+        interrupt_after(interrupt_at)
+
+    np.random.seed(1)
+    gibbs = GibbsSampler(bayes_net, N_SAMPLES, BURN_IN_PERIOD, checkpoint_path=checkpoint_path,
+                         checkpoint_every=CHECKPOINT_EVERY, **settings)
+
+    try:
+        return getattr(gibbs, method)(observed_vals, starting_vals), gibbs
+
+    except Preempted:
+        del bayes_net.run_sweep
+
+    # A new sampler (and a scrambled global random state) picks the run up from the checkpoints
+    np.random.seed(99)
+    gibbs = GibbsSampler(bayes_net, N_SAMPLES, BURN_IN_PERIOD, checkpoint_path=checkpoint_path,
+                         checkpoint_every=CHECKPOINT_EVERY, **settings)
+
+    return gibbs.resume(), gibbs
+
+
+all_identical = True
+
+with tempfile.TemporaryDirectory() as directory:
+    for settings in [{}, {'adapt': True}, {'n_chains': 2, 'seed': 4}, {'conjugate_updates': True, 'seed': 2}]:
+        for method in ['make_estimate', 'make_summary']:
+            expected, expected_gibbs = run(settings, method, os.path.join(directory, 'uninterrupted.npz'))
+
+            for interrupt_at in [400, 1300]:
+                resumed, resumed_gibbs = run(settings, method, os.path.join(directory, 'interrupted.npz'),
+                                             interrupt_at)
+                is_identical = resumed.equals(expected) and \
+                    resumed_gibbs.adaptation_report.equals(expected_gibbs.adaptation_report)
+                all_identical = all_identical and is_identical
+
+                print(f'{settings}, {method}, interrupted after {interrupt_at} sweeps: resumed run is identical = '
+                      f'{is_identical}')
+
+print(f'\nResumed runs are identical to uninterrupted ones (should be "True"): {all_identical}')
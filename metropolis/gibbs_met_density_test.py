@@ -0,0 +1,63 @@
+from distribution import *
+import numpy as np
+from scipy import stats
+
+STEP = 1e-6
+
+# Each distribution with a parameter setting, points in its support, and the matching scipy.stats log-density
+cases = [(NormalDistribution(1.5, 2.0), np.array([-3.0, 0.0, 1.5, 4.2]),
+          lambda x: stats.norm.logpdf(x, loc=1.5, scale=2.0 ** 0.5)),
+         (GammaDistribution(3.0, 2.0), np.array([0.1, 0.8, 1.5, 6.0]),
+          lambda x: stats.gamma.logpdf(x, a=3.0, scale=1 / 2.0)),
+         (InverseGammaDistribution(11.0, 2.5), np.array([0.05, 0.2, 0.3, 1.0]),
+          lambda x: stats.invgamma.logpdf(x, a=11.0, scale=2.5)),
+         (PoissonDistribution(3.5), np.array([0.0, 1.0, 4.0, 12.0]),
+          lambda x: stats.poisson.logpmf(x, mu=3.5)),
+         (BetaDistribution(2.5, 4.0), np.array([0.01, 0.3, 0.5, 0.95]),
+          lambda x: stats.beta.logpdf(x, a=2.5, b=4.0)),
+         (BernoulliDistribution(0.3), np.array([0.0, 1.0]),
+          lambda x: stats.bernoulli.logpmf(x, p=0.3)),
+         (BinomialDistribution(20, 0.35), np.array([0.0, 3.0, 7.0, 20.0]),
+          lambda x: stats.binom.logpmf(x, n=20, p=0.35))]
+
+
+
+def log_density_at(distribution: Distribution, x, param_list: list):
+    return distribution.log_density(x, tuple(param_list) if len(param_list) > 1 else param_list[0])
+
+
+densities_match, gradients_match = True, True
+
+for distribution, xs, scipy_logpdf in cases:
+    name = type(distribution).__name__
+    params = distribution.get_params({})
+
+    # Scalar (math module) and array (numpy) paths, and logpdf through the parameter lookup
+    scalar_densities = np.array([distribution.log_density(float(x), params) for x in xs])
+    density_ok = np.allclose(scalar_densities, scipy_logpdf(xs)) and \
+        np.allclose(distribution.log_density(xs, params), scipy_logpdf(xs)) and \
+        np.allclose(distribution.logpdf(xs, {}), scipy_logpdf(xs))
+
+    # Analytic gradients against central finite differences, in x (continuous distributions only) and in every parameter
+    param_list = list(params) if isinstance(params, tuple) else [params]
+    grad_x, grad_params = distribution.grad_log_density(xs, params)
+    gradient_ok = True
+
+    if grad_x is not None:
+        numeric = (log_density_at(distribution, xs + STEP, param_list) -
+                   log_density_at(distribution, xs - STEP, param_list)) / (2 * STEP)
+        gradient_ok = gradient_ok and np.allclose(grad_x, numeric, rtol=1e-5, atol=1e-5)
+
+    for i, grad_param in enumerate(grad_params):
+        up, down = list(param_list), list(param_list)
+        up[i], down[i] = up[i] + STEP, down[i] - STEP
+        numeric = (log_density_at(distribution, xs, up) - log_density_at(distribution, xs, down)) / (2 * STEP)
+        gradient_ok = gradient_ok and np.allclose(grad_param, numeric, rtol=1e-5, atol=1e-5)
+
+    densities_match = densities_match and density_ok
+    gradients_match = gradients_match and gradient_ok
+
+    print(f'{name}: log-densities match scipy = {density_ok}, gradients match finite differences = {gradient_ok}')
+
+print(f'\nEvery log_density matches scipy.stats (should be "True"): {densities_match}')
+print(f'Every grad_log_density matches finite differences (should be "True"): {gradients_match}')
@@ -0,0 +1,46 @@
+from diagnostics import autocorrelation, BatchMeansESS, effective_sample_size, split_r_hat
+import numpy as np
+
+N_DRAWS = 50000
+N_CHAINS = 4
+RHO = 0.9
+
+# AR(1) chains x_t = rho x_(t - 1) + e_t have known autocorrelations rho^k and a known ESS of n (1 - rho) / (1 + rho)
+rng = np.random.default_rng(0)
+noise = rng.normal(0, 1, size=(N_CHAINS, N_DRAWS))
+chains = np.empty(shape=(N_CHAINS, N_DRAWS))
+chains[:, 0] = noise[:, 0] / (1 - RHO ** 2) ** 0.5
+
+for t in range(1, N_DRAWS):
+    chains[:, t] = RHO * chains[:, t - 1] + noise[:, t]
+
+exact_ess = N_CHAINS * N_DRAWS * (1 - RHO) / (1 + RHO)
+ess = effective_sample_size(chains)
+acf_ok = np.allclose(autocorrelation(chains[0])[:5], RHO ** np.arange(5), atol=0.02)
+
+print(f'AR(1) with rho = {RHO}: exact ESS = {exact_ess:.0f}, estimated ESS = {ess:.0f}')
+print(f'Autocorrelations match rho^k (should be "True"): {acf_ok}')
+print(f'ESS is within 10% of the exact value (should be "True"): {abs(ess / exact_ess - 1) < 0.1}')
+
+# The streaming batch-means estimate of one chain should agree with the batch (autocorrelation) estimate of it
+streaming_ess = BatchMeansESS()
+
+for x in chains[0]:
+    streaming_ess.update(x)
+
+single_chain_ess = effective_sample_size(chains[0])
+
+print(f'\nOne chain: batch ESS = {single_chain_ess:.0f}, streaming ESS = {streaming_ess.get_ess():.0f}')
+print(f'Streaming and batch ESS agree within 25% (should be "True"): '
+      f'{abs(streaming_ess.get_ess() / single_chain_ess - 1) < 0.25}')
+
+# Split R-hat is about 1 for i.i.d. chains from the same distribution, and clearly above 1 when one chain has a
+# different mean (or when a chain drifts, which splitting turns into two halves that disagree)
+iid_chains = rng.normal(0, 1, size=(N_CHAINS, 1000))
+shifted_chains = iid_chains + np.array([0, 0, 0, 2])[:, None]
+drifting_chain = rng.normal(0, 1, size=2000) + np.linspace(0, 2, 2000)
+r_hats = [split_r_hat(iid_chains), split_r_hat(shifted_chains), split_r_hat(drifting_chain)]
+
+print(f'\nSplit R-hat: i.i.d. = {r_hats[0]:.4f}, shifted means = {r_hats[1]:.4f}, drifting chain = {r_hats[2]:.4f}')
+print(f'Split R-hat is about 1 for i.i.d. chains and clearly above 1 otherwise (should be "True"): '
+      f'{abs(r_hats[0] - 1) < 0.01 and r_hats[1] > 1.1 and r_hats[2] > 1.1}')
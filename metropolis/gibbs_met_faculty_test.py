@@ -1,4 +1,5 @@
 from bayes_net import BayesNet, BayesNetContinuousNode
+from diagnostics import summarize
 from distribution import *
 from gibbs_met_sampler import GibbsSampler
 import matplotlib.pyplot as plt
@@ -32,10 +33,14 @@ for i in range(len(data)):
     bayes_net.add_edge(mean_node.name, observed_node.name)
     bayes_net.add_edge(var_node.name, observed_node.name)
 
-gibbs = GibbsSampler(bayes_net, N_SAMPLES, BURN_IN_PERIOD)
+# Both priors are conjugate to the Normal observations, so M and V are drawn exactly from their conditionals
+gibbs = GibbsSampler(bayes_net, N_SAMPLES, BURN_IN_PERIOD, conjugate_updates=True)
 starting_vals = {mean_node.name: 5.0, var_node.name: 0.3}
 simulation_table = gibbs.make_estimate(observed_vals, starting_vals)
 
+# Convergence diagnostics (effective sample size, Monte Carlo standard error, split R-hat)
+print(summarize(simulation_table, [mean_node.name, var_node.name]))
+
 # Graphs
 mean_node_samples = simulation_table[mean_node.name]
 var_node_samples = simulation_table[var_node.name]
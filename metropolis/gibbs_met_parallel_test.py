@@ -0,0 +1,56 @@
+from bayes_net import BayesNet, BayesNetContinuousNode
+from diagnostics import summarize
+from distribution import *
+from gibbs_met_sampler import GibbsSampler
+import time
+
+N_SAMPLES = 5000
+BURN_IN_PERIOD = 500
+N_CHAINS = 4
+SEED = 11
+
+# Normal mean with a known observation variance, so the posterior of M is exactly normal: precisions add up and the
+# posterior mean is the precision-weighted average of the prior mean and the data
+data = [6.39, 6.32, 6.25, 6.24, 6.21, 6.18, 6.17, 6.13, 6.00, 6.00, 5.97, 5.82, 5.81, 5.71, 5.55, 5.50, 5.39, 5.37,
+        5.35, 5.30, 5.27, 4.94, 4.50]
+prior_mean, prior_var, observation_var = 5.0, 1 / 9, 0.25
+
+mean_node = BayesNetContinuousNode('M', NormalDistribution(prior_mean, prior_var), 0.1 ** 2)
+
+bayes_net = BayesNet()
+bayes_net.add_node(mean_node)
+
+observed_vals = {}
+
+for i in range(len(data)):
+    name = f'Observation{i + 1}'
+    observed_vals[name] = data[i]
+    bayes_net.add_node(BayesNetContinuousNode(name, NormalDistribution(mean_node.name, observation_var), 0.15 ** 2))
+    bayes_net.add_edge(mean_node.name, name)
+
+posterior_precision = 1 / prior_var + len(data) / observation_var
+posterior_mean = (prior_mean / prior_var + sum(data) / observation_var) / posterior_precision
+
+# The same seed has to give the same draws whether the chains run in this process or on a pool of workers
+tables = []
+
+for n_workers in [1, N_CHAINS]:
+    gibbs = GibbsSampler(bayes_net, N_SAMPLES, BURN_IN_PERIOD, n_chains=N_CHAINS, n_workers=n_workers, seed=SEED)
+    start_time = time.time()
+    tables.append(gibbs.make_estimate(observed_vals, {mean_node.name: 5.0}))
+
+    print(f'{n_workers} worker(s): {time.time() - start_time:.2f}s')
+
+other_seed_table = GibbsSampler(bayes_net, N_SAMPLES, BURN_IN_PERIOD, n_chains=N_CHAINS,
+                                seed=SEED + 1).make_estimate(observed_vals, {mean_node.name: 5.0})
+diagnostics = summarize(tables[0], [mean_node.name])
+samples = tables[0][mean_node.name].to_numpy()
+mcse = diagnostics.loc[mean_node.name, 'mcse']
+agrees = abs(samples.mean() - posterior_mean) < 4 * mcse and abs(samples.std() / posterior_precision ** -0.5 - 1) < 0.1
+
+print(diagnostics)
+print(f'\nPosterior of M: exact mean = {posterior_mean:.4f}, sd = {posterior_precision ** -0.5:.4f}; pooled chains '
+      f'mean = {samples.mean():.4f}, sd = {samples.std():.4f}')
+print(f'Chains are identical with and without worker processes (should be "True"): {tables[0].equals(tables[1])}')
+print(f'A different seed gives different draws (should be "True"): {not tables[0].equals(other_seed_table)}')
+print(f'Pooled chains agree with the exact posterior (should be "True"): {agrees}')
@@ -0,0 +1,38 @@
+from bayes_net import BayesNet, BayesNetContinuousNode, BayesNetPlateNode
+from distribution import *
+from gibbs_met_sampler import GibbsSampler
+
+# Same model as gibbs_met_faculty_test.py, but the observations live in a single plate node instead of 23 separate
+# observed nodes
+
+N_SAMPLES = 5000
+BURN_IN_PERIOD = 50
+
+data = [6.39, 6.32, 6.25, 6.24, 6.21, 6.18, 6.17, 6.13, 6.00, 6.00, 5.97, 5.82, 5.81, 5.71, 5.55, 5.50, 5.39, 5.37,
+        5.35, 5.30, 5.27, 4.94, 4.50]
+
+mean_node_mu, mean_node_var = 5.0, 1 / 9
+var_node_alpha, var_node_beta = 11.0, 2.5
+
+mean_node = BayesNetContinuousNode('M', NormalDistribution(mean_node_mu, mean_node_var), 0.2 ** 2)
+var_node = BayesNetContinuousNode('V', InverseGammaDistribution(var_node_alpha, var_node_beta), 0.15 ** 2)
+observations_node = BayesNetPlateNode('Observations', NormalDistribution(mean_node.name, var_node.name), data)
+
+bayes_net = BayesNet()
+bayes_net.add_node(mean_node)
+bayes_net.add_node(var_node)
+bayes_net.add_node(observations_node)
+bayes_net.add_edge(mean_node.name, observations_node.name)
+bayes_net.add_edge(var_node.name, observations_node.name)
+
+# The plate's log-likelihood should match the sum over individual observed nodes
+var_vals = {mean_node.name: 5.5, var_node.name: 0.3}
+individual_sum = sum(NormalDistribution(mean_node.name, var_node.name).get_likelihood('X', {**var_vals, 'X': val})
+                     for val in data)
+print(f'Plate log-likelihood matches the individual nodes (should be "True"): '
+      f'{np.isclose(observations_node.get_prob(var_vals), individual_sum)}')
+
+gibbs = GibbsSampler(bayes_net, N_SAMPLES, BURN_IN_PERIOD)
+summary = gibbs.make_summary({}, {mean_node.name: 5.0, var_node.name: 0.3})
+
+print(summary)
@@ -1,29 +1,253 @@
+from concurrent.futures import ProcessPoolExecutor
 from pandas import DataFrame
-from bayes_net import BayesNet
+from accumulator import SummaryAccumulator, TableAccumulator
+from bayes_net import BayesNet, BayesNetContinuousNode
+from checkpoint import load_checkpoint, save_checkpoint
+from diagnostics import StreamingDiagnostics
+import numpy as np
+import os
 import pandas as pd
-from typing import Dict
+from random_buffer import RandomBuffer
+from sample_store import SampleStore, SampleWriter
+from state_view import StateView
+from typing import Callable, Dict, List, Tuple
+
+
+def _run_chain(sampler: 'GibbsSampler', observed_vals: Dict[str, float], starting_vals, accumulator,
+               seed_seq: np.random.SeedSequence, checkpoint_path: str = None, checkpoint: dict = None):
+    # Module-level so it can be sent to worker processes; each chain gets its own generator, so the draws only depend
+    # on the chain's seed and not on which process ran it
+    adaptation = sampler._run(observed_vals, starting_vals, accumulator, RandomBuffer(np.random.default_rng(seed_seq)),
+                              checkpoint_path, checkpoint)
+
+    return accumulator, adaptation
 
 
 class GibbsSampler:
-    def __init__(self, bayes_net: BayesNet, n_samples: int, burn_in_period: int) -> None:
+    def __init__(self, bayes_net: BayesNet, n_samples: int, burn_in_period: int, n_chains: int = 1,
+                 n_workers: int = 1, seed: int = None, adapt: bool = False, target_acceptance: float = 0.44,
+                 target_ess: float = None, target_mcse: float = None, check_every: int = 1000,
+                 checkpoint_path: str = None, checkpoint_every: int = 1000, conjugate_updates: bool = False) -> None:
         self.bayes_net = bayes_net
         self.n_samples = n_samples
         self.burn_in_period = burn_in_period
+        self.n_chains = n_chains
+        self.n_workers = n_workers
+        self.seed = seed
+        self.adapt = adapt
+        self.target_acceptance = target_acceptance
+
+        # Optional stopping rule: with a target ESS and/or MCSE, n_samples becomes an upper bound and a chain stops at
+        # the first check (every check_every samples) where every latent node meets the targets
+        self.target_ess = target_ess
+        self.target_mcse = target_mcse
+        self.check_every = check_every
+
+        # Optional checkpoints (every checkpoint_every sweeps, and at the end) that resume() can continue from; with
+        # several chains (or a seed) each chain gets its own file, e.g. run_chain0.npz for checkpoint_path run.npz
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+
+        # Exact Gibbs draws for latent nodes whose prior is conjugate to all of their children (e.g. a Beta prior over
+        # Bernoulli observations); every other node keeps its Metropolis step
+        self.conjugate_updates = conjugate_updates
+
+        # Per-node proposal variances and sampling-phase acceptance rates (Metropolis nodes only), and the number of
+        # samples each chain actually drew, from the last run
+        self.adaptation_report = None
+        self.n_samples_used = None
 
     def make_estimate(self, observed_vals: Dict[str, float], starting_vals=None) -> DataFrame:
+        # With several chains (or a seed), the result is indexed by (chain, draw)
+        var_names = self.bayes_net.get_sampled_node_names()
+        accumulators = self._run_chains(observed_vals, starting_vals, lambda chain: TableAccumulator(var_names))
+
+        return self._to_frame(accumulators, 'draw')
+
+    def make_summary(self, observed_vals: Dict[str, float], starting_vals=None,
+                     quantiles: Tuple[float, ...] = (0.025, 0.5, 0.975)) -> DataFrame:
+        # Same run as make_estimate, but only running mean/variance/quantile summaries of the unobserved nodes are
+        # kept, so memory stays constant no matter how many samples are drawn
+        latent_names = [node_name for node_name in self.bayes_net.get_sampled_node_names()
+                        if node_name not in observed_vals]
+        accumulators = self._run_chains(observed_vals, starting_vals,
+                                        lambda chain: SummaryAccumulator(latent_names, quantiles))
+
+        return self._to_frame(accumulators, 'node')
+
+    def make_store(self, observed_vals: Dict[str, float], path: str, starting_vals=None,
+                   chunk_size: int = 4096) -> SampleStore:
+        # Same run as make_estimate, but the draws are written to memory-mapped files under path as they are made, so
+        # the table never has to fit in memory; returns a lazy reader over them
+        store = SampleStore.create(path, self.bayes_net.get_sampled_node_names(), self.n_samples, self.n_chains)
+        writers = self._run_chains(observed_vals, starting_vals, lambda chain: store.get_writer(chain, chunk_size))
+
+        return self._close_store(store, writers)
+
+    def resume(self):
+        # Continue an interrupted make_estimate/make_summary/make_store run from its checkpoints (e.g. in a new process
+        # after a preemption); the sampler must be built with the same network and settings as the original one. The
+        # result is bit-identical to what the uninterrupted run would have returned
+        if self.checkpoint_path is None:
+            raise Exception('Cannot resume without a checkpoint path')
+
+        # Chains that never got to write a checkpoint (e.g. serial chains after the one that was interrupted) simply
+        # start over, which gives the same draws since every chain has its own random stream
+        checkpoints = [load_checkpoint(path) if os.path.exists(path) else None for path in self._get_checkpoint_paths()]
+        available = [checkpoint for checkpoint in checkpoints if checkpoint is not None]
+
+        if len(available) == 0:
+            raise Exception(f'No checkpoint found at {self.checkpoint_path}')
+
+        checkpoint = available[0]
+
+        if checkpoint['node_names'] != self.bayes_net.get_sampled_node_names() or \
+                checkpoint['n_samples'] != self.n_samples or checkpoint['burn_in_period'] != self.burn_in_period:
+            raise Exception('Checkpoint does not match the network or sampler settings')
+
+        observed_vals, starting_vals = checkpoint['observed_vals'], checkpoint['starting_vals']
+        accumulator_info = checkpoint['accumulator']
+        var_names = accumulator_info['var_names']
+
+        if accumulator_info['kind'] == 'table':
+            accumulators = self._run_chains(observed_vals, starting_vals, lambda chain: TableAccumulator(var_names),
+                                            checkpoints)
+
+            return self._to_frame(accumulators, 'draw')
+
+        if accumulator_info['kind'] == 'store':
+            store = SampleStore(accumulator_info['path'])
+            writers = self._run_chains(observed_vals, starting_vals,
+                                       lambda chain: store.get_writer(chain, accumulator_info['chunk_size']),
+                                       checkpoints)
+
+            return self._close_store(store, writers)
+
+        quantiles = tuple(accumulator_info['quantiles'])
+        accumulators = self._run_chains(observed_vals, starting_vals,
+                                        lambda chain: SummaryAccumulator(var_names, quantiles), checkpoints)
+
+        return self._to_frame(accumulators, 'node')
+
+    def _to_frame(self, accumulators: List[object], index_name: str) -> DataFrame:
+        if self.n_chains == 1 and self.seed is None:
+            return accumulators[0].to_frame()
+
+        return pd.concat([accumulator.to_frame() for accumulator in accumulators], keys=range(self.n_chains),
+                         names=['chain', index_name])
+
+    @staticmethod
+    def _close_store(store: SampleStore, writers: List[SampleWriter]) -> SampleStore:
+        for writer in writers:
+            writer.flush()
+
+        store.set_n_samples([writer.n_samples for writer in writers])
+
+        return store
+
+    def _get_checkpoint_paths(self) -> List[str]:
+        if self.n_chains == 1 and self.seed is None:
+            return [self.checkpoint_path]
+
+        if self.checkpoint_path is None:
+            return [None] * self.n_chains
+
+        base, extension = os.path.splitext(self.checkpoint_path)
+
+        return [f'{base}_chain{chain}{extension}' for chain in range(self.n_chains)]
+
+    def _run_chains(self, observed_vals: Dict[str, float], starting_vals, make_accumulator: Callable[[int], object],
+                    checkpoints: List[dict] = None) -> List[object]:
+        # Runs every chain into its own accumulator (built by make_accumulator from the chain number)
+        checkpoint_paths = self._get_checkpoint_paths()
+
+        if checkpoints is None:
+            checkpoints = [None] * len(checkpoint_paths)
+
+            # Checkpoints left over from an earlier run must not be mixed into this one by a later resume
+            for checkpoint_path in checkpoint_paths:
+                if checkpoint_path is not None and os.path.exists(checkpoint_path):
+                    os.remove(checkpoint_path)
+
+        # Default behavior: one chain on the global numpy random state
+        if self.n_chains == 1 and self.seed is None:
+            accumulator = make_accumulator(0)
+            self.adaptation_report = self._run(observed_vals, starting_vals, accumulator, None, checkpoint_paths[0],
+                                               checkpoints[0])
+            self.n_samples_used = accumulator.n_samples
+
+            return [accumulator]
+
+        # Independent, reproducible random streams for each chain, spawned from the root seed
+        seed_seqs = np.random.SeedSequence(self.seed).spawn(self.n_chains)
+        accumulators = [make_accumulator(chain) for chain in range(self.n_chains)]
+        args = [(self, observed_vals, starting_vals, accumulator, seed_seq, checkpoint_path, checkpoint)
+                for accumulator, seed_seq, checkpoint_path, checkpoint
+                in zip(accumulators, seed_seqs, checkpoint_paths, checkpoints)]
+
+        if self.n_workers > 1:
+            # Chains are spread over a process pool (the network must be picklable, e.g. no lambda parameters)
+            with ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+                results = list(executor.map(_run_chain, *zip(*args)))
+
+        else:
+            results = [_run_chain(*chain_args) for chain_args in args]
+
+        accumulators, adaptations = zip(*results)
+        self.adaptation_report = pd.concat(adaptations, keys=range(self.n_chains), names=['chain', 'node'])
+        self.n_samples_used = [accumulator.n_samples for accumulator in accumulators]
+
+        return list(accumulators)
+
+    def _run(self, observed_vals: Dict[str, float], starting_vals, accumulator, rng: RandomBuffer = None,
+             checkpoint_path: str = None, checkpoint: dict = None) -> DataFrame:
         node_names = self.bayes_net.get_node_names()
 
         for observed_var in observed_vals.keys():
             if observed_var not in node_names:
                 raise Exception(f'Observed variable {observed_var} is not in the network')
 
-        table = []
-        var_vals = {}
+        if checkpoint is not None:
+            print(f'RESUMING FROM CHECKPOINT AFTER {checkpoint["iteration"]} ITERATIONS')
+            var_vals = dict(checkpoint['var_vals'])
+
+        else:
+            print('INITIALIZING VALUES')
+            var_vals = self._initialize_vals(observed_vals, starting_vals, rng)
+
+        # Only the latent nodes are visited during a sweep
+        schedule = self.bayes_net.make_schedule(observed_vals, self.conjugate_updates)
+        metropolis_nodes = [node for node in schedule
+                            if isinstance(node, BayesNetContinuousNode) and node.conjugate_update is None]
 
-        print('INITIALIZING VALUES')
+        # Tuning changes the nodes' candidate_var during the run; the originals are put back at the end so repeated
+        # runs (and serial chains) all start from the same proposals
+        original_candidate_vars = {node.name: node.candidate_var for node in metropolis_nodes}
+
+        # Streaming ESS / MCSE of the latent nodes, only tracked when there is a stopping rule
+        stopping = self.target_ess is not None or self.target_mcse is not None
+        diagnostics = StreamingDiagnostics([node.name for node in schedule]) if stopping else None
+
+        try:
+            if checkpoint is not None:
+                self._restore_checkpoint(checkpoint, accumulator, diagnostics, rng, metropolis_nodes)
+
+            return self._run_schedule(var_vals, observed_vals, starting_vals, accumulator, diagnostics, rng, schedule,
+                                      metropolis_nodes, checkpoint_path, checkpoint)
+
+        finally:
+            for node in metropolis_nodes:
+                node.candidate_var = original_candidate_vars[node.name]
+
+    def _initialize_vals(self, observed_vals: Dict[str, float], starting_vals,
+                         rng: RandomBuffer) -> Dict[str, float]:
+        var_vals = {}
 
         for node_name, node in self.bayes_net.nodes.items():
-            if node_name in observed_vals:
+            if node.is_plate:
+                continue
+
+            elif node_name in observed_vals:
                 var_vals[node_name] = observed_vals[node_name]
 
             elif starting_vals is not None and node_name in starting_vals:
@@ -33,43 +257,153 @@ class GibbsSampler:
                 sampled_val = 0.0
 
                 while not node.distribution.in_support(sampled_val):
-                    sampled_val = node.distribution.get_candidate_sample(sampled_val, node.candidate_var)
+                    candidate_sample = node.distribution.get_candidate_sample(sampled_val, node.candidate_var, rng)
+                    sampled_val = candidate_sample if candidate_sample is not None else sampled_val
 
                 var_vals[node_name] = sampled_val
 
-        # Burn in
-        print('STARTING BURN IN')
-        fifths = int(self.burn_in_period / 5)
-        percentage = 20
+        return var_vals
+
+    def _run_schedule(self, var_vals: Dict[str, float], observed_vals: Dict[str, float], starting_vals, accumulator,
+                      diagnostics: StreamingDiagnostics, rng: RandomBuffer, schedule, metropolis_nodes,
+                      checkpoint_path: str, checkpoint: dict) -> DataFrame:
+        # Burn in and sampling run as one sequence of iterations, so a checkpoint can be taken (and resumed) anywhere
+        n_iterations = self.burn_in_period + self.n_samples
+
+        # Sweeps work on the compiled flat state; the view reads it by node name for the accumulators and checkpoints
+        state = self.bayes_net.make_state(var_vals)
+        var_vals = StateView(self.bayes_net.slots, state)
+
+        if checkpoint is None:
+            start_iteration = 0
+
+            for node in metropolis_nodes:
+                node.reset_acceptance()
+
+        else:
+            start_iteration = n_iterations if checkpoint['finished'] else checkpoint['iteration']
+
+        n_done = start_iteration
+
+        for iteration in range(start_iteration, n_iterations):
+            if iteration == 0:
+                print('STARTING BURN IN')
+
+            if iteration == self.burn_in_period:
+                # Proposals are frozen from here on; acceptance rates are reported for the sampling phase only
+                for node in metropolis_nodes:
+                    node.reset_acceptance()
 
-        for burn_in_sample in range(self.burn_in_period):
-            if (burn_in_sample + 1) % fifths == 0:
-                print(f'{percentage}% done')
-                percentage += 20
+                print('BURN IN FINISHED -> STARTING SAMPLING PROCESS')
 
-            sampled_vals = self.bayes_net.run_simulation(var_vals, observed_vals)
-            var_vals = sampled_vals
+            burning_in = iteration < self.burn_in_period
+            step = iteration if burning_in else iteration - self.burn_in_period
+            fifths = max(int((self.burn_in_period if burning_in else self.n_samples) / 5), 1)
 
-        # Actual samples that we store
-        print('BURN IN FINISHED -> STARTING SAMPLING PROCESS')
-        fifths = int(self.n_samples / 5)
-        percentage = 20
+            if (step + 1) % fifths == 0:
+                print(f'{20 * ((step + 1) // fifths)}% done')
 
-        for sample_num in range(self.n_samples):
-            if (sample_num + 1) % fifths == 0:
-                print(f'{percentage}% done')
-                percentage += 20
+            self.bayes_net.run_sweep(state, schedule, rng)
+            n_done = iteration + 1
 
-            sampled_vals = self.bayes_net.run_simulation(var_vals, observed_vals)
-            new_row = [sampled_vals[node_name] for node_name in node_names]
-            table.append(new_row)
-            var_vals = sampled_vals
+            if burning_in:
+                if self.adapt:
+                    self._adapt_proposals(metropolis_nodes, step + 1)
+
+            else:
+                # Actual samples that we store
+                accumulator.update(var_vals)
+
+                if diagnostics is not None:
+                    diagnostics.update(var_vals)
+
+                    if (step + 1) % self.check_every == 0 and self._is_converged(diagnostics):
+                        print(f'STOPPING EARLY AFTER {step + 1} SAMPLES')
+                        break
+
+            if checkpoint_path is not None and n_done % self.checkpoint_every == 0 and n_done < n_iterations:
+                self._save_checkpoint(checkpoint_path, n_done, False, var_vals, observed_vals, starting_vals,
+                                      accumulator, diagnostics, rng, metropolis_nodes)
+
+        if checkpoint_path is not None:
+            self._save_checkpoint(checkpoint_path, n_done, True, var_vals, observed_vals, starting_vals, accumulator,
+                                  diagnostics, rng, metropolis_nodes)
 
         print('SAMPLING COMPLETED')
 
-        table = pd.DataFrame(table, columns=node_names)
-        assert table.shape == (self.n_samples, len(node_names))
+        return DataFrame({'candidate_var': [node.candidate_var for node in metropolis_nodes],
+                          'acceptance_rate': [node.n_accepted / max(node.n_proposals, 1) for node in metropolis_nodes]},
+                         index=pd.Index([node.name for node in metropolis_nodes], name='node'))
+
+    def _save_checkpoint(self, checkpoint_path: str, iteration: int, finished: bool, var_vals: Dict[str, float],
+                         observed_vals: Dict[str, float], starting_vals, accumulator,
+                         diagnostics: StreamingDiagnostics, rng: RandomBuffer, metropolis_nodes) -> None:
+        # Everything the remaining iterations depend on: the chain's current values, the random state, the tuned
+        # proposals and acceptance counters, and whatever the accumulators have gathered so far (the cached
+        # log-likelihoods are recomputed to the same values after a resume, so they are not stored)
+        if isinstance(accumulator, TableAccumulator):
+            accumulator_info = {'kind': 'table'}
+
+        elif isinstance(accumulator, SampleWriter):
+            accumulator_info = {'kind': 'store', 'path': accumulator.path, 'chunk_size': accumulator.chunk_size}
+
+        else:
+            accumulator_info = {'kind': 'summary', 'quantiles': accumulator.quantiles}
+
+        accumulator_info.update(var_names=accumulator.var_names, state=accumulator.get_state())
+        rng_state = rng.get_state() if rng is not None else np.random.get_state(legacy=False)
+
+        save_checkpoint(checkpoint_path, {
+            'iteration': iteration, 'finished': finished, 'n_samples': self.n_samples,
+            'burn_in_period': self.burn_in_period, 'node_names': self.bayes_net.get_sampled_node_names(),
+            'observed_vals': observed_vals, 'starting_vals': starting_vals, 'var_vals': dict(var_vals),
+            'rng_state': rng_state,
+            'nodes': {node.name: {'candidate_var': node.candidate_var, 'n_proposals': node.n_proposals,
+                                  'n_accepted': node.n_accepted, 'last_accepted': node.last_accepted}
+                      for node in metropolis_nodes},
+            'accumulator': accumulator_info,
+            'diagnostics': diagnostics.get_state() if diagnostics is not None else None})
+
+    @staticmethod
+    def _restore_checkpoint(checkpoint: dict, accumulator, diagnostics: StreamingDiagnostics,
+                            rng: RandomBuffer, metropolis_nodes) -> None:
+        if rng is not None:
+            rng.set_state(checkpoint['rng_state'])
+
+        else:
+            np.random.set_state(checkpoint['rng_state'])
+
+        for node in metropolis_nodes:
+            node_state = checkpoint['nodes'][node.name]
+            node.candidate_var = node_state['candidate_var']
+            node.n_proposals, node.n_accepted = node_state['n_proposals'], node_state['n_accepted']
+            node.last_accepted = node_state['last_accepted']
+
+        accumulator.set_state(checkpoint['accumulator']['state'])
+
+        if diagnostics is not None and checkpoint['diagnostics'] is not None:
+            diagnostics.set_state(checkpoint['diagnostics'])
+
+    def _is_converged(self, diagnostics: StreamingDiagnostics) -> bool:
+        # Every monitored node has to have moved before the rule can fire (a node stuck at its starting value has no
+        # ESS or MCSE, and NaN never meets a target)
+        if not all(estimator.get_variance() > 0 for estimator in diagnostics.estimators.values()):
+            return False
+
+        if self.target_ess is not None and not all(ess >= self.target_ess for ess in diagnostics.get_ess().values()):
+            return False
+
+        if self.target_mcse is not None and not all(mcse <= self.target_mcse
+                                                    for mcse in diagnostics.get_mcse().values()):
+            return False
+
+        return True
 
-        return table
+    def _adapt_proposals(self, metropolis_nodes, iteration: int) -> None:
+        # Robbins-Monro on the log proposal standard deviation: grow it after an acceptance, shrink it after a
+        # rejection, with a decaying step size so the scale settles where the acceptance rate hits the target
+        step_size = iteration ** -0.6
 
+        for node in metropolis_nodes:
+            node.candidate_var *= np.exp(2 * step_size * (float(node.last_accepted) - self.target_acceptance))
 
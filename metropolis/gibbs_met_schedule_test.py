@@ -0,0 +1,57 @@
+from bayes_net import BayesNet, BayesNetContinuousNode, BayesNetPlateNode
+from distribution import *
+from gibbs_met_sampler import GibbsSampler
+
+N_SAMPLES = 2000
+BURN_IN_PERIOD = 50
+
+# Faculty evaluation model with half of the observations as observed nodes and the other half in a plate, plus an
+# observed hyperparameter node H for the prior mean of M
+data = [6.39, 6.32, 6.25, 6.24, 6.21, 6.18, 6.17, 6.13, 6.00, 6.00, 5.97, 5.82, 5.81, 5.71, 5.55, 5.50, 5.39, 5.37,
+        5.35, 5.30, 5.27, 4.94, 4.50]
+
+hyper_node = BayesNetContinuousNode('H', NormalDistribution(5.0, 1.0), 0.2 ** 2)
+mean_node = BayesNetContinuousNode('M', NormalDistribution(hyper_node.name, 1 / 9), 0.2 ** 2)
+var_node = BayesNetContinuousNode('V', InverseGammaDistribution(11.0, 2.5), 0.15 ** 2)
+plate_node = BayesNetPlateNode('Plate', NormalDistribution(mean_node.name, var_node.name), data[12:])
+
+bayes_net = BayesNet()
+bayes_net.add_node(hyper_node)
+bayes_net.add_node(mean_node)
+bayes_net.add_node(var_node)
+bayes_net.add_node(plate_node)
+bayes_net.add_edge(hyper_node.name, mean_node.name)
+bayes_net.add_edge(mean_node.name, plate_node.name)
+bayes_net.add_edge(var_node.name, plate_node.name)
+
+observed_vals = {hyper_node.name: 5.0}
+
+for i in range(12):
+    name = f'Observation{i + 1}'
+    observed_vals[name] = data[i]
+    bayes_net.add_node(BayesNetContinuousNode(name, NormalDistribution(mean_node.name, var_node.name), 0.15 ** 2))
+    bayes_net.add_edge(mean_node.name, name)
+    bayes_net.add_edge(var_node.name, name)
+
+# The schedule is exactly the latent nodes: no observed nodes and no plates
+schedule = bayes_net.make_schedule(observed_vals)
+
+print(f'Schedule = {[node.name for node in schedule]}')
+print(f'The schedule holds exactly the latent nodes (should be "True"): '
+      f'{[node.name for node in schedule] == [mean_node.name, var_node.name]}')
+
+
+# Observed nodes must never be sampled: make their get_sample fail, then run the sampler
+def never_called(state, rng=None):
+    raise Exception('An observed node was sampled')
+
+
+for node_name in observed_vals:
+    bayes_net.nodes[node_name].get_sample = never_called
+
+simulation_table = GibbsSampler(bayes_net, N_SAMPLES, BURN_IN_PERIOD, seed=0).make_estimate(
+    observed_vals, {mean_node.name: 5.0, var_node.name: 0.3})
+observed_constant = all((simulation_table[name] == val).all() for name, val in observed_vals.items())
+
+print(f'No observed node is sampled and every draw keeps the observed values (should be "True"): '
+      f'{observed_constant and simulation_table[mean_node.name].nunique() > 1}')
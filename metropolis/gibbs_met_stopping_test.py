@@ -0,0 +1,56 @@
+from bayes_net import BayesNet, BayesNetContinuousNode
+from distribution import *
+from gibbs_met_sampler import GibbsSampler
+import numpy as np
+
+MAX_SAMPLES = 20000
+BURN_IN_PERIOD = 100
+TARGET_ESS = 1000
+
+# Normal mean M with a known observation variance: the posterior is normal with a closed form, and the chain mixes
+# well, so a run with a target ESS should stop well before MAX_SAMPLES with an estimate that agrees with the exact mean
+data = [6.39, 6.32, 6.25, 6.24, 6.21, 6.18, 6.17, 6.13, 6.00, 6.00, 5.97, 5.82, 5.81, 5.71, 5.55, 5.50, 5.39, 5.37,
+        5.35, 5.30, 5.27, 4.94, 4.50]
+prior_mean, prior_var, obs_var = 5.0, 1 / 9, 0.25
+posterior_var = 1 / (1 / prior_var + len(data) / obs_var)
+posterior_mean = posterior_var * (prior_mean / prior_var + sum(data) / obs_var)
+
+
+def make_mean_net() -> tuple:
+    mean_node = BayesNetContinuousNode('M', NormalDistribution(prior_mean, prior_var), 0.2 ** 2)
+    bayes_net = BayesNet()
+    bayes_net.add_node(mean_node)
+    observed_vals = {}
+
+    for i in range(len(data)):
+        name = f'Observation{i + 1}'
+        observed_vals[name] = data[i]
+        bayes_net.add_node(BayesNetContinuousNode(name, NormalDistribution(mean_node.name, obs_var), 0.15 ** 2))
+        bayes_net.add_edge(mean_node.name, name)
+
+    return bayes_net, observed_vals
+
+
+bayes_net, observed_vals = make_mean_net()
+gibbs = GibbsSampler(bayes_net, MAX_SAMPLES, BURN_IN_PERIOD, seed=0, target_ess=TARGET_ESS, check_every=500)
+mean_samples = gibbs.make_estimate(observed_vals, {'M': 5.0})['M'].to_numpy()
+mean_error = abs(mean_samples.mean() - posterior_mean)
+stopped_ok = gibbs.n_samples_used[0] < MAX_SAMPLES and mean_error < 4 * (posterior_var / TARGET_ESS) ** 0.5
+
+print(f'Mixing chain: stopped after {gibbs.n_samples_used[0]} samples, estimate = {mean_samples.mean():.4f}, exact = '
+      f'{posterior_mean:.4f}')
+print(f'A well-mixing run stops early and agrees with the exact posterior (should be "True"): {stopped_ok}\n')
+
+# Add a node that can never move: a Poisson count HR whose proposal steps are so small that they always round back to
+# the current value. A stuck node has no variance, so it must not count as converged, and the run has to go on to
+# MAX_SAMPLES
+home_run_node = BayesNetContinuousNode('HR', PoissonDistribution(3.0), 1e-6)
+bayes_net.add_node(home_run_node)
+
+gibbs = GibbsSampler(bayes_net, MAX_SAMPLES, BURN_IN_PERIOD, seed=0, target_ess=TARGET_ESS, check_every=500)
+simulation_table = gibbs.make_estimate(observed_vals, {'M': 5.0, 'HR': 3.0})
+stuck = simulation_table['HR'].nunique() == 1
+
+print(f'Stuck chain: HR took {simulation_table["HR"].nunique()} value(s), {gibbs.n_samples_used[0]} samples drawn')
+print(f'A run with a node that never moves does not stop early (should be "True"): '
+      f'{stuck and gibbs.n_samples_used[0] == MAX_SAMPLES}')
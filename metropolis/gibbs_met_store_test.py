@@ -0,0 +1,97 @@
+from bayes_net import BayesNet, BayesNetContinuousNode
+from diagnostics import summarize
+from distribution import *
+from gibbs_met_sampler import GibbsSampler
+import numpy as np
+import os
+from sample_store import SampleStore
+import tempfile
+
+N_SAMPLES = 3000
+BURN_IN_PERIOD = 500
+N_CHAINS = 2
+SEED = 5
+
+# Faculty evaluation model: make_store writes the same draws as make_estimate (for the same seed) to memory-mapped
+# files, whether the chains run in this process or on workers, and also when the run is interrupted and resumed
+data = [6.39, 6.32, 6.25, 6.24, 6.21, 6.18, 6.17, 6.13, 6.00, 6.00, 5.97, 5.82]
+
+mean_node = BayesNetContinuousNode('M', NormalDistribution(5.0, 1 / 9), 0.2 ** 2)
+var_node = BayesNetContinuousNode('V', InverseGammaDistribution(11.0, 2.5), 0.15 ** 2)
+
+bayes_net = BayesNet()
+bayes_net.add_node(mean_node)
+bayes_net.add_node(var_node)
+
+observed_vals = {}
+
+for i in range(len(data)):
+    name = f'Observation{i + 1}'
+    observed_vals[name] = data[i]
+    bayes_net.add_node(BayesNetContinuousNode(name, NormalDistribution(mean_node.name, var_node.name), 0.15 ** 2))
+    bayes_net.add_edge(mean_node.name, name)
+    bayes_net.add_edge(var_node.name, name)
+
+starting_vals = {mean_node.name: 5.0, var_node.name: 0.3}
+
+
+class Preempted(Exception):
+    pass
+
+
+def interrupt_after(n_sweeps: int) -> None:
+    # Stand-in for the process being killed: the network raises once it has run n_sweeps sweeps
+    run_sweep = BayesNet.run_sweep
+    n_done = [0]
+
+    def interrupted_run_sweep(*args, **kwargs):
+        n_done[0] += 1
+
+        if n_done[0] > n_sweeps:
+            raise Preempted()
+
+        return run_sweep(bayes_net, *args, **kwargs)
+
+    bayes_net.run_sweep = interrupted_run_sweep
+
+
+simulation_table = GibbsSampler(bayes_net, N_SAMPLES, BURN_IN_PERIOD, n_chains=N_CHAINS,
+                                seed=SEED).make_estimate(observed_vals, starting_vals)
+all_identical = True
+
+with tempfile.TemporaryDirectory() as directory:
+    for n_workers in [1, N_CHAINS]:
+        path = os.path.join(directory, f'store_{n_workers}')
+        GibbsSampler(bayes_net, N_SAMPLES, BURN_IN_PERIOD, n_chains=N_CHAINS, n_workers=n_workers,
+                     seed=SEED).make_store(observed_vals, path, starting_vals, chunk_size=512)
+
+        # Reopened from the path alone, as another process would
+        store = SampleStore(path)
+        is_identical = store.to_frame().equals(simulation_table) and \
+            summarize(store, [mean_node.name, var_node.name]).equals(
+                summarize(simulation_table, [mean_node.name, var_node.name]))
+        all_identical = all_identical and is_identical
+
+        print(f'{n_workers} worker(s): stored draws and their diagnostics are identical = {is_identical}')
+
+    # Interrupted while sampling, then resumed by a new sampler from the checkpoints; the draws already written stay
+    # in the store and the rest are appended
+    path, checkpoint_path = os.path.join(directory, 'resumed_store'), os.path.join(directory, 'run.npz')
+    interrupt_after(BURN_IN_PERIOD + N_SAMPLES // 2)
+
+    try:
+        GibbsSampler(bayes_net, N_SAMPLES, BURN_IN_PERIOD, n_chains=N_CHAINS, seed=SEED,
+                     checkpoint_path=checkpoint_path, checkpoint_every=400).make_store(observed_vals, path,
+                                                                                       starting_vals, chunk_size=512)
+
+    except Preempted:
+        del bayes_net.run_sweep
+
+    GibbsSampler(bayes_net, N_SAMPLES, BURN_IN_PERIOD, n_chains=N_CHAINS, seed=SEED, checkpoint_path=checkpoint_path,
+                 checkpoint_every=400).resume()
+    is_identical = SampleStore(path).to_frame().equals(simulation_table)
+    all_identical = all_identical and is_identical
+
+    print(f'Interrupted and resumed: stored draws are identical = {is_identical}')
+
+print(f'\nStored draws are identical to the in-memory run (should be "True"): {all_identical}')
@@ -0,0 +1,59 @@
+from bayes_net import BayesNet, BayesNetContinuousNode
+from distribution import *
+from gibbs_met_sampler import GibbsSampler
+import numpy as np
+
+N_SAMPLES = 20000
+BURN_IN_PERIOD = 500
+N_CHAINS = 2
+SEED = 3
+
+# Faculty evaluation model: make_summary keeps only running moments and quantile sketches of M and V, so for the same
+# seed its means and variances have to match the full table from make_estimate, and its (approximate) quantiles have to
+# be close to the table's
+data = [6.39, 6.32, 6.25, 6.24, 6.21, 6.18, 6.17, 6.13, 6.00, 6.00, 5.97, 5.82, 5.81, 5.71, 5.55, 5.50, 5.39, 5.37,
+        5.35, 5.30, 5.27, 4.94, 4.50]
+
+mean_node = BayesNetContinuousNode('M', NormalDistribution(5.0, 1 / 9), 0.2 ** 2)
+var_node = BayesNetContinuousNode('V', InverseGammaDistribution(11.0, 2.5), 0.15 ** 2)
+
+bayes_net = BayesNet()
+bayes_net.add_node(mean_node)
+bayes_net.add_node(var_node)
+
+observed_vals = {}
+
+for i in range(len(data)):
+    name = f'Observation{i + 1}'
+    observed_vals[name] = data[i]
+    bayes_net.add_node(BayesNetContinuousNode(name, NormalDistribution(mean_node.name, var_node.name), 0.15 ** 2))
+    bayes_net.add_edge(mean_node.name, name)
+    bayes_net.add_edge(var_node.name, name)
+
+starting_vals = {mean_node.name: 5.0, var_node.name: 0.3}
+gibbs = GibbsSampler(bayes_net, N_SAMPLES, BURN_IN_PERIOD, n_chains=N_CHAINS, seed=SEED)
+simulation_table = gibbs.make_estimate(observed_vals, starting_vals)
+summary = gibbs.make_summary(observed_vals, starting_vals)
+
+print(summary)
+
+moments_match, max_quantile_error = True, 0.0
+
+for chain in range(N_CHAINS):
+    for node_name in [mean_node.name, var_node.name]:
+        samples = simulation_table.loc[chain, node_name].to_numpy()
+        node_summary = summary.loc[(chain, node_name)]
+
+        moments_match = moments_match and node_summary['n'] == len(samples) and \
+            np.isclose(node_summary['mean'], samples.mean()) and np.isclose(node_summary['var'], samples.var(ddof=1))
+
+        for q in [0.025, 0.5, 0.975]:
+            max_quantile_error = max(max_quantile_error,
+                                     abs(node_summary[f'q{q}'] - np.quantile(samples, q)) / samples.std())
+
+print(f'\nStreamed means and variances match the full table (should be "True"): {moments_match}')
+
+# P-square sketches are approximate, and least accurate in the tails of an autocorrelated stream (the same draws
+# shuffled give a much closer estimate), so the quantiles are only expected within half a posterior standard deviation
+print(f'Largest quantile error: {max_quantile_error:.3f} posterior standard deviations; streamed quantiles are close '
+      f'to the full table\'s (should be "True"): {max_quantile_error < 0.5}')
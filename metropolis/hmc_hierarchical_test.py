@@ -0,0 +1,55 @@
+from bayes_net import BayesNet, BayesNetContinuousNode, BayesNetPlateNode
+from diagnostics import summarize
+from distribution import *
+from gibbs_met_sampler import GibbsSampler
+from hmc_sampler import HMCSampler
+import numpy as np
+import time
+
+N_SAMPLES = 2000
+BURN_IN_PERIOD = 500
+N_OBSERVATIONS = 10
+
+# Hierarchical normal model: K group means around a shared mean, with a shared (unknown) spread between groups. The
+# number of latent nodes grows with K; the effective samples per second of both samplers are compared as it does
+rng = np.random.default_rng(0)
+
+
+def make_network(n_groups: int) -> BayesNet:
+    bayes_net = BayesNet()
+    mean_node = BayesNetContinuousNode('Mu', NormalDistribution(0.0, 100.0), 0.3 ** 2)
+    spread_node = BayesNetContinuousNode('Tau', InverseGammaDistribution(3.0, 2.0), 0.3 ** 2)
+    bayes_net.add_node(mean_node)
+    bayes_net.add_node(spread_node)
+
+    for k in range(n_groups):
+        group_node = BayesNetContinuousNode(f'Theta{k + 1}', NormalDistribution(mean_node.name, spread_node.name),
+                                            0.5 ** 2)
+        observations = rng.normal(rng.normal(2.0, 1.0), 1.0, size=N_OBSERVATIONS)
+        observations_node = BayesNetPlateNode(f'Y{k + 1}', NormalDistribution(group_node.name, 1.0), observations)
+        bayes_net.add_node(group_node)
+        bayes_net.add_node(observations_node)
+        bayes_net.add_edge(mean_node.name, group_node.name)
+        bayes_net.add_edge(spread_node.name, group_node.name)
+        bayes_net.add_edge(group_node.name, observations_node.name)
+
+    return bayes_net
+
+
+for n_groups in [4, 16, 64]:
+    bayes_net = make_network(n_groups)
+    latent_names = bayes_net.get_sampled_node_names()
+
+    for sampler in [GibbsSampler(bayes_net, N_SAMPLES, BURN_IN_PERIOD, seed=1, adapt=True),
+                    HMCSampler(bayes_net, N_SAMPLES, BURN_IN_PERIOD, seed=1)]:
+        start_time = time.time()
+        simulation_table = sampler.make_estimate({})
+        elapsed = time.time() - start_time
+        diagnostics = summarize(simulation_table, latent_names)
+
+        print(f'{n_groups} groups, {type(sampler).__name__}: {elapsed:.1f}s, minimum ESS = '
+              f'{diagnostics["ess"].min():.0f}, minimum ESS per second = {diagnostics["ess"].min() / elapsed:.1f}, '
+              f'maximum R-hat = {diagnostics["r_hat"].max():.3f}')
+
+        if isinstance(sampler, HMCSampler):
+            print(sampler.adaptation_report)
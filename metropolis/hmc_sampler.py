@@ -0,0 +1,439 @@
+from accumulator import SummaryAccumulator, TableAccumulator
+from bayes_net import BayesNet, BayesNetContinuousNode
+from distribution import Distribution
+import math
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+from random_buffer import RandomBuffer
+from scipy.special import expit
+from state_view import StateView
+from typing import Callable, Dict, List, Tuple
+
+
+class FactorGroup:
+    # Every log-density term of one distribution type, evaluated in one vectorized call. Each row is a value and its
+    # parameters, given as indices into JointLogDensity.values; a column that is the same for every row (e.g. the
+    # mean of a plate, or everything in a single-row group) is read once as a plain float instead of gathered per row
+    def __init__(self, distribution: Distribution, value_idxs: List[int], param_idxs: List[Tuple[int, ...]],
+                 latent_idxs: Dict[int, int], n_latent: int) -> None:
+        # Any instance will do: log_density only depends on the parameters it is given
+        self.distribution = distribution
+        self.n_latent = n_latent
+        self.columns = []
+
+        for column in np.column_stack([value_idxs, np.array(param_idxs, dtype=int)]).T:
+            self.columns.append(int(column[0]) if np.all(column == column[0]) else column)
+
+        # Where the derivatives of each column (the value, then the parameters) go: None if nothing in it is latent,
+        # otherwise the rows that are and their latent indices (rows is None for a shared column)
+        self.latent_rows = [self._get_latent_rows(idxs, latent_idxs) for idxs in self.columns]
+
+    @staticmethod
+    def _get_latent_rows(idxs, latent_idxs: Dict[int, int]):
+        if isinstance(idxs, int):
+            return (None, latent_idxs[idxs]) if idxs in latent_idxs else None
+
+        rows = np.array([i for i, idx in enumerate(idxs.tolist()) if idx in latent_idxs], dtype=int)
+
+        if len(rows) == 0:
+            return None
+
+        return rows, np.array([latent_idxs[idx] for idx in idxs[rows].tolist()], dtype=int)
+
+    def add_log_prob_and_grad(self, values: np.ndarray, grad: np.ndarray) -> float:
+        # Returns the group's log-density and adds its gradient (in the constrained values) to grad
+        x, *params = [values.item(idxs) if isinstance(idxs, int) else values[idxs] for idxs in self.columns]
+        params = tuple(params) if len(params) > 1 else params[0]
+        log_prob = _total(self.distribution.log_density(x, params))
+
+        if not math.isfinite(log_prob):
+            return log_prob
+
+        grad_x, grad_params = self.distribution.grad_log_density(x, params)
+
+        for grad_column, latent_rows in zip((grad_x,) + grad_params, self.latent_rows):
+            if latent_rows is None:
+                continue
+
+            rows, latent_idx = latent_rows
+
+            if rows is None:
+                grad[latent_idx] += _total(grad_column)
+
+            else:
+                grad += np.bincount(latent_idx, grad_column[rows], minlength=self.n_latent)
+
+        return log_prob
+
+
+class JointLogDensity:
+    # Log-density (and its gradient) of all the latent nodes of a compiled network, as a function of a vector of
+    # unconstrained positions: positive nodes (Gamma / InverseGamma priors) are sampled on the log scale and unit
+    # interval ones (Beta priors) on the logit scale, with the log-Jacobians added in. The compiled state (plus the
+    # plate observations) is kept as one float array, so each distribution type is a single vectorized FactorGroup
+    # no matter how many nodes use it; terms that do not involve any latent node are left out
+    def __init__(self, bayes_net: BayesNet, observed_vals: Dict[str, float], var_vals: Dict[str, float]) -> None:
+        self.bayes_net = bayes_net
+        self.latent_nodes = bayes_net.make_schedule(observed_vals)
+
+        for node in self.latent_nodes:
+            if not isinstance(node, BayesNetContinuousNode) or node.distribution.support is None:
+                raise Exception(f'Node {node.name} is discrete and cannot be sampled with HMC')
+
+        self.latent_slots = np.array([node.slot for node in self.latent_nodes], dtype=int)
+        supports = np.array([node.distribution.support for node in self.latent_nodes])
+        self.positive = np.flatnonzero(supports == 'positive')
+        self.unit = np.flatnonzero(supports == 'unit')
+        self.values, self.groups = self._make_groups(bayes_net.make_state(var_vals))
+
+    def _make_groups(self, state: List[float]) -> Tuple[np.ndarray, List[FactorGroup]]:
+        latent_idxs = {slot: i for i, slot in enumerate(self.latent_slots.tolist())}
+        plate_observations, n_values = [], len(state)
+        rows = {}
+
+        for node in self.bayes_net.nodes.values():
+            involves_latent = node.slot in latent_idxs or any(parent.slot in latent_idxs for parent in node.parents)
+
+            if not involves_latent:
+                continue
+
+            distribution = node.distribution
+
+            if distribution.param_slots is None:
+                raise Exception(f'Node {node.name} has a callable parameter, which HMC cannot differentiate')
+
+            if node.is_plate:
+                # Plate observations go after the state, one row each
+                value_idxs = list(range(n_values, n_values + len(node.observations)))
+                plate_observations.append(node.observations)
+                n_values += len(node.observations)
+
+            else:
+                value_idxs = [node.slot]
+
+            group = rows.setdefault(type(distribution), (distribution, [], []))
+            group[1].extend(value_idxs)
+            group[2].extend([distribution.param_slots] * len(value_idxs))
+
+        values = np.concatenate([np.array(state, dtype=float)] + plate_observations)
+        groups = [FactorGroup(distribution, value_idxs, param_idxs, latent_idxs, len(latent_idxs))
+                  for distribution, value_idxs, param_idxs in rows.values()]
+
+        return values, groups
+
+    def to_unconstrained(self, vals: List[float]) -> np.ndarray:
+        position = np.array(vals, dtype=float)
+        position[self.positive] = np.log(position[self.positive])
+        position[self.unit] = np.log(position[self.unit]) - np.log1p(-position[self.unit])
+
+        return position
+
+    def set_position(self, position: np.ndarray) -> np.ndarray:
+        # Writes the constrained values into values (which StateView can read by node name), and returns them
+        vals = position.copy()
+
+        if len(self.positive) > 0:
+            vals[self.positive] = np.exp(position[self.positive])
+
+        if len(self.unit) > 0:
+            vals[self.unit] = expit(position[self.unit])
+
+        self.values[self.latent_slots] = vals
+
+        return vals
+
+    def log_prob_and_grad(self, position: np.ndarray) -> Tuple[float, np.ndarray]:
+        # Returns -inf (and a zero gradient) outside the support, e.g. when a Beta node rounds to exactly 0 or 1
+        vals = self.set_position(position)
+        log_prob = 0.0
+
+        # Log-Jacobians of the transforms: log(x) = u for the log scale, log(x (1 - x)) for the logit scale
+        if len(self.positive) > 0:
+            log_prob += position[self.positive].sum()
+
+        if len(self.unit) > 0:
+            unit_vals = vals[self.unit]
+            log_prob += (np.log(unit_vals) + np.log1p(-unit_vals)).sum()
+
+        grad = np.zeros(len(vals))
+
+        for group in self.groups:
+            if not math.isfinite(log_prob):
+                return -np.inf, np.zeros(len(vals))
+
+            log_prob += group.add_log_prob_and_grad(self.values, grad)
+
+        if not math.isfinite(log_prob):
+            return -np.inf, np.zeros(len(vals))
+
+        # Chain rule through the transforms, plus the derivatives of the log-Jacobians
+        if len(self.positive) > 0:
+            grad[self.positive] = grad[self.positive] * vals[self.positive] + 1
+
+        if len(self.unit) > 0:
+            grad[self.unit] = grad[self.unit] * unit_vals * (1 - unit_vals) + 1 - 2 * unit_vals
+
+        return float(log_prob), grad
+
+
+class DualAveraging:
+    # Step size adaptation of Hoffman & Gelman (2014): drives the average acceptance probability to the target during
+    # burn in, and the step size used for sampling is the (more stable) iterate average
+    def __init__(self, step_size: float, target_acceptance: float, gamma: float = 0.05, t0: float = 10.0,
+                 kappa: float = 0.75) -> None:
+        self.mu = np.log(10 * step_size)
+        self.target_acceptance = target_acceptance
+        self.gamma = gamma
+        self.t0 = t0
+        self.kappa = kappa
+        self.n = 0
+        self.h_bar = 0.0
+        self.log_step_size_bar = 0.0
+
+    def update(self, accept_prob: float) -> float:
+        self.n += 1
+        weight = 1 / (self.n + self.t0)
+        self.h_bar = (1 - weight) * self.h_bar + weight * (self.target_acceptance - accept_prob)
+        log_step_size = self.mu - self.n ** 0.5 / self.gamma * self.h_bar
+        eta = self.n ** -self.kappa
+        self.log_step_size_bar = eta * log_step_size + (1 - eta) * self.log_step_size_bar
+
+        return float(np.exp(log_step_size))
+
+    def get_step_size(self) -> float:
+        return float(np.exp(self.log_step_size_bar))
+
+
+class HMCSampler:
+    # Hamiltonian Monte Carlo over all the latent (continuous) nodes of a network jointly, with the same make_estimate
+    # / make_summary interface as GibbsSampler. Each iteration integrates a trajectory of n_leapfrog leapfrog steps
+    # on average (the length is randomized so it cannot resonate with the posterior); during burn in the step size is
+    # tuned by dual averaging and, with adapt_mass, a diagonal mass matrix is estimated from the middle of the burn in
+    def __init__(self, bayes_net: BayesNet, n_samples: int, burn_in_period: int, n_leapfrog: int = 16,
+                 step_size: float = 0.1, target_acceptance: float = 0.8, adapt: bool = True, adapt_mass: bool = True,
+                 n_chains: int = 1, seed: int = None, max_energy_error: float = 1000.0) -> None:
+        self.bayes_net = bayes_net
+        self.n_samples = n_samples
+        self.burn_in_period = burn_in_period
+        self.n_leapfrog = n_leapfrog
+        self.step_size = step_size
+        self.target_acceptance = target_acceptance
+        self.adapt = adapt
+        self.adapt_mass = adapt_mass
+        self.n_chains = n_chains
+        self.seed = seed
+
+        # Trajectories whose energy grows by more than this are counted as divergent (and rejected)
+        self.max_energy_error = max_energy_error
+
+        # Tuned step size, sampling-phase acceptance rate and number of divergent trajectories of each chain, from the
+        # last run
+        self.adaptation_report = None
+
+    def make_estimate(self, observed_vals: Dict[str, float], starting_vals=None) -> DataFrame:
+        # With several chains (or a seed), the result is indexed by (chain, draw)
+        var_names = self.bayes_net.get_sampled_node_names()
+        accumulators = self._run_chains(observed_vals, starting_vals, lambda chain: TableAccumulator(var_names))
+
+        return self._to_frame(accumulators, 'draw')
+
+    def make_summary(self, observed_vals: Dict[str, float], starting_vals=None,
+                     quantiles: Tuple[float, ...] = (0.025, 0.5, 0.975)) -> DataFrame:
+        latent_names = [node_name for node_name in self.bayes_net.get_sampled_node_names()
+                        if node_name not in observed_vals]
+        accumulators = self._run_chains(observed_vals, starting_vals,
+                                        lambda chain: SummaryAccumulator(latent_names, quantiles))
+
+        return self._to_frame(accumulators, 'node')
+
+    def _to_frame(self, accumulators: List[object], index_name: str) -> DataFrame:
+        if self.n_chains == 1 and self.seed is None:
+            return accumulators[0].to_frame()
+
+        return pd.concat([accumulator.to_frame() for accumulator in accumulators], keys=range(self.n_chains),
+                         names=['chain', index_name])
+
+    def _run_chains(self, observed_vals: Dict[str, float], starting_vals,
+                    make_accumulator: Callable[[int], object]) -> List[object]:
+        # Default behavior: one chain on the global numpy random state; otherwise every chain gets its own stream,
+        # spawned from the root seed (same scheme as GibbsSampler)
+        for observed_var in observed_vals.keys():
+            if observed_var not in self.bayes_net.nodes:
+                raise Exception(f'Observed variable {observed_var} is not in the network')
+
+        if self.n_chains == 1 and self.seed is None:
+            rngs = [np.random]
+
+        else:
+            rngs = [RandomBuffer(np.random.default_rng(seed_seq))
+                    for seed_seq in np.random.SeedSequence(self.seed).spawn(self.n_chains)]
+
+        accumulators = [make_accumulator(chain) for chain in range(self.n_chains)]
+
+        # Trajectories that leave the support (exp overflowing, logs of 0) are simply rejected, so numpy's warnings
+        # about them are only noise
+        with np.errstate(divide='ignore', over='ignore', invalid='ignore'):
+            reports = [self._run(observed_vals, starting_vals, accumulator, rng)
+                       for accumulator, rng in zip(accumulators, rngs)]
+
+        self.adaptation_report = DataFrame(reports, index=pd.Index(range(self.n_chains), name='chain'))
+
+        return accumulators
+
+    def _run(self, observed_vals: Dict[str, float], starting_vals, accumulator, rng) -> Dict[str, float]:
+        # The latent nodes get placeholder values here; the actual starting point is set by _initialize_position
+        node_names = self.bayes_net.get_sampled_node_names()
+        var_vals = {node_name: observed_vals.get(node_name, 0.0) for node_name in node_names}
+        model = JointLogDensity(self.bayes_net, observed_vals, var_vals)
+
+        print('INITIALIZING VALUES')
+        position, log_prob, grad = self._initialize_position(model, starting_vals, rng)
+        inv_mass = np.ones(len(position))
+        step_size = self.step_size
+
+        if self.adapt:
+            step_size = self._find_step_size(model, position, log_prob, grad, inv_mass, step_size, rng)
+
+        dual_averaging = DualAveraging(step_size, self.target_acceptance)
+
+        # Mass matrix window: the variances of the positions over the middle half of the burn in
+        window_start, window_end = self.burn_in_period // 4, 3 * self.burn_in_period // 4
+        n_window, window_mean, window_m2 = 0, np.zeros(len(position)), np.zeros(len(position))
+        n_accepted, n_divergent = 0, 0
+        var_vals = StateView(self.bayes_net.slots, model.values)
+
+        for iteration in range(self.burn_in_period + self.n_samples):
+            if iteration == 0:
+                print('STARTING BURN IN')
+
+            if iteration == self.burn_in_period:
+                if self.adapt:
+                    step_size = dual_averaging.get_step_size()
+
+                n_accepted, n_divergent = 0, 0
+                print('BURN IN FINISHED -> STARTING SAMPLING PROCESS')
+
+            burning_in = iteration < self.burn_in_period
+            step = iteration if burning_in else iteration - self.burn_in_period
+            fifths = max(int((self.burn_in_period if burning_in else self.n_samples) / 5), 1)
+
+            if (step + 1) % fifths == 0:
+                print(f'{20 * ((step + 1) // fifths)}% done')
+
+            n_steps = 1 + int(rng.random() * (2 * self.n_leapfrog - 1))
+            position, log_prob, grad, accept_prob, accepted, divergent = self._transition(
+                model, position, log_prob, grad, inv_mass, step_size, n_steps, rng)
+            n_accepted += int(accepted)
+            n_divergent += int(divergent)
+
+            if burning_in and self.adapt:
+                step_size = dual_averaging.update(accept_prob)
+
+                if self.adapt_mass and window_start <= iteration < window_end:
+                    # Welford update of the per-coordinate variance
+                    n_window += 1
+                    delta = position - window_mean
+                    window_mean += delta / n_window
+                    window_m2 += delta * (position - window_mean)
+
+                if self.adapt_mass and iteration == window_end - 1 and n_window > 1:
+                    # Shrunk towards a small constant like Stan does, so short windows cannot produce degenerate masses
+                    inv_mass = (n_window / (n_window + 5)) * window_m2 / (n_window - 1) + 1e-3 * (5 / (n_window + 5))
+                    step_size = self._find_step_size(model, position, log_prob, grad, inv_mass, step_size, rng)
+                    dual_averaging = DualAveraging(step_size, self.target_acceptance)
+
+            if not burning_in:
+                # Actual samples that we store
+                model.set_position(position)
+                accumulator.update(var_vals)
+
+        print('SAMPLING COMPLETED')
+
+        return {'step_size': step_size, 'acceptance_rate': n_accepted / max(self.n_samples, 1),
+                'n_divergent': n_divergent}
+
+    def _initialize_position(self, model: JointLogDensity, starting_vals, rng) -> Tuple[np.ndarray, float, np.ndarray]:
+        # Starting values where given; the other latent nodes start uniformly in (-2, 2) on the unconstrained scale,
+        # retried until the log-density is finite
+        given = [starting_vals is not None and node.name in starting_vals for node in model.latent_nodes]
+        # (0.5 is inside every support; those entries are replaced by the random draws anyway)
+        vals = [starting_vals[node.name] if is_given else 0.5 for node, is_given in zip(model.latent_nodes, given)]
+        fixed_position = model.to_unconstrained(vals)
+
+        for _ in range(100):
+            position = np.array([fixed_position[i] if is_given else 4 * rng.random() - 2
+                                 for i, is_given in enumerate(given)])
+            log_prob, grad = model.log_prob_and_grad(position)
+
+            if np.isfinite(log_prob) and np.all(np.isfinite(grad)):
+                return position, log_prob, grad
+
+        raise Exception('Could not find starting values with a finite log-density')
+
+    def _transition(self, model: JointLogDensity, position: np.ndarray, log_prob: float, grad: np.ndarray,
+                    inv_mass: np.ndarray, step_size: float, n_steps: int, rng):
+        momentum = np.array([rng.standard_normal() for _ in range(len(position))]) / np.sqrt(inv_mass)
+        energy = -log_prob + 0.5 * np.sum(inv_mass * momentum ** 2)
+        new_position, new_log_prob, new_grad = self._leapfrog(model, position, momentum, grad, inv_mass, step_size,
+                                                              n_steps)
+
+        if new_position is None:
+            return position, log_prob, grad, 0.0, False, True
+
+        new_position, new_momentum = new_position
+        energy_error = -new_log_prob + 0.5 * np.sum(inv_mass * new_momentum ** 2) - energy
+        divergent = not np.isfinite(energy_error) or energy_error > self.max_energy_error
+        accept_prob = 0.0 if divergent else float(min(1.0, np.exp(-energy_error)))
+
+        if rng.random() < accept_prob:
+            return new_position, new_log_prob, new_grad, accept_prob, True, divergent
+
+        return position, log_prob, grad, accept_prob, False, divergent
+
+    @staticmethod
+    def _leapfrog(model: JointLogDensity, position: np.ndarray, momentum: np.ndarray, grad: np.ndarray,
+                  inv_mass: np.ndarray, step_size: float, n_steps: int):
+        # Returns ((position, momentum), log_prob, grad) at the end of the trajectory, or (None, None, None) if it
+        # left the support (non-finite log-density)
+        momentum = momentum + 0.5 * step_size * grad
+
+        for step in range(n_steps):
+            position = position + step_size * inv_mass * momentum
+            log_prob, grad = model.log_prob_and_grad(position)
+
+            if not np.isfinite(log_prob):
+                return None, None, None
+
+            momentum = momentum + (step_size if step < n_steps - 1 else 0.5 * step_size) * grad
+
+        return (position, momentum), log_prob, grad
+
+    def _find_step_size(self, model: JointLogDensity, position: np.ndarray, log_prob: float, grad: np.ndarray,
+                        inv_mass: np.ndarray, step_size: float, rng) -> float:
+        # Heuristic starting point for dual averaging (Hoffman & Gelman, algorithm 4): keep doubling (or halving) the
+        # step size while a single leapfrog step's acceptance probability stays above (or below) one half
+        direction = None
+
+        for _ in range(50):
+            momentum = np.array([rng.standard_normal() for _ in range(len(position))]) / np.sqrt(inv_mass)
+            energy = -log_prob + 0.5 * np.sum(inv_mass * momentum ** 2)
+            end, new_log_prob, _ = self._leapfrog(model, position, momentum, grad, inv_mass, step_size, 1)
+            energy_error = np.inf if end is None else -new_log_prob + 0.5 * np.sum(inv_mass * end[1] ** 2) - energy
+            accept_prob = float(np.exp(-energy_error)) if np.isfinite(energy_error) else 0.0
+
+            if direction is None:
+                direction = 1 if accept_prob > 0.5 else -1
+
+            if (direction == 1 and accept_prob <= 0.5) or (direction == -1 and accept_prob > 0.5):
+                break
+
+            step_size *= 2.0 ** direction
+
+        model.set_position(position)
+
+        return step_size
+
+
+def _total(x) -> float:
+    return float(x.sum()) if isinstance(x, np.ndarray) else x
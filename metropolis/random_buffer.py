@@ -0,0 +1,55 @@
+from bisect import bisect_right
+import numpy as np
+from typing import List
+
+
+class RandomBuffer:
+    # Hands out standard normal and uniform draws from blocks pre-generated by a np.random.Generator, so each proposal
+    # costs a list lookup instead of a Generator call. It implements the few Generator methods the nodes and
+    # distributions use (standard_normal, random, standard_gamma and choice), so it can be passed anywhere an rng is
+    # expected
+    def __init__(self, rng: np.random.Generator, size: int = 4096) -> None:
+        self.rng = rng
+        self.size = size
+        self.normals, self.normal_idx = [], 0
+        self.uniforms, self.uniform_idx = [], 0
+
+    def standard_normal(self) -> float:
+        if self.normal_idx == len(self.normals):
+            self.normals, self.normal_idx = self.rng.standard_normal(self.size).tolist(), 0
+
+        self.normal_idx += 1
+
+        return self.normals[self.normal_idx - 1]
+
+    def random(self) -> float:
+        if self.uniform_idx == len(self.uniforms):
+            self.uniforms, self.uniform_idx = self.rng.random(self.size).tolist(), 0
+
+        self.uniform_idx += 1
+
+        return self.uniforms[self.uniform_idx - 1]
+
+    def standard_gamma(self, shape: float) -> float:
+        # Not buffered, since the shape changes from one draw to the next (only the exact conjugate draws use it)
+        return float(self.rng.standard_gamma(shape))
+
+    def choice(self, a: List[object], p: List[float]) -> object:
+        # Inverse-CDF draw from a small discrete distribution
+        cdf, total = [], 0.0
+
+        for prob in p:
+            total += prob
+            cdf.append(total)
+
+        return a[min(bisect_right(cdf, self.random() * total), len(a) - 1)]
+
+    def get_state(self) -> dict:
+        # The generator's state plus the draws not handed out yet, so a restored buffer continues the same sequence
+        return {'rng_state': self.rng.bit_generator.state, 'normals': np.array(self.normals[self.normal_idx:]),
+                'uniforms': np.array(self.uniforms[self.uniform_idx:])}
+
+    def set_state(self, state: dict) -> None:
+        self.rng.bit_generator.state = state['rng_state']
+        self.normals, self.normal_idx = np.asarray(state['normals'], dtype=float).tolist(), 0
+        self.uniforms, self.uniform_idx = np.asarray(state['uniforms'], dtype=float).tolist(), 0
@@ -0,0 +1,157 @@
+import json
+import numpy as np
+from numpy.lib.format import open_memmap
+import os
+import pandas as pd
+from typing import Dict, List
+
+
+class SampleStore:
+    # Draws of a run kept on disk instead of in memory: one .npy file per variable holding a (n_chains x capacity)
+    # array, plus a small JSON file with the variable names and how many draws each chain actually made. Opening a
+    # store is lazy; columns are memory-mapped on first access and returned as zero-copy (read-only) views, so they
+    # can be plotted or diagnosed from another process without loading or re-serializing the whole table
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+        with open(os.path.join(path, 'metadata.json')) as file:
+            metadata = json.load(file)
+
+        self.var_names = metadata['var_names']
+        self.capacity = metadata['capacity']
+        self.n_chains = metadata['n_chains']
+        self.dtype = np.dtype(metadata['dtype'])
+        self.n_samples = metadata['n_samples']
+        self._column_arrays = {}
+
+    @staticmethod
+    def create(path: str, var_names: List[str], capacity: int, n_chains: int = 1,
+               dtype: np.dtype = np.float64) -> 'SampleStore':
+        # Preallocate every column file (sparse on most filesystems, so unused capacity costs no disk space)
+        os.makedirs(path, exist_ok=True)
+
+        for i in range(len(var_names)):
+            column = open_memmap(SampleStore._get_column_path(path, i), mode='w+', dtype=dtype,
+                                 shape=(n_chains, capacity))
+            del column
+
+        SampleStore._write_metadata(path, {'var_names': list(var_names), 'capacity': capacity, 'n_chains': n_chains,
+                                           'dtype': np.dtype(dtype).str, 'n_samples': [0] * n_chains})
+
+        return SampleStore(path)
+
+    @staticmethod
+    def _get_column_path(path: str, i: int) -> str:
+        # Files are named by position, so any node name is safe to use
+        return os.path.join(path, f'column_{i}.npy')
+
+    @staticmethod
+    def _write_metadata(path: str, metadata: dict) -> None:
+        tmp_path = os.path.join(path, 'metadata.json.tmp')
+
+        with open(tmp_path, 'w') as file:
+            json.dump(metadata, file)
+
+        os.replace(tmp_path, os.path.join(path, 'metadata.json'))
+
+    def set_n_samples(self, n_samples: List[int]) -> None:
+        # Record how many draws each chain wrote (called once the writers are done)
+        self.n_samples = [int(n) for n in n_samples]
+        self._write_metadata(self.path, {'var_names': self.var_names, 'capacity': self.capacity,
+                                         'n_chains': self.n_chains, 'dtype': self.dtype.str,
+                                         'n_samples': self.n_samples})
+
+    def get_writer(self, chain: int = 0, chunk_size: int = 4096) -> 'SampleWriter':
+        return SampleWriter(self.path, self.var_names, chain, self.capacity, self.dtype, chunk_size)
+
+    def _get_column(self, var_name: str) -> np.ndarray:
+        if var_name not in self._column_arrays:
+            i = self.var_names.index(var_name)
+            self._column_arrays[var_name] = np.load(self._get_column_path(self.path, i), mmap_mode='r')
+
+        return self._column_arrays[var_name]
+
+    def get_chain(self, var_name: str, chain: int = 0) -> np.ndarray:
+        return self._get_column(var_name)[chain, :self.n_samples[chain]]
+
+    def get_chains(self, var_name: str) -> np.ndarray:
+        # (n_chains x n_draws), cut to the shortest chain (chains can stop early at different points)
+        return self._get_column(var_name)[:, :min(self.n_samples)]
+
+    def __getitem__(self, var_name: str) -> np.ndarray:
+        return self.get_chain(var_name) if self.n_chains == 1 else self.get_chains(var_name)
+
+    def to_frame(self) -> pd.DataFrame:
+        # Materializes the table (same layout as GibbsSampler.make_estimate); only for stores that fit in memory
+        frames = [pd.DataFrame({var_name: self.get_chain(var_name, chain) for var_name in self.var_names},
+                               columns=self.var_names) for chain in range(self.n_chains)]
+
+        if self.n_chains == 1:
+            return frames[0]
+
+        return pd.concat(frames, keys=range(self.n_chains), names=['chain', 'draw'])
+
+
+class SampleWriter:
+    # Accumulator (same update/n_samples interface as the ones in accumulator.py) writing one chain of a SampleStore:
+    # draws are gathered in a small row buffer and copied into the memory-mapped columns one chunk at a time
+    def __init__(self, path: str, var_names: List[str], chain: int, capacity: int, dtype: np.dtype,
+                 chunk_size: int = 4096) -> None:
+        self.path = path
+        self.var_names = list(var_names)
+        self.chain = chain
+        self.capacity = capacity
+        self.chunk_size = chunk_size
+        self.buffer = np.empty((chunk_size, len(self.var_names)), dtype=dtype)
+        self.n_buffered = 0
+        self.n_samples = 0
+        self.columns = None
+
+    def update(self, var_vals: Dict[str, float]) -> None:
+        if self.n_samples == self.capacity:
+            raise Exception(f'Sample store {self.path} is full')
+
+        self.buffer[self.n_buffered] = [var_vals[var_name] for var_name in self.var_names]
+        self.n_buffered += 1
+        self.n_samples += 1
+
+        if self.n_buffered == self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.n_buffered == 0:
+            return
+
+        # The column files are opened lazily, so a writer can be created in one process and used in another
+        if self.columns is None:
+            self.columns = [open_memmap(SampleStore._get_column_path(self.path, i), mode='r+')
+                            for i in range(len(self.var_names))]
+
+        start = self.n_samples - self.n_buffered
+
+        for i, column in enumerate(self.columns):
+            column[self.chain, start:self.n_samples] = self.buffer[:self.n_buffered, i]
+
+        self.n_buffered = 0
+
+    def get_state(self) -> dict:
+        # The draws themselves are already on disk, so a checkpoint only needs to know how many there are
+        self.flush()
+
+        for column in self.columns or []:
+            column.flush()
+
+        return {'n_samples': self.n_samples}
+
+    def set_state(self, state: dict) -> None:
+        self.n_buffered = 0
+        self.n_samples = state['n_samples']
+
+    def __getstate__(self) -> dict:
+        # Pending rows are written out before the writer is sent to (or back from) a worker process; the memory maps
+        # themselves are reopened on the other side
+        self.flush()
+        state = dict(self.__dict__)
+        state['columns'] = None
+
+        return state
@@ -0,0 +1,19 @@
+from collections.abc import Mapping
+from typing import Dict, Iterator, List
+
+
+class StateView(Mapping):
+    # Read-only, name-keyed view of a flat state list (see BayesNet.compile), so code written against var_vals dicts
+    # (accumulators, parameter callables) can read a compiled state without copying it
+    def __init__(self, slots: Dict[str, int], state: List[object]) -> None:
+        self.slots = slots
+        self.state = state
+
+    def __getitem__(self, name: str) -> object:
+        return self.state[self.slots[name]]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.slots)
+
+    def __len__(self) -> int:
+        return len(self.slots)